@@ -0,0 +1,30 @@
+"""
+API Routes per gli allarmi
+Allarmi attivi, ultimi eventi e regole caricate
+(gli allarmi attivi arrivano anche sul WebSocket /ws, topic "alerts")
+"""
+
+from fastapi import APIRouter
+
+from alerts import alert_engine
+from shared_state import shared_state
+
+router = APIRouter(prefix="/api/alerts", tags=["alerts"])
+
+
+@router.get("")
+async def get_alerts():
+    """
+    Allarmi attivi, eventi recenti e regole
+
+    Returns:
+        dict: active (per id regola), events (attivazioni e rientri, dal più vecchio),
+              rules (con stato ok/pending/active) e stats del motore
+    """
+    if shared_state.is_follower:
+        return await shared_state.call("alerts")
+    return alert_engine.summary()
+
+
+# Le regole sono valutate solo nell'owner (SHARED_STATE)
+shared_state.register("alerts", get_alerts)
@@ -0,0 +1,300 @@
+"""
+Motore di allarmi sulla telemetria (carburante, serbatoi, batteria...)
+Regole dichiarative con soglia, isteresi e durata minima:
+
+    {"id": "fuel_low", "metric": "fuel_level", "op": "<", "threshold": 15,
+     "clear": 18, "for_seconds": 10, "severity": "warning", "message": "..."}
+
+- metriche: campi di CamperState (fuel_level, black_water, ...) e batteria
+  come nello storico (battery_voltage, battery_temperature, ...)
+- isteresi: l'allarme si attiva oltre `threshold` e rientra solo oltre `clear`
+- durata minima: la condizione deve restare vera per `for_seconds`
+
+Le regole sono compilate una volta: per ogni metrica una lista ordinata dei
+punti di soglia (attivazione e rientro). Quando una metrica cambia da `a` a
+`b` si valutano solo le regole con un punto di soglia tra `a` e `b`: le altre
+non possono cambiare stato. Costo per campione O(log n + regole toccate),
+più le regole in attesa della durata minima.
+
+Gli allarmi attivi sono pubblicati in CamperState.alerts (topic "alerts"
+del WebSocket /ws): un allarme compare una volta all'attivazione e sparisce
+al rientro, senza ripetizioni finché resta attivo.
+Regole aggiuntive da ALERT_RULES_FILE (lista JSON, stesso id = sostituisce).
+"""
+
+import json
+import operator
+import os
+import time
+from bisect import bisect_left, bisect_right
+from collections import deque
+from typing import Callable, Dict, List, Optional
+
+from vehicle_state import CamperState, camper
+
+ALERT_RULES_FILE = os.getenv("ALERT_RULES_FILE")
+
+# Eventi (attivazioni e rientri) conservati per /api/alerts
+EVENT_HISTORY = 200
+
+SEVERITIES = ("info", "warning", "critical")
+
+DEFAULT_RULES = [
+    {"id": "fuel_low", "metric": "fuel_level", "op": "<", "threshold": 15, "clear": 18,
+     "for_seconds": 10, "severity": "warning", "message": "Carburante in riserva"},
+    {"id": "fuel_critical", "metric": "fuel_level", "op": "<", "threshold": 5, "clear": 7,
+     "for_seconds": 10, "severity": "critical", "message": "Carburante quasi esaurito"},
+    {"id": "water_low", "metric": "water_tank", "op": "<", "threshold": 10, "clear": 15,
+     "for_seconds": 30, "severity": "warning", "message": "Acqua potabile in esaurimento"},
+    {"id": "grey_water_full", "metric": "grey_water", "op": ">", "threshold": 90, "clear": 85,
+     "for_seconds": 30, "severity": "warning", "message": "Acque grigie quasi piene"},
+    {"id": "black_water_full", "metric": "black_water", "op": ">", "threshold": 90, "clear": 85,
+     "for_seconds": 30, "severity": "critical", "message": "Serbatoio acque nere pieno"},
+    {"id": "engine_battery_low", "metric": "battery_main", "op": "<", "threshold": 11.8, "clear": 12.2,
+     "for_seconds": 60, "severity": "warning", "message": "Batteria motore scarica"},
+    {"id": "battery_voltage_low", "metric": "battery_voltage", "op": "<", "threshold": 11.8, "clear": 12.4,
+     "for_seconds": 30, "severity": "warning", "message": "Tensione batteria servizi bassa"},
+    {"id": "battery_soc_low", "metric": "battery_soc", "op": "<", "threshold": 20, "clear": 25,
+     "for_seconds": 60, "severity": "warning", "message": "Batteria servizi sotto il 20%"},
+    {"id": "battery_temperature_high", "metric": "battery_temperature", "op": ">", "threshold": 50, "clear": 45,
+     "for_seconds": 10, "severity": "critical", "message": "Temperatura batteria elevata"},
+]
+
+OPERATORS: Dict[str, Callable[[float, float], bool]] = {
+    ">": operator.gt,
+    ">=": operator.ge,
+    "<": operator.lt,
+    "<=": operator.le,
+}
+
+# Operatore di rientro per ogni operatore di attivazione
+CLEAR_OPERATORS = {">": "<=", ">=": "<", "<": ">=", "<=": ">"}
+
+
+class AlertRule:
+    """Regola compilata e suo stato (ok -> pending -> active -> ok)"""
+
+    def __init__(self, id: str, metric: str, op: str, threshold: float,
+                 clear: Optional[float] = None, for_seconds: float = 0.0,
+                 severity: str = "warning", message: str = ""):
+        if op not in OPERATORS:
+            raise ValueError(f"Operatore non valido in {id}: {op}")
+        if severity not in SEVERITIES:
+            raise ValueError(f"Severità non valida in {id}: {severity}")
+
+        self.id = id
+        self.metric = metric
+        self.op = op
+        self.threshold = float(threshold)
+        self.clear = float(threshold if clear is None else clear)
+        self.for_seconds = float(for_seconds)
+        self.severity = severity
+        self.message = message or id
+
+        self.triggered = OPERATORS[op]
+        self.cleared = OPERATORS[CLEAR_OPERATORS[op]]
+
+        self.state = "ok"
+        self.since: Optional[float] = None
+        self.value: Optional[float] = None
+
+    def to_dict(self) -> Dict:
+        return {
+            "id": self.id,
+            "metric": self.metric,
+            "op": self.op,
+            "threshold": self.threshold,
+            "clear": self.clear,
+            "for_seconds": self.for_seconds,
+            "severity": self.severity,
+            "message": self.message,
+            "state": self.state,
+        }
+
+
+class AlertEngine:
+    """Valutazione incrementale delle regole e pubblicazione degli allarmi attivi"""
+
+    def __init__(self, state: CamperState, rules: Optional[List[Dict]] = None):
+        self.state = state
+        self.on_change: Optional[Callable[[], None]] = None
+
+        self.rules: Dict[str, AlertRule] = {}
+        self.boundaries: Dict[str, List[float]] = {}
+        self.boundary_rules: Dict[str, List[AlertRule]] = {}
+        self.by_metric: Dict[str, List[AlertRule]] = {}
+        self.values: Dict[str, float] = {}
+        self.pending: Dict[str, AlertRule] = {}
+        self.events: deque = deque(maxlen=EVENT_HISTORY)
+        self.last_version = 0
+
+        self.evaluations = 0
+        self.raised = 0
+        self.cleared = 0
+
+        self.load(rules if rules is not None else default_rules())
+
+    # ==================== COMPILAZIONE ====================
+
+    def load(self, rules: List[Dict]):
+        """Compila le regole (sostituisce le precedenti, azzera gli allarmi)"""
+        self.rules = {}
+        for rule in rules:
+            compiled = AlertRule(**rule)
+            self.rules[compiled.id] = compiled
+
+        self.by_metric = {}
+        for rule in self.rules.values():
+            self.by_metric.setdefault(rule.metric, []).append(rule)
+
+        # Per metrica: punti di soglia ordinati, ognuno con la sua regola
+        self.boundaries, self.boundary_rules = {}, {}
+        for metric, metric_rules in self.by_metric.items():
+            points = sorted(
+                [(rule.threshold, rule) for rule in metric_rules] + [(rule.clear, rule) for rule in metric_rules],
+                key=lambda point: point[0]
+            )
+            self.boundaries[metric] = [value for value, _ in points]
+            self.boundary_rules[metric] = [rule for _, rule in points]
+
+        self.values.clear()
+        self.pending.clear()
+        self.state.alerts = {}
+
+    # ==================== VALUTAZIONE ====================
+
+    def observe(self, state: CamperState, now: Optional[float] = None):
+        """Valuta i campi di CamperState cambiati dall'ultima chiamata"""
+        changes = state.changes_since(self.last_version)
+        self.last_version = state.version
+        self.update(changes, now)
+
+    def update(self, values: Dict[str, object], now: Optional[float] = None):
+        """
+        Valuta le regole toccate dai nuovi valori
+
+        Args:
+            values: Metrica -> valore (le metriche senza regole sono ignorate)
+            now: Epoch del campione (default: adesso)
+        """
+        now = time.time() if now is None else now
+        changed = False
+
+        for metric, value in values.items():
+            boundaries = self.boundaries.get(metric)
+            if boundaries is None or not isinstance(value, (int, float)):
+                continue
+            value = float(value)
+            previous = self.values.get(metric)
+            if previous == value:
+                continue
+            self.values[metric] = value
+
+            if previous is None:
+                rules = self.by_metric[metric]
+            else:
+                low, high = (previous, value) if previous < value else (value, previous)
+                start, end = bisect_left(boundaries, low), bisect_right(boundaries, high)
+                rules = self.boundary_rules[metric][start:end]
+
+            for rule in rules:
+                changed |= self._evaluate(rule, value, now)
+
+        # Regole in attesa della durata minima
+        for rule in list(self.pending.values()):
+            if now - rule.since >= rule.for_seconds:
+                del self.pending[rule.id]
+                self._raise(rule, now)
+                changed = True
+
+        if changed:
+            self._publish()
+
+    def _evaluate(self, rule: AlertRule, value: float, now: float) -> bool:
+        """Transizione di stato di una regola; True se gli allarmi attivi cambiano"""
+        self.evaluations += 1
+        if rule.state == "ok":
+            if rule.triggered(value, rule.threshold):
+                rule.value = value
+                if rule.for_seconds <= 0:
+                    self._raise(rule, now)
+                    return True
+                rule.state = "pending"
+                rule.since = now
+                self.pending[rule.id] = rule
+        elif rule.state == "pending":
+            if not rule.triggered(value, rule.threshold):
+                rule.state = "ok"
+                self.pending.pop(rule.id, None)
+        elif rule.cleared(value, rule.clear):
+            rule.state = "ok"
+            self.cleared += 1
+            self._event("cleared", rule, value, now)
+            return True
+        return False
+
+    def _raise(self, rule: AlertRule, now: float):
+        rule.state = "active"
+        rule.since = now
+        rule.value = self.values.get(rule.metric, rule.value)
+        self.raised += 1
+        self._event("raised", rule, rule.value, now)
+
+    def _event(self, kind: str, rule: AlertRule, value: Optional[float], now: float):
+        self.events.append({
+            "event": kind,
+            "id": rule.id,
+            "severity": rule.severity,
+            "metric": rule.metric,
+            "value": value,
+            "timestamp": now,
+        })
+        print(f"{'⚠️ ' if kind == 'raised' else '✓'} Allarme {rule.id} {'attivo' if kind == 'raised' else 'rientrato'} ({rule.metric}={value:.2f})")
+
+    def _publish(self):
+        """Allarmi attivi su CamperState (nuovo dict: una versione per cambio)"""
+        self.state.alerts = {
+            rule.id: {
+                "severity": rule.severity,
+                "message": rule.message,
+                "metric": rule.metric,
+                "value": rule.value,
+                "threshold": rule.threshold,
+                "since": rule.since,
+            }
+            for rule in self.rules.values()
+            if rule.state == "active"
+        }
+        if self.on_change:
+            self.on_change()
+
+    # ==================== REPORT ====================
+
+    def summary(self) -> Dict:
+        return {
+            "active": self.state.alerts,
+            "events": list(self.events),
+            "rules": [rule.to_dict() for rule in self.rules.values()],
+            "stats": {
+                "rules": len(self.rules),
+                "metrics": len(self.by_metric),
+                "pending": len(self.pending),
+                "evaluations": self.evaluations,
+                "raised": self.raised,
+                "cleared": self.cleared,
+            },
+        }
+
+
+def default_rules() -> List[Dict]:
+    """Regole di default più quelle di ALERT_RULES_FILE"""
+    rules = {rule["id"]: rule for rule in DEFAULT_RULES}
+    if ALERT_RULES_FILE:
+        with open(ALERT_RULES_FILE) as f:
+            for rule in json.load(f):
+                rules[rule["id"]] = rule
+    return list(rules.values())
+
+
+# Motore condiviso da telemetria veicolo e servizio batteria
+alert_engine = AlertEngine(camper)
@@ -0,0 +1,110 @@
+"""
+Intervallo di polling adattivo della batteria
+Da fermi (la maggior parte del tempo) tensione e corrente cambiano poco:
+leggere ogni 2 secondi occupa la radio BLE e la CPU per nulla.
+
+- carico che cambia (salto di corrente o tensione tra due letture):
+  polling veloce (BATTERY_POLL_FAST)
+- valori stabili: l'intervallo cresce di BATTERY_POLL_GROWTH ad ogni
+  lettura, fino a BATTERY_POLL_INTERVAL se qualcuno guarda la batteria
+  (WebSocket o richieste recenti) e fino a BATTERY_POLL_IDLE altrimenti
+- un nuovo client sveglia subito il loop (wake)
+
+Con le notifiche GATT vale solo per le caratteristiche senza notify.
+"""
+
+import asyncio
+import os
+import time
+from collections import deque
+from typing import Dict, Optional
+
+BATTERY_POLL_FAST = float(os.getenv("BATTERY_POLL_FAST", "1.0"))
+BATTERY_POLL_INTERVAL = float(os.getenv("BATTERY_POLL_INTERVAL", "2.0"))
+BATTERY_POLL_IDLE = float(os.getenv("BATTERY_POLL_IDLE", "30.0"))
+BATTERY_POLL_GROWTH = 1.5
+
+# Variazioni tra due letture che indicano un carico in cambiamento
+CURRENT_STEP = 1.0      # A
+VOLTAGE_STEP = 0.05     # V
+
+# Finestra per le letture al minuto
+READS_WINDOW = 600.0
+
+
+class AdaptivePollInterval:
+    """Intervallo fra due letture, deciso dalla dinamica del carico e da chi guarda"""
+
+    def __init__(self, fast: float = BATTERY_POLL_FAST, normal: float = BATTERY_POLL_INTERVAL,
+                 idle: float = BATTERY_POLL_IDLE):
+        self.fast = fast
+        self.normal = normal
+        self.idle = idle
+        self.interval = normal
+        self.mode = "normal"
+        self.last: Optional[tuple] = None
+        self.reads: deque = deque()
+        self.wakeup: Optional[asyncio.Event] = None
+
+    def observe(self, voltage: Optional[float], current: Optional[float], watched: bool) -> float:
+        """
+        Registra una lettura e calcola l'intervallo fino alla prossima
+
+        Args:
+            voltage: Tensione letta (V)
+            current: Corrente letta (A)
+            watched: Qualcuno sta guardando i dati batteria
+
+        Returns:
+            float: Secondi fino alla prossima lettura
+        """
+        now = time.monotonic()
+        self.reads.append(now)
+        while self.reads and now - self.reads[0] > READS_WINDOW:
+            self.reads.popleft()
+
+        active = False
+        if self.last is not None and voltage is not None and current is not None:
+            last_voltage, last_current = self.last
+            active = abs(current - last_current) >= CURRENT_STEP or abs(voltage - last_voltage) >= VOLTAGE_STEP
+        if voltage is not None and current is not None:
+            self.last = (voltage, current)
+
+        ceiling = self.normal if watched else self.idle
+        self.interval = self.fast if active else min(ceiling, self.interval * BATTERY_POLL_GROWTH)
+        self._update_mode()
+        return self.interval
+
+    def _update_mode(self):
+        if self.interval <= self.fast:
+            self.mode = "fast"
+        elif self.interval <= self.normal:
+            self.mode = "normal"
+        else:
+            self.mode = "idle"
+
+    def wake(self):
+        """Nuovo interesse per i dati: torna subito all'intervallo normale"""
+        if self.interval > self.normal:
+            self.interval = self.normal
+            self._update_mode()
+            if self.wakeup is not None:
+                self.wakeup.set()
+
+    async def sleep(self):
+        """Attende l'intervallo corrente (interrotto da wake)"""
+        if self.wakeup is None:
+            self.wakeup = asyncio.Event()
+        try:
+            await asyncio.wait_for(self.wakeup.wait(), self.interval)
+        except asyncio.TimeoutError:
+            pass
+        self.wakeup.clear()
+
+    def stats(self) -> Dict:
+        window = min(READS_WINDOW, time.monotonic() - self.reads[0]) if len(self.reads) > 1 else 0.0
+        return {
+            "interval_s": round(self.interval, 2),
+            "mode": self.mode,
+            "reads_per_min": round((len(self.reads) - 1) / window * 60, 1) if window > 0 else None,
+        }
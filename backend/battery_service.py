@@ -6,52 +6,93 @@ Installazione dipendenze:
 pip install bleak asyncio
 """
 
-from fastapi import APIRouter, WebSocket
+from fastapi import APIRouter, HTTPException, Request, WebSocket, WebSocketDisconnect
 import asyncio
-from typing import Optional, List
+import os
+import re
+import time
+from typing import Optional, Tuple
 from datetime import datetime
 
-# Importa il monitor batteria BLE
-# NOTA: Devi creare il file ecoworthy_ble_service.py con la classe EcoworthyBatteryMonitor
-# Per ora usiamo un mock per evitare errori
-try:
-    from ecoworthy_ble_service import EcoworthyBatteryMonitor
-except ImportError:
-    print("⚠️  ecoworthy_ble_service.py non trovato, uso mock")
-    # Mock per sviluppo senza BLE
-    class EcoworthyBatteryMonitor:
-        def __init__(self, device_name: str = "Ecoworthy", device_address: Optional[str] = None):
-            self.is_connected = False
-            self.battery_data = {
-                "voltage": 13.2,
-                "current": 0.0,
-                "soc": 85,
-                "temperature": 25.0,
-                "power": 0.0,
-                "status": "disconnected"
-            }
-        
-        async def connect(self):
-            self.is_connected = True
-            self.battery_data["status"] = "connected"
-            return True
-        
-        async def disconnect(self):
-            self.is_connected = False
-            self.battery_data["status"] = "disconnected"
-        
-        async def read_all_data(self):
-            # Mock: simula variazioni
-            import random
-            self.battery_data["voltage"] = 13.0 + random.uniform(-0.2, 0.2)
+from alerts import alert_engine
+from battery_polling import BATTERY_POLL_INTERVAL, AdaptivePollInterval
+from broadcast_hub import BroadcastHub
+from energy_ledger import LEVELS, RETENTION_SECONDS, auto_resolution, energy_ledger
+from forecaster import forecaster
+from http_cache import BOOT_ID, VersionedSnapshot, conditional_response
+from metrics import Sampled, battery_loop_seconds, broadcast_seconds
+from service_registry import services
+from shared_state import shared_state
+from soc_estimator import soc_estimator
+from task_supervisor import task_supervisor
+from telemetry_history import history
+from telemetry_log import telemetry_log
+
+# Mock per sviluppo senza BLE (e benchmark headless)
+class MockBatteryMonitor:
+    def __init__(self, device_name: str = "Ecoworthy", device_address: Optional[str] = None):
+        self.is_connected = False
+        self.battery_data = {
+            "voltage": 13.2,
+            "current": 0.0,
+            "soc": 85,
+            "temperature": 25.0,
+            "power": 0.0,
+            "status": "disconnected"
+        }
+    
+    async def connect(self):
+        self.is_connected = True
+        self.battery_data["status"] = "connected"
+        return True
+    
+    async def disconnect(self):
+        self.is_connected = False
+        self.battery_data["status"] = "disconnected"
+    
+    async def read_all_data(self):
+        # Mock: simula variazioni
+        import random
+        # Corrente quasi stabile, con ogni tanto un carico che si accende o spegne
+        if random.random() < 0.05:
             self.battery_data["current"] = random.uniform(-5.0, 10.0)
-            self.battery_data["soc"] = max(0, min(100, self.battery_data["soc"] + random.uniform(-0.1, 0.1)))
-            self.battery_data["temperature"] = 25.0 + random.uniform(-1.0, 1.0)
-            self.battery_data["power"] = abs(self.battery_data["voltage"] * self.battery_data["current"])
-            return self.battery_data
-        
-        def get_data(self):
-            return self.battery_data
+        else:
+            self.battery_data["current"] += random.uniform(-0.1, 0.1)
+        self.battery_data["voltage"] = 13.3 + self.battery_data["current"] * 0.01 + random.uniform(-0.01, 0.01)
+        self.battery_data["soc"] = max(0, min(100, self.battery_data["soc"] + random.uniform(-0.1, 0.1)))
+        self.battery_data["temperature"] = 25.0 + random.uniform(-1.0, 1.0)
+        self.battery_data["power"] = abs(self.battery_data["voltage"] * self.battery_data["current"])
+        return self.battery_data
+    
+    def get_data(self):
+        return self.battery_data
+
+
+def load_battery_driver():
+    """
+    Classe del monitor batteria BLE (importata al primo uso o in background:
+    il modulo BLE importa bleak, lento all'avvio sul Pi)
+    NOTA: Devi creare il file ecoworthy_ble_service.py con la classe EcoworthyBatteryMonitor
+    BATTERY_MOCK=true forza il mock anche se il modulo BLE è presente;
+    BATTERY_MOCK=bms (o bms-poll) usa il driver BLE su un BMS simulato
+    """
+    mock = os.getenv("BATTERY_MOCK", "false").lower()
+    if mock == "true":
+        print("⚠️  BATTERY_MOCK attivo, uso mock")
+        return MockBatteryMonitor
+    if mock in ("bms", "bms-poll"):
+        from bms_simulator import simulated_monitor
+        print(f"⚠️  BATTERY_MOCK={mock}, driver BLE su BMS simulato")
+        return simulated_monitor(notify=mock == "bms")
+    try:
+        from ecoworthy_ble_service import EcoworthyBatteryMonitor
+        return EcoworthyBatteryMonitor
+    except ImportError:
+        print("⚠️  ecoworthy_ble_service.py non trovato, uso mock")
+        return MockBatteryMonitor
+
+
+services.register("battery_driver", load_battery_driver)
 
 # ============================================
 # ROUTER FASTAPI
@@ -63,23 +104,62 @@ router = APIRouter(
 )
 
 # Variabili globali per gestione batteria
-battery_monitor: Optional[EcoworthyBatteryMonitor] = None
-monitoring_task: Optional[asyncio.Task] = None
-active_battery_connections: List[WebSocket] = []
+# Istanza di EcoworthyBatteryMonitor (o del mock), creata alla connessione
+battery_monitor = None
+battery_hub = BroadcastHub("batteria")
+battery_broadcast_seconds = broadcast_seconds.labels("batteria")
+
+# Polling adattivo (BATTERY_POLL_INTERVAL resta la cadenza dello storico,
+# anche quando le letture o le notifiche sono più frequenti)
+battery_poll = AdaptivePollInterval()
+
+# Secondi in cui una richiesta a /api/battery/status conta come "qualcuno guarda"
+BATTERY_DEMAND_SECONDS = 60.0
+battery_demand_until = 0.0
+battery_demand_forwarded = 0.0
+
+# Attesa tra due tentativi di riconnessione dopo la perdita del collegamento BLE
+BATTERY_RECONNECT_DELAY = float(os.getenv("BATTERY_RECONNECT_DELAY", "10"))
+
+# Campi batteria storicizzati come battery_<campo>
+BATTERY_HISTORY_FIELDS = ("voltage", "current", "soc", "temperature", "power")
+history.register(
+    [f"battery_{field}" for field in BATTERY_HISTORY_FIELDS],
+    rate_hz=1 / BATTERY_POLL_INTERVAL
+)
 
+# Unità accettate da /api/battery/energy?range=
+RANGE_UNITS = {"m": 60, "h": 3600, "d": 86400}
 
-# ============================================
-# ENDPOINTS BATTERIA
-# ============================================
+# Versione dei dati batteria: incrementata a ogni lettura o cambio connessione
+battery_version = 0
+battery_updated_at = datetime.now()
 
-@router.get("/status")
-async def get_battery_status():
-    """
-    Ritorna stato batteria corrente
+
+def mark_battery_changed():
+    """Registra una modifica ai dati batteria"""
+    global battery_version, battery_updated_at
+    battery_version += 1
+    battery_updated_at = datetime.now()
+
+
+# Stato batteria ricevuto dall'owner (solo worker follower, SHARED_STATE)
+shared_battery_status: Optional[dict] = None
+
+# (versione, avvio) dell'owner per lo stato ricevuto (solo worker follower)
+shared_battery_version: Optional[Tuple[int, str]] = None
+
+
+def battery_etag_version() -> Tuple[int, str]:
+    """Versione e avvio per l'ETag: nei follower quelli dell'owner, uguali in ogni worker"""
+    return shared_battery_version or (battery_version, BOOT_ID)
+
+
+def build_battery_status() -> dict:
+    """Stato batteria con timestamp dell'ultima modifica"""
+    if shared_battery_status is not None:
+        return shared_battery_status
     
-    Returns:
-        dict: Dati batteria con timestamp
-    """
     if not battery_monitor:
         return {
             "status": "not_initialized",
@@ -95,11 +175,43 @@ async def get_battery_status():
     data = battery_monitor.get_data()
     return {
         **data,
-        "timestamp": datetime.now().isoformat(),
-        "connected": battery_monitor.is_connected
+        "timestamp": battery_updated_at.isoformat(),
+        "connected": battery_monitor.is_connected,
+        "forecast": forecaster.battery_forecast(),
+        "polling": battery_polling_stats(),
+        # SoC stimato dal backend (Kalman: Ah contati + tensione), accanto a quello del BMS
+        "estimate": soc_estimator.summary()
     }
 
 
+battery_snapshot = VersionedSnapshot("battery", build_battery_status)
+
+Sampled(
+    "camper_battery_poll_interval_seconds",
+    "Intervallo effettivo di lettura della batteria (polling adattivo)",
+    (),
+    lambda: {(): battery_poll.interval}
+)
+
+
+# ============================================
+# ENDPOINTS BATTERIA
+# ============================================
+
+@router.get("/status")
+async def get_battery_status(request: Request):
+    """
+    Ritorna stato batteria corrente
+    Supporta If-None-Match: risponde 304 se i dati non sono cambiati
+    
+    Returns:
+        dict: Dati batteria con timestamp
+    """
+    note_battery_demand()
+    etag, body = battery_snapshot.get(*battery_etag_version())
+    return conditional_response(request, etag, body)
+
+
 @router.post("/connect")
 async def connect_battery(device_name: str = "Ecoworthy", device_address: Optional[str] = None):
     """
@@ -114,14 +226,19 @@ async def connect_battery(device_name: str = "Ecoworthy", device_address: Option
     """
     global battery_monitor
     
+    if shared_state.is_follower:
+        return await shared_state.call("battery_connect", device_name=device_name, device_address=device_address)
+    
     try:
         print("creazione monitor")
         # Crea monitor se non esiste
         if not battery_monitor:
-            battery_monitor = EcoworthyBatteryMonitor()
+            battery_monitor = services.get("battery_driver")()
+            mark_battery_changed()
         
         # Connetti
         success = await battery_monitor.connect()
+        mark_battery_changed()
         
         if success:
             print("Connessione alla batteria riuscita")
@@ -155,17 +272,19 @@ async def disconnect_battery():
     Returns:
         dict: Risultato disconnessione
     """
-    global battery_monitor, monitoring_task
+    global battery_monitor
+    
+    if shared_state.is_follower:
+        return await shared_state.call("battery_disconnect")
     
     try:
         # Ferma task monitoraggio
-        if monitoring_task:
-            monitoring_task.cancel()
-            monitoring_task = None
+        await task_supervisor.cancel("battery_monitor")
         
         # Disconnetti
         if battery_monitor:
             await battery_monitor.disconnect()
+            mark_battery_changed()
         
         return {
             "success": True,
@@ -187,6 +306,9 @@ async def discover_batteries():
     Returns:
         dict: Lista dispositivi trovati
     """
+    if shared_state.is_follower:
+        return await shared_state.call("battery_discover")
+    
     try:
         from bleak import BleakScanner
         
@@ -221,6 +343,76 @@ async def discover_batteries():
         }
 
 
+@router.post("/soc/reestimate")
+async def reestimate_soc(hours: float = 24.0):
+    """
+    Ricalcola SoC e capacità sullo storico (minimi quadrati con NumPy)
+    e riparte da lì con il filtro incrementale
+    
+    Args:
+        hours: Ore di storico da usare (al massimo le 24h in memoria)
+    
+    Returns:
+        dict: Stima batch (soc, capacità, salute, Ah contati) o errore
+    """
+    if shared_state.is_follower:
+        return await shared_state.call("battery_soc_reestimate", hours=hours)
+    
+    result = await asyncio.to_thread(soc_estimator.estimate_from_history, history, hours * 3600, False)
+    if result is None:
+        raise HTTPException(status_code=409, detail="Storico batteria insufficiente per la stima")
+    soc_estimator.apply_batch(result)
+    mark_battery_changed()
+    await broadcast_battery_update()
+    return {"success": True, "estimate": result}
+
+
+@router.get("/energy")
+async def get_battery_energy(range: str = "24h", resolution: Optional[str] = None):
+    """
+    Energia entrata (carica) e uscita (scarica) dalla batteria, per bucket
+    Risposta dai bucket pre-aggregati: 7 giorni sono 168 bucket orari
+    
+    Args:
+        range: Finestra fino ad adesso (es. 90m, 12h, 7d), al massimo la
+               conservazione della risoluzione (48h minuti, 90d ore, 3650d giorni)
+        resolution: minute, hour o day (default: scelta dalla finestra)
+    
+    Returns:
+        dict: Colonne t/wh_in/wh_out/wh_net/covered_s e totali in Wh
+    """
+    if shared_state.is_follower:
+        return await shared_state.call("battery_energy", range=range, resolution=resolution)
+    
+    match = re.fullmatch(r"(\d+(?:\.\d+)?)([mhd])", range.strip())
+    if match is None:
+        raise HTTPException(status_code=400, detail="Range non valido (es. 90m, 12h, 7d)")
+    if resolution is not None and resolution not in LEVELS:
+        raise HTTPException(status_code=400, detail=f"Risoluzione non valida: {', '.join(LEVELS)}")
+    
+    window = float(match.group(1)) * RANGE_UNITS[match.group(2)]
+    if window <= 0:
+        raise HTTPException(status_code=400, detail="Il range deve essere positivo")
+    
+    # Oltre la conservazione del livello non ci sono bucket: finestra limitata
+    resolution = resolution or auto_resolution(window)
+    if window > RETENTION_SECONDS[resolution]:
+        days = RETENTION_SECONDS[resolution] / 86400
+        raise HTTPException(
+            status_code=400,
+            detail=f"Range oltre la conservazione dei bucket {resolution} (max {days:g}d)"
+        )
+    return energy_ledger.query(window, resolution)
+
+
+# Con più worker solo l'owner parla con la batteria BLE
+shared_state.register("battery_connect", connect_battery)
+shared_state.register("battery_disconnect", disconnect_battery)
+shared_state.register("battery_discover", discover_batteries)
+shared_state.register("battery_soc_reestimate", reestimate_soc)
+shared_state.register("battery_energy", get_battery_energy)
+
+
 # ============================================
 # WEBSOCKET BATTERIA
 # ============================================
@@ -234,47 +426,59 @@ async def battery_websocket_endpoint(websocket: WebSocket):
         websocket: Connessione WebSocket
     """
     await websocket.accept()
-    active_battery_connections.append(websocket)
+    connection = battery_hub.register(websocket)
+    note_battery_demand()
     
-    print(f"✓ WebSocket batteria connesso (totale: {len(active_battery_connections)})")
+    print(f"✓ WebSocket batteria connesso (totale: {len(battery_hub)})")
     
     try:
         while True:
             # Mantieni connessione attiva
             await websocket.receive_text()
             
+    except WebSocketDisconnect:
+        pass
     except Exception as e:
         print(f"WebSocket batteria errore: {e}")
     finally:
-        if websocket in active_battery_connections:
-            active_battery_connections.remove(websocket)
-        print(f"✗ WebSocket batteria disconnesso (rimasti: {len(active_battery_connections)})")
+        battery_hub.unregister(connection)
+        print(f"✗ WebSocket batteria disconnesso (rimasti: {len(battery_hub)})")
 
 
 async def broadcast_battery_update():
-    """Invia aggiornamenti batteria a tutti i client WebSocket connessi"""
-    if not battery_monitor or not active_battery_connections:
+    """
+    Accoda l'aggiornamento batteria per tutti i client WebSocket connessi.
+    Non attende l'invio: ogni connessione ha il suo writer.
+    """
+    if not (battery_monitor or shared_battery_status) or not len(battery_hub):
         return
     
-    data = battery_monitor.get_data()
-    message = {
-        **data,
-        "timestamp": datetime.now().isoformat(),
-        "connected": battery_monitor.is_connected
-    }
+    with battery_broadcast_seconds.time():
+        # Stesso JSON servito da /api/battery/status per questa versione
+        _, message = battery_snapshot.get(*battery_etag_version())
+        battery_hub.publish(message, key="state")
+
+
+async def apply_shared_battery(status: Optional[dict], version: Optional[Tuple[int, str]] = None):
+    """
+    Stato batteria pubblicato dall'owner (worker follower)
     
-    # Invia a tutti i client
-    disconnected = []
-    for connection in active_battery_connections:
-        try:
-            await connection.send_json(message)
-        except Exception as e:
-            print(f"Errore invio WebSocket: {e}")
-            disconnected.append(connection)
+    Args:
+        status: Stato dell'owner (None: torna ai dati locali, es. dopo una promozione)
+        version: (versione, avvio) dell'owner per l'ETag
+    """
+    global shared_battery_status, shared_battery_version
     
-    # Rimuovi connessioni morte
-    for conn in disconnected:
-        active_battery_connections.remove(conn)
+    shared_battery_version = version
+    if status == shared_battery_status:
+        return
+    shared_battery_status = status
+    mark_battery_changed()
+    await broadcast_battery_update()
+    
+    # Client connessi a questo worker: l'owner deve continuare a leggere spesso
+    if len(battery_hub):
+        note_battery_demand()
 
 
 # ============================================
@@ -282,36 +486,161 @@ async def broadcast_battery_update():
 # ============================================
 
 async def battery_monitoring_loop():
-    """Loop continuo di monitoraggio batteria"""
-    global battery_monitor
-    
+    """
+    Loop continuo di monitoraggio batteria
+    Con le notifiche GATT elabora ogni aggiornamento appena arriva e legge a
+    intervalli solo i campi senza notify; altrimenti (mock, BMS senza
+    notifiche) legge tutto con l'intervallo adattivo di battery_poll.
+    Se il collegamento cade riprova a connettersi ogni BATTERY_RECONNECT_DELAY.
+    Gli errori di lettura fanno terminare il loop: il supervisore lo
+    riavvia con backoff esponenziale invece di riprovare a ritmo fisso.
+    """
     print("🔋 Monitoraggio batteria avviato")
+    last_poll = 0.0
+    connected = False
+    reconnect_at = 0.0
     
-    while True:
-        try:
-            if battery_monitor and battery_monitor.is_connected:
+    try:
+        while True:
+            task_supervisor.iteration()
+            monitor = battery_monitor
+            if not (monitor and monitor.is_connected):
+                if connected:
+                    # Connessione persa: stato "disconnected" ai client
+                    connected = False
+                    mark_battery_changed()
+                    await broadcast_battery_update()
+                    reconnect_at = time.monotonic() + BATTERY_RECONNECT_DELAY
+                if monitor and time.monotonic() >= reconnect_at:
+                    # Batteria fuori portata o BMS riavviato: riprova (/disconnect ferma questo loop)
+                    reconnect_at = time.monotonic() + BATTERY_RECONNECT_DELAY
+                    if await monitor.connect():
+                        print("✓ Batteria riconnessa")
+                        continue
+                await asyncio.sleep(min(BATTERY_POLL_INTERVAL, BATTERY_RECONNECT_DELAY))
+                continue
+            connected = True
+            
+            if getattr(monitor, "notifying", None):
+                updated = await monitor.wait_update(battery_poll.interval)
+                polled = monitor.polled and time.monotonic() - last_poll >= battery_poll.interval
+                if polled:
+                    await monitor.read_all_data()
+                    last_poll = time.monotonic()
+                    updated = True
+                if updated and monitor.is_connected:
+                    await process_battery_update(monitor)
+                if polled:
+                    observe_battery_load(monitor)
+            else:
                 # Leggi dati batteria
-                await battery_monitor.read_all_data()
+                await monitor.read_all_data()
+                await process_battery_update(monitor)
                 
-                # Broadcast via WebSocket
-                await broadcast_battery_update()
-            
-            await asyncio.sleep(2.0)  # Aggiorna ogni 2 secondi
-            
-        except asyncio.CancelledError:
-            print("🔋 Monitoraggio batteria arrestato")
-            break
-        except Exception as e:
-            print(f"❌ Errore monitoraggio batteria: {e}")
-            await asyncio.sleep(5.0)
+                # Prossima lettura: presto se il carico cambia, fino a 30s da fermi
+                observe_battery_load(monitor)
+                await battery_poll.sleep()
+    except asyncio.CancelledError:
+        print("🔋 Monitoraggio batteria arrestato")
+        raise
 
 
-async def start_battery_monitoring():
-    """Avvia task di monitoraggio in background"""
-    global monitoring_task
+def battery_watched() -> bool:
+    """Qualcuno guarda i dati batteria (WebSocket o richieste recenti)"""
+    return len(battery_hub) > 0 or time.monotonic() < battery_demand_until
+
+
+def observe_battery_load(monitor) -> float:
+    """Aggiorna l'intervallo di polling con l'ultima lettura"""
+    data = monitor.get_data()
+    return battery_poll.observe(data.get("voltage"), data.get("current"), battery_watched())
+
+
+def note_battery_demand():
+    """
+    Richiesta di dati batteria: polling almeno normale per BATTERY_DEMAND_SECONDS
+    Nei follower (SHARED_STATE) la richiesta è inoltrata all'owner, al
+    massimo una volta ogni terzo della finestra.
+    """
+    global battery_demand_until, battery_demand_forwarded
+    
+    now = time.monotonic()
+    if shared_state.is_follower:
+        if now - battery_demand_forwarded >= BATTERY_DEMAND_SECONDS / 3:
+            battery_demand_forwarded = now
+            # Via supervisore: il task resta referenziato ed eventuali errori sono registrati
+            task_supervisor.spawn("battery_demand_forward", forward_battery_demand, restart=False)
+        return
+    
+    battery_demand_until = now + BATTERY_DEMAND_SECONDS
+    battery_poll.wake()
+
+
+async def forward_battery_demand():
+    """Inoltra all'owner la richiesta di dati batteria (errori in /api/debug/tasks)"""
+    await shared_state.call("battery_demand")
+
+
+async def owner_battery_demand():
+    note_battery_demand()
+
+
+shared_state.register("battery_demand", owner_battery_demand)
+
+
+def battery_polling_stats() -> dict:
+    """Intervallo di lettura effettivo (None con sole notifiche GATT)"""
+    if battery_monitor is not None and getattr(battery_monitor, "notifying", None) and not battery_monitor.polled:
+        return {"interval_s": None, "mode": "notify", "reads_per_min": None}
+    return battery_poll.stats()
+
+
+# Ultimo campione batteria storicizzato (epoch)
+battery_history_at = 0.0
+
+
+async def process_battery_update(monitor):
+    """Nuovi dati batteria: storico (a BATTERY_POLL_INTERVAL), allarmi e broadcast"""
+    global battery_history_at
+    
+    started = time.perf_counter()
+    mark_battery_changed()
+    
+    data = monitor.get_data()
+    sample = {
+        f"battery_{field}": data[field]
+        for field in BATTERY_HISTORY_FIELDS
+        if isinstance(data.get(field), (int, float))
+    }
+    now = time.time()
+    
+    # Stima SoC: al primo campione riparte dallo storico, poi incrementale
+    if soc_estimator.x is None and len(history.buffers["battery_voltage"]) >= 10:
+        result = await asyncio.to_thread(soc_estimator.estimate_from_history, history, apply=False)
+        if result is not None:
+            soc_estimator.apply_batch(result)
+    soc_estimator.update(data, now)
+    
+    # Contabilità energia: integra ogni lettura (anche fra due campioni di storico)
+    energy_ledger.add(now, data.get("voltage"), data.get("current"))
     
-    if monitoring_task is None or monitoring_task.done():
-        monitoring_task = asyncio.create_task(battery_monitoring_loop())
+    # Storico (memoria + log su disco) alla sua frequenza di registrazione
+    if now - battery_history_at >= BATTERY_POLL_INTERVAL * 0.9:
+        battery_history_at = now
+        history.record(sample, now)
+        forecaster.update_battery(data, now)
+        telemetry_log.record(sample, now)
+    alert_engine.update(sample, now)
+    
+    # Broadcast via WebSocket
+    await broadcast_battery_update()
+    battery_loop_seconds.observe(time.perf_counter() - started)
+
+
+async def start_battery_monitoring():
+    """Avvia il loop di monitoraggio sotto il supervisore (se non già attivo)"""
+    if not task_supervisor.is_running("battery_monitor"):
+        task_supervisor.spawn("battery_monitor", battery_monitoring_loop)
         print("✓ Task monitoraggio batteria creato")
 
 
@@ -327,34 +656,36 @@ async def startup_battery_service():
     print("  POST /api/battery/connect")
     print("  POST /api/battery/disconnect")
     print("  GET  /api/battery/discover")
+    print("  GET  /api/battery/energy")
     print("  WS   /api/battery/ws")
     print("================================\n")
     
+    await energy_ledger.start()
+    
     # Auto-connetti se configurato (opzionale)
     # global battery_monitor
-    # battery_monitor = EcoworthyBatteryMonitor(device_name="Ecoworthy")
+    # battery_monitor = services.get("battery_driver")(device_name="Ecoworthy")
     # await battery_monitor.connect()
     # await start_battery_monitoring()
 
 
 async def shutdown_battery_service():
     """Chiamato allo spegnimento dell'applicazione"""
-    global battery_monitor, monitoring_task
-    
     print("\n🔋 Arresto Battery Service...")
     
+    # Chiudi WebSocket batteria
+    await battery_hub.close_all()
+    
     # Ferma monitoraggio
-    if monitoring_task and not monitoring_task.done():
-        monitoring_task.cancel()
-        try:
-            await monitoring_task
-        except asyncio.CancelledError:
-            pass
+    await task_supervisor.cancel("battery_monitor")
     
     # Disconnetti batteria
     if battery_monitor and battery_monitor.is_connected:
         await battery_monitor.disconnect()
     
+    # Salva la contabilità energia
+    await energy_ledger.stop()
+    
     print("✓ Battery Service arrestato\n")
 
 
@@ -364,6 +695,7 @@ async def shutdown_battery_service():
 
 __all__ = [
     'router',
+    'battery_hub',
     'startup_battery_service',
     'shutdown_battery_service'
 ]
\ No newline at end of file
@@ -0,0 +1,262 @@
+"""
+Benchmark della pipeline CAN
+Un thread invia frame sul bus virtuale di python-can (o su vcan0) alla
+frequenza richiesta; CanSource li decodifica e li applica a un CamperState.
+Misura per ogni frequenza:
+- frame decodificati al secondo e frame persi (inviati ma non letti)
+- aggiornamenti applicati allo stato (limitati per segnale)
+- ritardo dell'event loop (max e p99 di un ticker a 10ms)
+
+Esegui:
+    python bench_can.py [--rates 1000,5000,10000] [--duration 5]
+    python bench_can.py --interface socketcan --channel vcan0
+    python bench_can.py --check     (verifiche di decoder, limite di frequenza e rumore carburante)
+
+Con socketcan serve un bus virtuale del kernel:
+    sudo ip link add dev vcan0 type vcan && sudo ip link set up vcan0
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import threading
+import time
+
+import numpy as np
+
+import can
+
+from can_source import DEFAULT_SIGNALS, ENGINE_RUNNING_RPM, CanDecoder, CanSource, encode_frame
+from trip_computer import FUEL_TANK_LITERS, TripComputer
+from vehicle_state import CamperState
+
+RATES = "1000,5000,10000"
+TICK = 0.01
+
+# Attesa finale perché il lettore svuoti la coda del bus
+RECV_WAIT = 0.5
+
+
+def send_traffic(bus, rate: float, stop: threading.Event, sent: list):
+    """Invia frame dei segnali di default a `rate` frame/s (a raffiche ogni ms)"""
+    ids = list(DEFAULT_SIGNALS)
+    messages = []
+    for i in range(256):
+        arbitration_id = ids[i % len(ids)]
+        values = [(signal, random.uniform(0, 100)) for signal in DEFAULT_SIGNALS[arbitration_id]]
+        messages.append(can.Message(arbitration_id=arbitration_id, data=encode_frame(values), is_extended_id=True))
+
+    started = time.perf_counter()
+    while not stop.is_set():
+        due = int((time.perf_counter() - started) * rate)
+        while sent[0] < due:
+            bus.send(messages[sent[0] % len(messages)])
+            sent[0] += 1
+        time.sleep(0.001)
+
+
+async def measure_lag(duration: float) -> np.ndarray:
+    """Ritardo di risveglio di un ticker periodico (ms)"""
+    lags = []
+    end = time.perf_counter() + duration
+    while time.perf_counter() < end:
+        before = time.perf_counter()
+        await asyncio.sleep(TICK)
+        lags.append((time.perf_counter() - before - TICK) * 1000)
+    return np.array(lags)
+
+
+async def run_rate(args, rate: float) -> dict:
+    state = CamperState()
+    source = CanSource(state, interface=args.interface, channel=args.channel)
+    await source.start()
+    sender_bus = can.Bus(interface=args.interface, channel=args.channel)
+
+    stop, sent = threading.Event(), [0]
+    sender = threading.Thread(target=send_traffic, args=(sender_bus, rate, stop, sent), daemon=True)
+    sender.start()
+    await asyncio.sleep(0.5)
+
+    frames_start, updates_start, sent_start = source.decoder.frames, source.updates, sent[0]
+    started = time.perf_counter()
+    lags = await measure_lag(args.duration)
+    elapsed = time.perf_counter() - started
+    frames, updates, sent_count = (
+        source.decoder.frames - frames_start, source.updates - updates_start, sent[0] - sent_start
+    )
+
+    stop.set()
+    sender.join()
+    await asyncio.sleep(RECV_WAIT)
+    lost = sent[0] - source.decoder.frames
+    sender_bus.shutdown()
+    await source.stop()
+
+    return {
+        "rate": rate,
+        "sent_per_s": sent_count / elapsed,
+        "decoded_per_s": frames / elapsed,
+        "lost": max(0, lost),
+        "updates_per_s": updates / elapsed,
+        "lag_p99_ms": float(np.percentile(lags, 99)),
+        "lag_max_ms": float(lags.max()),
+    }
+
+
+# ==================== VERIFICHE ====================
+
+def check_round_trip():
+    """encode_frame -> CanDecoder restituisce ogni segnale di default (a meno della risoluzione)"""
+    decoder = CanDecoder(DEFAULT_SIGNALS)
+    for arbitration_id, signals in DEFAULT_SIGNALS.items():
+        for signal in signals:
+            value = signal.offset + signal.scale * (signal.mask // 3)
+            decoder.feed(arbitration_id, encode_frame([(signal, value)]))
+            decoded = decoder.take()[signal.name]
+            assert abs(decoded - value) <= signal.scale / 2, f"{signal.name}: {decoded} != {value}"
+    print(f"✓ Round trip di {len(DEFAULT_SIGNALS)} frame di default")
+
+
+def check_not_available():
+    """Segnale a tutti 1 (J1939 "non disponibile"): nessun valore, contato a parte"""
+    decoder = CanDecoder(DEFAULT_SIGNALS)
+    decoder.feed(0x0CF00400, bytes([0xFF] * 8))
+    assert decoder.take() == {}, "un segnale 0xFF non deve produrre valori"
+    assert decoder.unavailable == 1, f"unavailable = {decoder.unavailable}"
+
+    decoder.feed(0x123, bytes(8))
+    assert decoder.unknown == 1, "ID sconosciuto non contato"
+    print("✓ Segnali 0xFF ignorati, ID sconosciuti contati")
+
+
+def check_rate_limit():
+    """apply() rispetta min_interval e i valori trattenuti restano in attesa"""
+    state = CamperState()
+    source = CanSource(state, table=DEFAULT_SIGNALS)
+    fuel = source.signals["fuel_level"]
+
+    source.pending["fuel_level"] = 50.0
+    assert source.apply(100.0) == 1 and state.fuel_level == 50.0, "primo valore non applicato"
+
+    source.pending["fuel_level"] = 40.0
+    assert source.apply(100.0 + fuel.min_interval / 2) == 0, "min_interval non rispettato"
+    assert state.fuel_level == 50.0 and "fuel_level" in source.pending, "valore trattenuto perso"
+
+    assert source.apply(100.0 + fuel.min_interval) == 1 and state.fuel_level == 40.0, "valore trattenuto non applicato"
+    print(f"✓ Limite di frequenza ({fuel.max_hz:g} Hz su fuel_level)")
+
+
+def check_engine_running():
+    """I giri accendono e spengono engine_running"""
+    state = CamperState()
+    source = CanSource(state, table=DEFAULT_SIGNALS)
+
+    source.pending["engine_speed"] = ENGINE_RUNNING_RPM + 500
+    source.apply(100.0)
+    assert state.engine_running, "motore non acceso sopra ENGINE_RUNNING_RPM"
+
+    source.pending["engine_speed"] = 0.0
+    source.apply(101.0)
+    assert not state.engine_running, "motore non spento a 0 giri"
+    print("✓ engine_running dai giri")
+
+
+def check_fuel_jitter():
+    """Il livello che oscilla di un passo (0.4%) a motore acceso non conta come consumo"""
+    state = CamperState()
+    source = CanSource(state, table=DEFAULT_SIGNALS)
+    trips = TripComputer(state, path=os.devnull)
+    state.engine_running = True
+
+    # 10 minuti al minimo con il sensore che balla fra due passi
+    now = 1000.0
+    for tick in range(600):
+        source.pending["fuel_level"] = 50.0 if tick % 2 else 50.4
+        source.apply(now)
+        trips.update(now)
+        now += 1
+    idle = trips.trips["startup"].fuel_used_l
+    # Al più il primo passo in discesa (50.4 -> 50.0), non uno per oscillazione
+    assert idle <= 0.4 * FUEL_TANK_LITERS / 100 + 1e-9, f"rumore contato come consumo: {idle:.1f} L"
+
+    # Calo reale: 5% del serbatoio
+    for level in (48.0, 46.0, 45.0):
+        source.pending["fuel_level"] = level
+        source.apply(now)
+        trips.update(now)
+        now += 1
+    used = trips.trips["startup"].fuel_used_l - idle
+    expected = 5.0 * FUEL_TANK_LITERS / 100
+    assert abs(used - expected) < 1e-6, f"consumo {used:.2f} L invece di {expected:.2f} L"
+
+    # Rifornimento graduale (un passo al secondo): un solo rifornimento
+    for level in range(46, 91):
+        source.pending["fuel_level"] = float(level)
+        source.apply(now)
+        trips.update(now)
+        now += 1
+    assert trips.refuels == 1, f"{trips.refuels} rifornimenti invece di 1"
+    assert trips.trips["refuel"].fuel_used_l == 0, "parziale refuel non azzerato"
+    assert trips.trips["startup"].fuel_used_l == idle + used, "rifornimento contato come consumo"
+    print(f"✓ Rumore del sensore carburante ignorato ({used:.1f} L per un calo del 5%)")
+
+
+async def check_virtual_bus(args):
+    """Frame inviato sul bus -> thread di lettura -> lotto applicato a CamperState"""
+    state = CamperState()
+    batches = []
+
+    async def on_batch():
+        batches.append(state.rpm)
+
+    source = CanSource(state, table=DEFAULT_SIGNALS, interface=args.interface, channel=args.channel, on_batch=on_batch)
+    await source.start()
+    sender_bus = can.Bus(interface=args.interface, channel=args.channel)
+    try:
+        signal = DEFAULT_SIGNALS[0x0CF00400][0]
+        sender_bus.send(can.Message(arbitration_id=0x0CF00400, data=encode_frame([(signal, 1500)]), is_extended_id=True))
+        deadline = time.monotonic() + 2.0
+        while not batches and time.monotonic() < deadline:
+            await asyncio.sleep(0.01)
+        assert batches, "nessun lotto applicato entro 2s"
+        assert state.rpm == 1500 and state.engine_running, f"rpm = {state.rpm}"
+    finally:
+        sender_bus.shutdown()
+        await source.stop()
+    print(f"✓ Frame dal bus {args.interface}:{args.channel} applicato allo stato")
+
+
+async def run_checks(args):
+    check_round_trip()
+    check_not_available()
+    check_rate_limit()
+    check_engine_running()
+    check_fuel_jitter()
+    await check_virtual_bus(args)
+    print("✓ Verifiche CAN superate")
+
+
+async def main(args):
+    print("=" * 60)
+    print(f"BENCHMARK CAN ({args.interface}:{args.channel}, {args.duration:g}s per frequenza)")
+    print("=" * 60)
+    print(f"{'frame/s':>8} {'inviati/s':>10} {'decod./s':>10} {'persi':>7} {'aggiorn./s':>11} {'lag p99':>9} {'lag max':>9}")
+    for rate in [float(r) for r in args.rates.split(",")]:
+        r = await run_rate(args, rate)
+        print(
+            f"{r['rate']:>8.0f} {r['sent_per_s']:>10.0f} {r['decoded_per_s']:>10.0f} {r['lost']:>7} "
+            f"{r['updates_per_s']:>11.1f} {r['lag_p99_ms']:>7.2f}ms {r['lag_max_ms']:>7.2f}ms"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark pipeline CAN")
+    parser.add_argument("--rates", default=RATES, help="Frame al secondo da inviare, separati da virgola")
+    parser.add_argument("--duration", type=float, default=5.0, help="Secondi di misura per frequenza")
+    parser.add_argument("--interface", default="virtual", help="Interfaccia python-can")
+    parser.add_argument("--channel", default="bench", help="Canale python-can")
+    parser.add_argument("--check", action="store_true", help="Verifiche di decoder e limite di frequenza invece del benchmark")
+    args = parser.parse_args()
+
+    asyncio.run(run_checks(args) if args.check else main(args))
@@ -0,0 +1,377 @@
+"""
+Benchmark di carico WebSocket (fan-out end-to-end)
+Avvia l'app in-process (uvicorn in un thread dedicato), collega N client
+simulati a /ws e /api/battery/ws e misura per ogni N:
+- latenza end-to-end dei frame (istante della modifica -> ricezione) p50/p95/p99/max
+- throughput (frame e byte ricevuti al secondo)
+- CPU del thread server e memoria (RSS) del processo
+- punti di codice che hanno bloccato l'event loop (watchdog)
+
+Gira headless: batteria mock (BATTERY_MOCK), veicolo guidato dal percorso
+sintetico deterministico, log telemetria, contabilità energia e parziali in
+cartelle temporanee.
+
+Esegui:
+    python bench_load.py --clients 1,5,20,50 --duration 10
+    python bench_load.py --save bench_load_baseline.json   (nuova baseline di riferimento)
+    python bench_load.py --baseline altra_baseline.json
+    python bench_load.py --fail-on-regression   (exit 1 se una metrica peggiora oltre --tolerance)
+    python bench_load.py --max-block-ms 200     (exit 1 se il loop si blocca di più: per la CI)
+
+Ogni esecuzione viene confrontata con bench_load_baseline.json (nel repository,
+presa con i parametri di default) e le metriche peggiorate oltre la tolleranza
+sono segnalate come regressioni.
+
+Nota: client e server condividono il processo (e il GIL), quindi i numeri
+vanno confrontati solo con baseline prese sulla stessa macchina.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import resource
+import socket
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import numpy as np
+
+# Configurazione headless prima di importare l'app
+os.environ.setdefault("BATTERY_MOCK", "true")
+os.environ.setdefault("VEHICLE_SOURCE", "synthetic")
+os.environ.setdefault("REPLAY_SPEED", "10")
+os.environ.setdefault("LOOP_WATCHDOG", "true")
+os.environ.setdefault("TELEMETRY_LOG_DIR", tempfile.mkdtemp(prefix="bench-telemetry-"))
+# Energia e parziali del veicolo simulato non devono finire nei file reali in data/
+os.environ.setdefault("ENERGY_FILE", os.path.join(tempfile.mkdtemp(prefix="bench-energy-"), "energy.json"))
+os.environ.setdefault("TRIP_FILE", os.path.join(tempfile.mkdtemp(prefix="bench-trip-"), "trips.json"))
+
+import uvicorn
+import websockets
+
+CLIENT_COUNTS = "1,5,20,50"
+
+# Baseline di riferimento e peggioramento tollerato (%) prima di segnalare una regressione
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_load_baseline.json")
+REGRESSION_TOLERANCE = 30.0
+
+# Metriche confrontate con la baseline (nome, più alto è meglio)
+COMPARED = (
+    ("p50_ms", False),
+    ("p95_ms", False),
+    ("p99_ms", False),
+    ("frames_per_s", True),
+    ("server_cpu_pct", False),
+    ("rss_mb", False),
+)
+
+
+# ============================================
+# SERVER IN-PROCESS
+# ============================================
+
+class BenchServer:
+    """Uvicorn in un thread, con misura della CPU del solo thread server"""
+
+    def __init__(self, port: int):
+        from main import app
+
+        self.port = port
+        self.server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+        self.thread = threading.Thread(target=self.server.run, name="bench-server", daemon=True)
+
+    def start(self):
+        self.thread.start()
+        while not self.server.started:
+            time.sleep(0.05)
+
+    def stop(self):
+        self.server.should_exit = True
+        self.thread.join(timeout=10)
+
+    def cpu_seconds(self) -> float:
+        """CPU (user+sys) del thread server da /proc, altrimenti dell'intero processo"""
+        try:
+            with open(f"/proc/self/task/{self.thread.native_id}/stat") as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+            return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+        except (OSError, IndexError, ValueError):
+            return time.process_time()
+
+
+def rss_mb() -> float:
+    """Memoria residente attuale (picco se /proc non è disponibile)"""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+    except (OSError, ValueError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+# ============================================
+# CLIENT SIMULATI
+# ============================================
+
+class Collector:
+    """Latenze e contatori condivisi da tutti i client di un livello"""
+
+    def __init__(self):
+        self.latencies: List[float] = []
+        self.frames = 0
+        self.bytes = 0
+        self.errors = 0
+        self.measuring = False
+
+    def frame(self, data: str):
+        if not self.measuring:
+            return
+        self.frames += 1
+        self.bytes += len(data)
+
+        message = json.loads(data)
+        # I keyframe periodici ripetono lo stato: la latenza ha senso solo per i cambi
+        if message.get("type") == "keyframe" or "timestamp" not in message:
+            return
+        changed_at = datetime.fromisoformat(message["timestamp"]).timestamp()
+        self.latencies.append(time.time() - changed_at)
+
+
+async def vehicle_client(url: str, rate: float, collector: Collector, ready: asyncio.Event):
+    """Client /ws abbonato a tutti i topic alla frequenza indicata"""
+    try:
+        async with websockets.connect(url, max_queue=None) as ws:
+            topics = ["drive", "tanks", "power", "climate", "lights", "doors", "trip"]
+            await ws.send(json.dumps({"type": "subscribe", "topics": {t: rate for t in topics}}))
+            ready.set()
+            async for data in ws:
+                collector.frame(data)
+    except websockets.ConnectionClosed:
+        pass
+    except Exception as e:
+        collector.errors += 1
+        print(f"❌ Client veicolo: {e}")
+
+
+async def battery_client(url: str, collector: Collector, ready: asyncio.Event):
+    """Client /api/battery/ws"""
+    try:
+        async with websockets.connect(url, max_queue=None) as ws:
+            ready.set()
+            async for data in ws:
+                collector.frame(data)
+    except websockets.ConnectionClosed:
+        pass
+    except Exception as e:
+        collector.errors += 1
+        print(f"❌ Client batteria: {e}")
+
+
+# ============================================
+# MISURA
+# ============================================
+
+async def run_level(server: BenchServer, clients: int, duration: float, warmup: float, rate: float) -> Dict:
+    """Collega `clients` client per canale e misura per `duration` secondi"""
+    base = f"ws://127.0.0.1:{server.port}"
+    vehicle, battery = Collector(), Collector()
+
+    tasks, waits = [], []
+    for _ in range(clients):
+        for coro, collector in (
+            (lambda ready: vehicle_client(f"{base}/ws", rate, vehicle, ready), vehicle),
+            (lambda ready: battery_client(f"{base}/api/battery/ws", battery, ready), battery),
+        ):
+            ready = asyncio.Event()
+            waits.append(ready.wait())
+            tasks.append(asyncio.create_task(coro(ready)))
+
+    await asyncio.wait_for(asyncio.gather(*waits), timeout=30)
+    await asyncio.sleep(warmup)
+
+    cpu_start, wall_start = server.cpu_seconds(), time.perf_counter()
+    vehicle.measuring = battery.measuring = True
+    await asyncio.sleep(duration)
+    vehicle.measuring = battery.measuring = False
+    cpu, wall = server.cpu_seconds() - cpu_start, time.perf_counter() - wall_start
+    memory = rss_mb()
+
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    # Lascia al server il tempo di chiudere le connessioni
+    await asyncio.sleep(0.5)
+
+    latencies = np.array(vehicle.latencies + battery.latencies) * 1000
+    percentiles = np.percentile(latencies, [50, 95, 99]) if len(latencies) else [float("nan")] * 3
+    return {
+        "clients": clients,
+        "connections": clients * 2,
+        "frames_per_s": (vehicle.frames + battery.frames) / wall,
+        "vehicle_frames_per_s": vehicle.frames / wall,
+        "battery_frames_per_s": battery.frames / wall,
+        "kb_per_s": (vehicle.bytes + battery.bytes) / wall / 1024,
+        "p50_ms": float(percentiles[0]),
+        "p95_ms": float(percentiles[1]),
+        "p99_ms": float(percentiles[2]),
+        "max_ms": float(latencies.max()) if len(latencies) else float("nan"),
+        "samples": int(len(latencies)),
+        "server_cpu_pct": cpu / wall * 100,
+        "rss_mb": memory,
+        "errors": vehicle.errors + battery.errors,
+    }
+
+
+def print_results(results: List[Dict]):
+    print(f"{'client':>7} {'frame/s':>9} {'KB/s':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'max':>8} {'CPU':>7} {'RSS':>8}")
+    for r in results:
+        print(
+            f"{r['clients']:>7} {r['frames_per_s']:>9.1f} {r['kb_per_s']:>8.1f} "
+            f"{r['p50_ms']:>6.2f}ms {r['p95_ms']:>6.2f}ms {r['p99_ms']:>6.2f}ms {r['max_ms']:>6.1f}ms "
+            f"{r['server_cpu_pct']:>6.1f}% {r['rss_mb']:>6.1f}MB"
+        )
+
+
+def fetch_json(url: str) -> Dict:
+    with urllib.request.urlopen(url) as response:
+        return json.load(response)
+
+
+def print_blocks(blocks: Dict):
+    """Riepilogo del watchdog dell'event loop"""
+    if not blocks.get("enabled"):
+        print("\nWatchdog event loop non attivo")
+        return
+
+    print(f"\nBlocchi event loop > {blocks['threshold_ms']:g}ms: {blocks['stalls']}")
+    for site in blocks["sites"][:10]:
+        print(f"  {site['count']:>4}x  max {site['max_ms']:>7.1f}ms  tot {site['total_ms']:>8.1f}ms  {site['site']}")
+
+
+def compare(results: List[Dict], path: str, tolerance: float) -> List[str]:
+    """
+    Variazione percentuale rispetto a una baseline salvata
+
+    Returns:
+        list: Regressioni oltre `tolerance` (es. "20 client p95_ms +41.2%")
+    """
+    with open(path) as f:
+        saved = json.load(f)
+    baseline = {r["clients"]: r for r in saved["results"]}
+
+    print(f"\nConfronto con {path} (+ = peggio, * = oltre {tolerance:g}%)")
+    if saved.get("machine") != platform.platform():
+        print(f"⚠️  Baseline presa su un'altra macchina ({saved.get('machine')}): confronto indicativo")
+    print(f"{'client':>7} " + " ".join(f"{name:>15}" for name, _ in COMPARED))
+
+    regressions = []
+    for r in results:
+        before = baseline.get(r["clients"])
+        if not before:
+            continue
+        cells = []
+        for name, higher_is_better in COMPARED:
+            if not before[name] or np.isnan(before[name]) or np.isnan(r[name]):
+                cells.append(f"{'n/a':>15}")
+                continue
+            change = (r[name] - before[name]) / before[name] * 100
+            if higher_is_better:
+                change = -change
+            flag = "*" if change > tolerance else " "
+            if flag == "*":
+                regressions.append(f"{r['clients']} client {name} {change:+.1f}%")
+            cells.append(f"{change:>+13.1f}%{flag}")
+        print(f"{r['clients']:>7} " + " ".join(cells))
+
+    if regressions:
+        print(f"\n⚠️  Regressioni rispetto alla baseline: {', '.join(regressions)}")
+    else:
+        print("\n✓ Nessuna regressione rispetto alla baseline")
+    return regressions
+
+
+async def main(args):
+    port = free_port()
+    server = BenchServer(port)
+    server.start()
+
+    # Connette la batteria mock (stesso endpoint usato dall'infotainment)
+    request = urllib.request.Request(f"http://127.0.0.1:{port}/api/battery/connect", method="POST")
+    await asyncio.to_thread(urllib.request.urlopen, request)
+
+    print("=" * 60)
+    print(f"BENCHMARK CARICO WEBSOCKET ({args.duration:g}s per livello, topic a {args.rate:g} Hz)")
+    print("=" * 60)
+
+    results = []
+    try:
+        for clients in [int(n) for n in args.clients.split(",")]:
+            result = await run_level(server, clients, args.duration, args.warmup, args.rate)
+            results.append(result)
+            print_results([result])
+        blocks = await asyncio.to_thread(fetch_json, f"http://127.0.0.1:{port}/api/debug/loop-blocks")
+    finally:
+        server.stop()
+
+    print_blocks(blocks)
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump({
+                "created": datetime.now().isoformat(),
+                "machine": platform.platform(),
+                "python": platform.python_version(),
+                "duration": args.duration,
+                "rate": args.rate,
+                "results": results,
+                "loop_blocks": blocks,
+            }, f, indent=2)
+        print(f"\n✓ Baseline salvata in {args.save}")
+
+    regressions = []
+    if args.baseline and os.path.abspath(args.baseline) != os.path.abspath(args.save or ""):
+        if os.path.exists(args.baseline):
+            regressions = compare(results, args.baseline, args.tolerance)
+        else:
+            print(f"\n⚠️  Baseline {args.baseline} non trovata: nessun confronto")
+
+    status = 0
+    if regressions and args.fail_on_regression:
+        print(f"\n❌ {len(regressions)} metriche peggiorate oltre {args.tolerance:g}%")
+        status = 1
+
+    worst = max((site["max_ms"] for site in blocks["sites"]), default=0.0)
+    if args.max_block_ms is not None and worst > args.max_block_ms:
+        print(f"\n❌ Event loop bloccato per {worst:.0f}ms (limite {args.max_block_ms:g}ms)")
+        status = 1
+    return status
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark carico WebSocket")
+    parser.add_argument("--clients", default=CLIENT_COUNTS, help="Client per canale, separati da virgola")
+    parser.add_argument("--duration", type=float, default=10.0, help="Secondi di misura per livello")
+    parser.add_argument("--warmup", type=float, default=2.0, help="Secondi prima della misura")
+    parser.add_argument("--rate", type=float, default=10.0, help="Frequenza topic richiesta dai client /ws")
+    parser.add_argument("--save", help="Salva i risultati come baseline (JSON)")
+    parser.add_argument("--baseline", default=BASELINE_FILE, help="Baseline da confrontare (default: quella nel repository)")
+    parser.add_argument("--tolerance", type=float, default=REGRESSION_TOLERANCE,
+                        help="Peggioramento in %% oltre il quale una metrica è una regressione")
+    parser.add_argument("--fail-on-regression", action="store_true", help="Exit 1 se ci sono regressioni")
+    parser.add_argument("--max-block-ms", type=float, help="Fallisce se il loop resta bloccato oltre questa soglia")
+    args = parser.parse_args()
+
+    sys.exit(asyncio.run(main(args)))
@@ -0,0 +1,328 @@
+"""
+BMS Ecoworthy simulato (per sviluppo e test senza batteria)
+Periferica GATT in memoria con la stessa interfaccia di BleakClient usata da
+EcoworthyBatteryMonitor: caratteristiche con o senza notify, letture,
+notifiche quando i valori cambiano e perdita del collegamento.
+
+Esegui:
+    python bms_simulator.py [--no-notify] [--duration 10]
+per confrontare ritardo dei valori e letture radio tra notifiche e polling;
+oppure avvia il backend con il driver BLE reale contro il BMS simulato:
+    BATTERY_MOCK=bms python main.py        (BATTERY_MOCK=bms-poll senza notifiche)
+
+Verifiche ripetibili (notifiche, polling di ripiego, riconnessione):
+    python bms_simulator.py --check
+"""
+
+import argparse
+import asyncio
+import math
+import struct
+import time
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+from ecoworthy_ble_service import EcoworthyBatteryMonitor
+from soc_estimator import BATTERY_INTERNAL_RESISTANCE, OCV_SOC, OCV_VOLTS
+
+
+class SimulatedCharacteristic:
+    def __init__(self, uuid: str, properties: List[str]):
+        self.uuid = uuid
+        self.properties = properties
+
+
+class SimulatedServices:
+    def __init__(self, characteristics: Dict[str, SimulatedCharacteristic]):
+        self.characteristics = characteristics
+
+    def get_characteristic(self, uuid: str) -> Optional[SimulatedCharacteristic]:
+        return self.characteristics.get(uuid)
+
+
+class SimulatedBms:
+    """Periferica: valori che variano nel tempo, notificati ogni `interval` se cambiati"""
+
+    def __init__(self, notify: bool = True, interval: float = 0.5, capacity_ah: float = 100.0):
+        """
+        Args:
+            notify: False per un BMS che supporta solo le letture
+            interval: Secondi tra un ciclo di misura e il successivo
+            capacity_ah: Capacità reale del pacco simulato
+        """
+        self.notify = notify
+        self.interval = interval
+        self.capacity_ah = capacity_ah
+        self.soc = 0.85
+        self.started = self.last = time.monotonic()
+        self.uuids = {
+            field: getattr(EcoworthyBatteryMonitor, uuid_attr)
+            for field, (uuid_attr, _, _) in EcoworthyBatteryMonitor.CHARACTERISTICS.items()
+        }
+        self.measure()
+
+    def client(self, disconnected_callback: Optional[Callable] = None) -> "SimulatedBmsClient":
+        """Factory per EcoworthyBatteryMonitor(client_factory=...)"""
+        return SimulatedBmsClient(self, disconnected_callback)
+
+    def values(self) -> Dict[str, float]:
+        """Misure correnti: carico che oscilla, SoC integrato dalla corrente"""
+        now = time.monotonic()
+        t = now - self.started
+        current = -8 + 6 * math.sin(t / 7)
+        self.soc = min(1.0, max(0.0, self.soc + current * (now - self.last) / 3600 / self.capacity_ah))
+        self.last = now
+        ocv = float(np.interp(self.soc, OCV_SOC, OCV_VOLTS))
+        return {
+            "voltage": ocv + current * BATTERY_INTERNAL_RESISTANCE,
+            "current": current,
+            "soc": int(self.soc * 100),
+            "temperature": 24 + 2 * math.sin(t / 90),
+        }
+
+    def measure(self):
+        """Ciclo di misura: aggiorna i registri letti e notificati"""
+        self.measured = self.values()
+        self.measured_at = time.monotonic()
+
+    def encode(self, field: str, value: float) -> bytearray:
+        _, fmt, scale = EcoworthyBatteryMonitor.CHARACTERISTICS[field]
+        return bytearray(struct.pack(fmt, int(round(value / scale))))
+
+
+class SimulatedBmsClient:
+    """Sottoinsieme di BleakClient usato dal driver"""
+
+    def __init__(self, bms: SimulatedBms, disconnected_callback: Optional[Callable]):
+        self.bms = bms
+        self.disconnected_callback = disconnected_callback
+        self.is_connected = False
+        self.reads = 0
+        self.callbacks: Dict[str, Callable] = {}
+        self.task: Optional[asyncio.Task] = None
+        properties = ["read", "notify"] if bms.notify else ["read"]
+        self.services = SimulatedServices({
+            uuid: SimulatedCharacteristic(uuid, properties) for uuid in bms.uuids.values()
+        })
+
+    async def connect(self):
+        await asyncio.sleep(0.05)
+        self.is_connected = True
+        self.task = asyncio.create_task(self._measure_loop())
+        return True
+
+    async def disconnect(self):
+        self._close()
+        return True
+
+    def drop(self):
+        """Simula la perdita del collegamento (batteria fuori portata)"""
+        self._close()
+        if self.disconnected_callback:
+            self.disconnected_callback(self)
+
+    def _close(self):
+        self.is_connected = False
+        self.callbacks.clear()
+        if self.task:
+            self.task.cancel()
+
+    async def read_gatt_char(self, uuid: str) -> bytearray:
+        if not self.is_connected:
+            raise ConnectionError("Periferica non connessa")
+        await asyncio.sleep(0.02)  # andata e ritorno radio
+        self.reads += 1
+        field = next(field for field, field_uuid in self.bms.uuids.items() if field_uuid == uuid)
+        return self.bms.encode(field, self.bms.measured[field])
+
+    async def start_notify(self, uuid: str, callback: Callable):
+        characteristic = self.services.get_characteristic(uuid)
+        if characteristic is None or "notify" not in characteristic.properties:
+            raise ValueError(f"Notify non supportato su {uuid}")
+        self.callbacks[uuid] = callback
+
+    async def stop_notify(self, uuid: str):
+        self.callbacks.pop(uuid, None)
+
+    async def _measure_loop(self):
+        """Notifica i campi cambiati ad ogni ciclo di misura del BMS"""
+        last: Dict[str, bytearray] = {}
+        while self.is_connected:
+            self.bms.measure()
+            for field, value in self.bms.measured.items():
+                uuid = self.bms.uuids[field]
+                data = self.bms.encode(field, value)
+                callback = self.callbacks.get(uuid)
+                if callback and data != last.get(field):
+                    last[field] = data
+                    callback(self.services.get_characteristic(uuid), data)
+            await asyncio.sleep(self.bms.interval)
+
+
+def simulated_monitor(notify: bool = True):
+    """Classe driver per battery_service: EcoworthyBatteryMonitor sul BMS simulato"""
+    bms = SimulatedBms(notify=notify)
+
+    def create(device_name: str = "Ecoworthy", device_address: Optional[str] = None):
+        return EcoworthyBatteryMonitor(device_name, device_address, client_factory=bms.client)
+    return create
+
+
+async def main(args):
+    bms = SimulatedBms(notify=not args.no_notify)
+    monitor = EcoworthyBatteryMonitor(client_factory=bms.client)
+    await monitor.connect()
+
+    # Età dei valori mostrati (dal ciclo di misura del BMS), campionata a 10 Hz
+    shown_at = [bms.measured_at]
+    ages: List[float] = []
+
+    async def probe():
+        while True:
+            await asyncio.sleep(0.1)
+            ages.append(time.monotonic() - shown_at[0])
+
+    probe_task = asyncio.create_task(probe())
+
+    # Stesso schema del loop di battery_service: notifiche o polling ogni 2s
+    updates = 0
+    end = time.monotonic() + args.duration
+    while time.monotonic() < end:
+        if monitor.notifying:
+            if not await monitor.wait_update(2.0):
+                continue
+        else:
+            await asyncio.sleep(2.0)
+            await monitor.read_all_data()
+        shown_at[0] = bms.measured_at
+        updates += 1
+
+    probe_task.cancel()
+    print(f"Modalità: {monitor.update_mode}")
+    print(f"Aggiornamenti: {updates} in {args.duration:g}s, letture radio: {monitor.reads}, notifiche: {monitor.notifications}")
+    print(f"Età media dei valori: {sum(ages) / len(ages) * 1000:.0f}ms (max {max(ages) * 1000:.0f}ms)")
+    await monitor.disconnect()
+
+
+# ==================== VERIFICHE ====================
+
+async def check_notify():
+    """Con notify gli aggiornamenti arrivano senza letture radio dopo quelle iniziali"""
+    bms = SimulatedBms(notify=True, interval=0.1)
+    monitor = EcoworthyBatteryMonitor(client_factory=bms.client)
+    assert await monitor.connect(), "connessione fallita"
+    try:
+        assert monitor.update_mode == "notify" and not monitor.polled, f"modalità {monitor.update_mode}"
+        reads = monitor.reads
+        updates = 0
+        for _ in range(5):
+            updates += await monitor.wait_update(1.0)
+        assert updates == 5, f"{updates}/5 aggiornamenti via notifica"
+        assert monitor.reads == reads, f"{monitor.reads - reads} letture radio in modalità notify"
+        assert await monitor.read_all_data() and monitor.reads == reads, "read_all_data ha letto campi notificati"
+        assert monitor.battery_data["status"] == "connected" and monitor.battery_data["voltage"] is not None
+    finally:
+        await monitor.disconnect()
+    print(f"✓ Notify: 5 aggiornamenti, {monitor.notifications} notifiche, nessuna lettura radio")
+
+
+async def check_poll_fallback():
+    """BMS senza notify (--no-notify): tutti i campi in polling, nessuna notifica"""
+    bms = SimulatedBms(notify=False, interval=0.1)
+    monitor = EcoworthyBatteryMonitor(client_factory=bms.client)
+    assert await monitor.connect(), "connessione fallita"
+    try:
+        assert monitor.update_mode == "poll", f"modalità {monitor.update_mode}"
+        assert monitor.polled == set(EcoworthyBatteryMonitor.CHARACTERISTICS)
+        assert not await monitor.wait_update(0.3), "notifica da un BMS senza notify"
+
+        reads = monitor.reads
+        before = bms.measured_at
+        await asyncio.sleep(0.25)
+        data = await monitor.read_all_data()
+        assert monitor.reads - reads == len(EcoworthyBatteryMonitor.CHARACTERISTICS), "letture mancanti"
+        assert bms.measured_at > before and data["voltage"] is not None
+        assert monitor.notifications == 0
+    finally:
+        await monitor.disconnect()
+    print("✓ Polling di ripiego senza notify")
+
+
+async def check_drop_reconnect():
+    """drop(): il driver sveglia chi attende, il loop del servizio segnala e riconnette"""
+    import battery_service
+
+    bms = SimulatedBms(notify=True, interval=0.1)
+    clients: List[SimulatedBmsClient] = []
+
+    def factory(disconnected_callback):
+        clients.append(bms.client(disconnected_callback))
+        return clients[-1]
+
+    monitor = EcoworthyBatteryMonitor(client_factory=factory)
+    assert await monitor.connect(), "connessione fallita"
+
+    # Driver: la perdita del collegamento interrompe subito l'attesa
+    waiting = asyncio.create_task(monitor.wait_update(5.0))
+    await asyncio.sleep(0.05)
+    started = time.monotonic()
+    clients[-1].drop()
+    assert not await waiting, "wait_update ha segnalato dati dopo la disconnessione"
+    assert time.monotonic() - started < 1.0, "wait_update non svegliato dalla disconnessione"
+    assert not monitor.is_connected and monitor.battery_data["status"] == "disconnected"
+
+    # Servizio: il loop di monitoraggio riconnette e riprende le notifiche
+    broadcasts: List[bool] = []
+    broadcast = battery_service.broadcast_battery_update
+
+    async def record_broadcast():
+        broadcasts.append(monitor.is_connected)
+        await broadcast()
+
+    battery_service.broadcast_battery_update = record_broadcast
+    battery_service.BATTERY_RECONNECT_DELAY = 0.2
+    battery_service.battery_monitor = monitor
+    loop = asyncio.create_task(battery_service.battery_monitoring_loop())
+    try:
+        deadline = time.monotonic() + 3.0
+        while not monitor.is_connected and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        assert monitor.is_connected and len(clients) == 2, "nessuna riconnessione"
+        assert monitor.update_mode == "notify", f"modalità {monitor.update_mode} dopo la riconnessione"
+
+        notifications = monitor.notifications
+        await asyncio.sleep(0.5)
+        assert monitor.notifications > notifications, "notifiche non riprese dopo la riconnessione"
+
+        # Seconda caduta con il loop attivo: stato "disconnected" e nuova riconnessione
+        broadcasts.clear()
+        clients[-1].drop()
+        deadline = time.monotonic() + 3.0
+        while not (len(clients) == 3 and monitor.is_connected) and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        assert len(clients) == 3 and monitor.is_connected, "seconda riconnessione mancata"
+        assert False in broadcasts, "stato disconnected non inviato ai client"
+    finally:
+        loop.cancel()
+        await asyncio.gather(loop, return_exceptions=True)
+        await monitor.disconnect()
+        battery_service.battery_monitor = None
+        battery_service.broadcast_battery_update = broadcast
+    print("✓ drop(): attesa interrotta, stato pubblicato, riconnessione dal loop del servizio")
+
+
+async def run_checks():
+    await check_notify()
+    await check_poll_fallback()
+    await check_drop_reconnect()
+    print("✓ Verifiche BMS simulato superate")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="BMS Ecoworthy simulato")
+    parser.add_argument("--no-notify", action="store_true", help="BMS senza notifiche (solo polling)")
+    parser.add_argument("--duration", type=float, default=10.0, help="Secondi di prova")
+    parser.add_argument("--check", action="store_true", help="Verifiche ripetibili ed esce")
+    args = parser.parse_args()
+    asyncio.run(run_checks() if args.check else main(args))
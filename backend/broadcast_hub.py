@@ -0,0 +1,293 @@
+"""
+Hub di broadcast WebSocket con backpressure
+Ogni connessione ha un proprio task di scrittura e una coda limitata:
+un client lento non blocca più il loop di simulazione né gli altri schermi.
+
+Politica code:
+- i frame con chiave (es. "state") sono "latest-value-wins": un nuovo frame
+  con la stessa chiave sostituisce quello ancora in coda (coalesced, non è
+  una perdita: il client riceverà comunque il valore più recente)
+- i frame senza chiave vengono sempre accodati
+- a coda piena si scarta il frame più vecchio (drop)
+- un client viene espulso se un invio supera `send_timeout` oppure se
+  accumula `max_pending_drops` drop per coda piena senza riuscire a inviare
+- un errore nella funzione di rendering scollega il client (niente writer
+  morto con il client ancora registrato)
+
+Ogni frame viene serializzato una sola volta in `publish()` e lo stesso
+buffer viene inviato a tutte le connessioni.
+"""
+
+import asyncio
+import time
+from collections import deque
+from typing import Any, Callable, Dict, Optional, Set, Union
+
+from fastapi import WebSocket
+
+from metrics import ws_send_seconds
+
+try:
+    import orjson
+
+    def encode_json(payload: Any) -> str:
+        """Serializza un payload JSON (orjson)"""
+        return orjson.dumps(payload).decode()
+
+except ImportError:
+    import json
+
+    def encode_json(payload: Any) -> str:
+        """Serializza un payload JSON (fallback libreria standard)"""
+        return json.dumps(payload, separators=(",", ":"), ensure_ascii=False)
+
+# Un frame è un payload (dict da serializzare, str JSON già serializzato,
+# bytes per frame binari) oppure una funzione che lo calcola al momento
+# dell'invio per la singola connessione (None = niente da inviare)
+Payload = Union[Dict[str, Any], str, bytes]
+Frame = Union[Payload, Callable[["HubConnection"], Optional[Payload]]]
+
+
+class HubConnection:
+    """Connessione registrata sull'hub, con la sua coda e le sue statistiche"""
+
+    def __init__(self, hub: "BroadcastHub", websocket: WebSocket, context: Any = None):
+        self.hub = hub
+        self.websocket = websocket
+        self.context = context
+        self.queue: deque = deque()
+        self.ready = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+        self.closed = False
+
+        self.sent = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.late = 0
+        self.pending_drops = 0
+
+    def send(self, frame: Frame, key: Optional[str] = None):
+        """
+        Accoda un frame per questa connessione (non bloccante)
+
+        Args:
+            frame: Payload o funzione di rendering
+            key: Chiave per la sostituzione latest-value-wins
+        """
+        if self.closed:
+            return
+
+        now = time.monotonic()
+
+        if key is not None:
+            for index, (queued_key, _, _) in enumerate(self.queue):
+                if queued_key == key:
+                    # Mantiene l'istante del frame più vecchio per misurare il ritardo reale
+                    self.queue[index] = (key, frame, self.queue[index][2])
+                    self.coalesced += 1
+                    self.hub.coalesced += 1
+                    return
+
+        if len(self.queue) >= self.hub.queue_size:
+            self.queue.popleft()
+            self._count_drop()
+
+        self.queue.append((key, frame, now))
+        self.ready.set()
+
+    def _count_drop(self):
+        self.dropped += 1
+        self.pending_drops += 1
+        self.hub.dropped += 1
+
+        if self.pending_drops >= self.hub.max_pending_drops:
+            self.hub.evict(self, "troppi frame scartati")
+
+
+class BroadcastHub:
+    """Fan-out concorrente verso un insieme di connessioni WebSocket"""
+
+    def __init__(
+        self,
+        name: str,
+        queue_size: int = 8,
+        send_timeout: float = 2.0,
+        late_after: float = 0.25,
+        max_pending_drops: int = 20
+    ):
+        self.name = name
+        self.queue_size = queue_size
+        self.send_timeout = send_timeout
+        self.late_after = late_after
+        self.max_pending_drops = max_pending_drops
+
+        self.connections: Dict[int, HubConnection] = {}
+        self.closing: Set[asyncio.Task] = set()
+        self.send_seconds = ws_send_seconds.labels(name)
+
+        # Contatori cumulativi
+        self.sent = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.late = 0
+        self.evicted = 0
+        self.errors = 0
+
+    def __len__(self) -> int:
+        return len(self.connections)
+
+    # ==================== CONNESSIONI ====================
+
+    def register(self, websocket: WebSocket, context: Any = None) -> HubConnection:
+        """
+        Registra una connessione già accettata e avvia il suo writer
+
+        Args:
+            websocket: Connessione WebSocket
+            context: Stato di protocollo associato (es. VehicleStreamClient)
+
+        Returns:
+            HubConnection: Handle della connessione
+        """
+        connection = HubConnection(self, websocket, context)
+        # Writer per connessione, non supervisionato: vive quanto il client (sarebbero
+        # centinaia di voci in /api/debug/tasks) e termina da solo sugli errori di invio
+        connection.task = asyncio.create_task(self._writer(connection))
+        self.connections[id(connection)] = connection
+        return connection
+
+    def unregister(self, connection: HubConnection):
+        """Rimuove la connessione e ferma il suo writer"""
+        connection.closed = True
+        connection.queue.clear()
+        self.connections.pop(id(connection), None)
+
+        if connection.task and not connection.task.done() and connection.task is not asyncio.current_task():
+            connection.task.cancel()
+
+    def evict(self, connection: HubConnection, reason: str):
+        """Espelle un client troppo lento chiudendo la sua connessione"""
+        if connection.closed:
+            return
+
+        self.evicted += 1
+        print(f"⚠️  WebSocket {self.name} espulso: {reason}")
+        self._disconnect(connection)
+
+    def _disconnect(self, connection: HubConnection):
+        """Rimuove la connessione e chiude il WebSocket in background"""
+        self.unregister(connection)
+        # Chiusura una tantum (_close ignora gli errori): riferimento tenuto fino alla fine
+        task = asyncio.create_task(self._close(connection.websocket))
+        self.closing.add(task)
+        task.add_done_callback(self.closing.discard)
+
+    async def close_all(self):
+        """Chiude tutte le connessioni (shutdown)"""
+        for connection in list(self.connections.values()):
+            self.unregister(connection)
+            await self._close(connection.websocket)
+
+    # ==================== BROADCAST ====================
+
+    def publish(self, frame: Frame, key: Optional[str] = None):
+        """
+        Accoda un frame per tutte le connessioni (non bloccante)
+
+        Args:
+            frame: Payload o funzione di rendering per connessione
+            key: Chiave per la sostituzione latest-value-wins
+        """
+        if not self.connections:
+            return
+
+        if isinstance(frame, dict):
+            frame = encode_json(frame)
+
+        for connection in list(self.connections.values()):
+            connection.send(frame, key)
+
+    def stats(self) -> Dict[str, Any]:
+        """Contatori dell'hub e delle singole connessioni"""
+        return {
+            "connections": len(self.connections),
+            "sent": self.sent,
+            "dropped": self.dropped,
+            "coalesced": self.coalesced,
+            "late": self.late,
+            "evicted": self.evicted,
+            "errors": self.errors,
+            "clients": [
+                {
+                    "queued": len(connection.queue),
+                    "sent": connection.sent,
+                    "dropped": connection.dropped,
+                    "coalesced": connection.coalesced,
+                    "late": connection.late
+                }
+                for connection in self.connections.values()
+            ]
+        }
+
+    # ==================== WRITER ====================
+
+    async def _writer(self, connection: HubConnection):
+        """Task di scrittura dedicato a una connessione"""
+        try:
+            while not connection.closed:
+                if not connection.queue:
+                    connection.ready.clear()
+                    await connection.ready.wait()
+                    continue
+
+                _, frame, queued_at = connection.queue.popleft()
+                started = time.perf_counter()
+                try:
+                    payload = frame(connection) if callable(frame) else frame
+                except Exception as e:
+                    # Rendering fallito: stato del protocollo non più affidabile, il client si riconnette
+                    print(f"❌ Errore rendering frame WebSocket {self.name}: {type(e).__name__}: {e}")
+                    self.errors += 1
+                    self._disconnect(connection)
+                    return
+                if payload is None:
+                    continue
+
+                if isinstance(payload, bytes):
+                    send = connection.websocket.send_bytes(payload)
+                elif isinstance(payload, str):
+                    send = connection.websocket.send_text(payload)
+                else:
+                    send = connection.websocket.send_text(encode_json(payload))
+
+                try:
+                    # asyncio.timeout non crea un task per ogni invio (wait_for sì)
+                    async with asyncio.timeout(self.send_timeout):
+                        await send
+                except TimeoutError:
+                    self.evict(connection, f"invio oltre {self.send_timeout}s")
+                    return
+                except Exception as e:
+                    print(f"Errore invio WebSocket {self.name}: {e}")
+                    self.errors += 1
+                    self.unregister(connection)
+                    return
+
+                connection.sent += 1
+                connection.pending_drops = 0
+                self.sent += 1
+                self.send_seconds.observe(time.perf_counter() - started)
+
+                if time.monotonic() - queued_at > self.late_after:
+                    connection.late += 1
+                    self.late += 1
+
+        except asyncio.CancelledError:
+            pass
+
+    @staticmethod
+    async def _close(websocket: WebSocket):
+        try:
+            await websocket.close(code=1013)
+        except Exception:
+            pass
@@ -0,0 +1,322 @@
+"""
+Dati veicolo da bus CAN (VEHICLE_SOURCE=can)
+Un thread legge i frame dal bus (SocketCAN, o il bus virtuale di python-can
+per i test) e li decodifica con una tabella di segnali indicizzata per
+arbitration ID; per ogni segnale conserva solo l'ultimo valore. Un task
+sull'event loop applica i valori a CamperState a lotti ogni BATCH_INTERVAL,
+rispettando una frequenza massima per segnale: l'event loop lavora una volta
+per lotto, non per frame, anche con migliaia di frame al secondo.
+
+Segnali di default: PGN J1939 (byte order Intel) dei mezzi su base
+camion/furgone. Tabella personalizzata con CAN_SIGNAL_FILE (JSON):
+    {"0x0CF00400": [{"name": "engine_speed", "field": "rpm",
+                     "start_bit": 24, "length": 16, "scale": 0.125, "max_hz": 30}]}
+
+Configurazione:
+    CAN_INTERFACE=socketcan   (virtual per i test)
+    CAN_CHANNEL=can0
+
+Installazione: pip install python-can
+"""
+
+import asyncio
+import json
+import os
+import threading
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+try:
+    import can
+    CAN_AVAILABLE = True
+except ImportError:
+    can = None
+    CAN_AVAILABLE = False
+
+from task_supervisor import task_supervisor
+from vehicle_state import CamperState
+
+CAN_INTERFACE = os.getenv("CAN_INTERFACE", "socketcan")
+CAN_CHANNEL = os.getenv("CAN_CHANNEL", "can0")
+CAN_SIGNAL_FILE = os.getenv("CAN_SIGNAL_FILE")
+
+# Cadenza di applicazione dei valori decodificati a CamperState (come lo stream gauge)
+BATCH_INTERVAL = 1 / 30
+
+# Attesa massima di un frame (il thread controlla così la richiesta di stop)
+RECV_TIMEOUT = 0.5
+
+# Sopra questi giri il motore è considerato acceso
+ENGINE_RUNNING_RPM = 300
+
+
+class CanSignal:
+    """Segnale little-endian (Intel) dentro il payload di un frame"""
+
+    def __init__(self, name: str, field: str, start_bit: int, length: int,
+                 scale: float = 1.0, offset: float = 0.0, signed: bool = False,
+                 max_hz: float = 10.0):
+        """
+        Args:
+            name: Nome del segnale (es. "engine_speed")
+            field: Campo di CamperState alimentato
+            start_bit: Bit meno significativo nel payload (0 = bit 0 del byte 0)
+            length: Lunghezza in bit
+            scale, offset: valore = grezzo * scale + offset
+            signed: Grezzo in complemento a due
+            max_hz: Frequenza massima di aggiornamento di CamperState
+        """
+        self.name = name
+        self.field = field
+        self.start_bit = start_bit
+        self.length = length
+        self.scale = scale
+        self.offset = offset
+        self.signed = signed
+        self.max_hz = max_hz
+        self.min_interval = 1 / max_hz if max_hz > 0 else 0.0
+        self.mask = (1 << length) - 1
+
+    def decode(self, payload: int) -> Optional[float]:
+        """
+        Valore fisico dal payload (intero little-endian)
+
+        Returns:
+            float | None: None se il segnale vale "non disponibile" (tutti 1, J1939)
+        """
+        raw = (payload >> self.start_bit) & self.mask
+        if self.signed:
+            if raw & (1 << (self.length - 1)):
+                raw -= 1 << self.length
+        elif raw == self.mask and self.length >= 8:
+            return None
+        return raw * self.scale + self.offset
+
+
+# Arbitration ID (29 bit, J1939) -> segnali del frame
+DEFAULT_SIGNALS: Dict[int, Tuple[CanSignal, ...]] = {
+    # EEC1 (PGN 61444) dalla centralina motore: giri
+    0x0CF00400: (CanSignal("engine_speed", "rpm", 24, 16, scale=0.125, max_hz=30),),
+    # CCVS1 (PGN 65265): velocità alle ruote
+    0x18FEF100: (CanSignal("wheel_speed", "speed", 8, 16, scale=1 / 256, max_hz=30),),
+    # DD1 (PGN 65276) dal quadro strumenti: livello carburante
+    0x18FEFC17: (CanSignal("fuel_level", "fuel_level", 8, 8, scale=0.4, max_hz=1),),
+    # VEP1 (PGN 65271): tensione batteria motore
+    0x18FEF700: (CanSignal("battery_potential", "battery_main", 32, 16, scale=0.05, max_hz=2),),
+    # AMB (PGN 65269): temperatura esterna
+    0x18FEF500: (CanSignal("ambient_temperature", "temperature_outside", 24, 16,
+                           scale=0.03125, offset=-273, max_hz=0.5),),
+}
+
+
+def load_signal_table(path: str) -> Dict[int, Tuple[CanSignal, ...]]:
+    """Tabella dei segnali da file JSON (chiavi: arbitration ID esadecimali)"""
+    with open(path) as f:
+        data = json.load(f)
+    return {
+        int(arbitration_id, 0): tuple(CanSignal(**signal) for signal in signals)
+        for arbitration_id, signals in data.items()
+    }
+
+
+class CanDecoder:
+    """Decodifica i frame e conserva l'ultimo valore di ogni segnale (thread-safe)"""
+
+    def __init__(self, table: Dict[int, Tuple[CanSignal, ...]]):
+        self.table = table
+        self.lock = threading.Lock()
+        self.latest: Dict[str, float] = {}
+
+        self.frames = 0
+        self.unknown = 0
+        self.unavailable = 0
+
+    def feed(self, arbitration_id: int, data: bytes):
+        """Decodifica un frame (chiamato dal thread di lettura)"""
+        self.frames += 1
+        signals = self.table.get(arbitration_id)
+        if signals is None:
+            self.unknown += 1
+            return
+
+        payload = int.from_bytes(data, "little")
+        with self.lock:
+            for signal in signals:
+                value = signal.decode(payload)
+                if value is None:
+                    self.unavailable += 1
+                else:
+                    self.latest[signal.name] = value
+
+    def take(self) -> Dict[str, float]:
+        """Valori arrivati dall'ultima chiamata (uno per segnale)"""
+        with self.lock:
+            latest, self.latest = self.latest, {}
+        return latest
+
+
+class CanSource:
+    """Lettura dal bus e applicazione a lotti su CamperState"""
+
+    def __init__(self, state: CamperState,
+                 table: Optional[Dict[int, Tuple[CanSignal, ...]]] = None,
+                 interface: str = CAN_INTERFACE, channel: str = CAN_CHANNEL,
+                 on_batch: Optional[Callable[[], Awaitable[None]]] = None):
+        """
+        Args:
+            state: Stato da alimentare
+            table: Segnali per arbitration ID (default: CAN_SIGNAL_FILE o DEFAULT_SIGNALS)
+            interface, channel: Bus python-can
+            on_batch: Chiamata dopo ogni lotto che ha modificato lo stato
+        """
+        if table is None:
+            table = load_signal_table(CAN_SIGNAL_FILE) if CAN_SIGNAL_FILE else DEFAULT_SIGNALS
+
+        self.state = state
+        self.interface = interface
+        self.channel = channel
+        self.on_batch = on_batch
+        self.decoder = CanDecoder(table)
+        self.signals = {signal.name: signal for signals in table.values() for signal in signals}
+
+        # Valori trattenuti dal limite di frequenza e ultimo aggiornamento per segnale
+        self.pending: Dict[str, float] = {}
+        self.applied_at: Dict[str, float] = {}
+
+        self.bus = None
+        self.thread: Optional[threading.Thread] = None
+        self.stopping = threading.Event()
+
+        self.errors = 0
+        self.batches = 0
+        self.updates = 0
+        self.last_frame_at: Optional[float] = None
+
+    # ==================== LIFECYCLE ====================
+
+    async def start(self):
+        """
+        Apre il bus e avvia thread di lettura e task di applicazione
+
+        Raises:
+            RuntimeError: se python-can non è installato
+            can.CanError / OSError: se il bus non si apre
+        """
+        if not CAN_AVAILABLE:
+            raise RuntimeError("Libreria python-can non installata. Esegui: pip install python-can")
+
+        self.bus = await asyncio.to_thread(can.Bus, interface=self.interface, channel=self.channel)
+        self.stopping.clear()
+        self.thread = threading.Thread(target=self._read_loop, name="can-reader", daemon=True)
+        self.thread.start()
+        task_supervisor.spawn("can_apply", self._apply_loop)
+        print(f"✓ Bus CAN {self.interface}:{self.channel} ({len(self.decoder.table)} ID, {len(self.signals)} segnali)")
+
+    async def stop(self):
+        self.stopping.set()
+        await task_supervisor.cancel("can_apply")
+        if self.thread:
+            await asyncio.to_thread(self.thread.join, RECV_TIMEOUT * 2)
+        if self.bus:
+            self.bus.shutdown()
+        self.thread = None
+        self.bus = None
+
+    # ==================== LETTURA (THREAD) ====================
+
+    def _read_loop(self):
+        decoder = self.decoder
+        while not self.stopping.is_set():
+            try:
+                message = self.bus.recv(timeout=RECV_TIMEOUT)
+            except Exception as e:
+                if self.stopping.is_set():
+                    break
+                self.errors += 1
+                print(f"❌ Errore lettura CAN: {e}")
+                time.sleep(1.0)
+                continue
+
+            if message is None:
+                continue
+            if message.is_error_frame or message.is_remote_frame:
+                self.errors += 1
+                continue
+            decoder.feed(message.arbitration_id, message.data)
+            self.last_frame_at = time.time()
+
+    # ==================== APPLICAZIONE (EVENT LOOP) ====================
+
+    async def _apply_loop(self):
+        while True:
+            await asyncio.sleep(BATCH_INTERVAL)
+            self.pending.update(self.decoder.take())
+            if self.apply(time.monotonic()) and self.on_batch:
+                await self.on_batch()
+
+    def apply(self, now: float) -> int:
+        """
+        Scrive su CamperState i valori il cui segnale non ha superato la frequenza massima
+
+        Returns:
+            int: Segnali applicati
+        """
+        applied = 0
+        for name in list(self.pending):
+            signal = self.signals[name]
+            if now - self.applied_at.get(name, float("-inf")) < signal.min_interval:
+                continue
+
+            value = self.pending.pop(name)
+            setattr(self.state, signal.field, value)
+            if signal.field == "rpm":
+                self.state.engine_running = value >= ENGINE_RUNNING_RPM
+            self.applied_at[name] = now
+            applied += 1
+
+        if applied:
+            self.batches += 1
+            self.updates += applied
+        return applied
+
+    # ==================== STATISTICHE ====================
+
+    def counters(self) -> Dict[str, int]:
+        decoder = self.decoder
+        return {
+            "decoded": decoder.frames - decoder.unknown,
+            "unknown": decoder.unknown,
+            "unavailable": decoder.unavailable,
+            "errors": self.errors,
+        }
+
+    def stats(self) -> Dict:
+        return {
+            "source": "can",
+            "interface": self.interface,
+            "channel": self.channel,
+            "frames": self.decoder.frames,
+            **self.counters(),
+            "batches": self.batches,
+            "updates": self.updates,
+            "pending": len(self.pending),
+            "last_frame_at": self.last_frame_at,
+            "signals": {
+                name: {"field": signal.field, "max_hz": signal.max_hz}
+                for name, signal in self.signals.items()
+            },
+        }
+
+
+def encode_signal(signal: CanSignal, value: float, payload: int = 0) -> int:
+    """Inserisce un valore fisico nel payload (per test e generatori di traffico)"""
+    raw = int(round((value - signal.offset) / signal.scale)) & signal.mask
+    return (payload & ~(signal.mask << signal.start_bit)) | (raw << signal.start_bit)
+
+
+def encode_frame(signals: List[Tuple[CanSignal, float]], length: int = 8) -> bytes:
+    """Payload di un frame con i valori indicati (byte non usati a 0xFF, come J1939)"""
+    payload = (1 << (length * 8)) - 1
+    for signal, value in signals:
+        payload = encode_signal(signal, value, payload)
+    return payload.to_bytes(length, "little")
@@ -1,7 +1,214 @@
+"""
+Driver BLE per la batteria Ecoworthy (BMS con servizio GATT)
+Le caratteristiche che supportano notify/indicate vengono sottoscritte alla
+connessione: il BMS invia i nuovi valori appena cambiano e il monitoraggio li
+applica subito, senza tenere occupata la radio con letture periodiche.
+Solo le caratteristiche senza notify vengono lette a intervalli (polling).
+
+Dipendenze: pip install bleak
+Test senza batteria: bms_simulator.py (periferica simulata, stessa interfaccia
+di BleakClient)
+"""
+
+import asyncio
+import contextlib
+import struct
+import time
+from typing import Callable, Dict, Optional, Set
+
+# Finestra di raccolta delle notifiche dello stesso ciclo del BMS (secondi)
+NOTIFY_COALESCE = 0.05
+
+# Timeout della scansione BLE (secondi)
+SCAN_TIMEOUT = 10.0
+
+
 class EcoworthyBatteryMonitor:
     # SOSTITUISCI QUESTI UUID CON QUELLI DELLA TUA BATTERIA
-    BATTERY_SERVICE_UUID = "0000fff0-..."  # Dal tuo nRF Connect
-    VOLTAGE_CHAR_UUID = "0000fff1-..."
-    CURRENT_CHAR_UUID = "0000fff2-..."
-    SOC_CHAR_UUID = "0000fff3-..."
-    TEMP_CHAR_UUID = "0000fff4-..."
\ No newline at end of file
+    BATTERY_SERVICE_UUID = "0000fff0-0000-1000-8000-00805f9b34fb"  # Dal tuo nRF Connect
+    VOLTAGE_CHAR_UUID = "0000fff1-0000-1000-8000-00805f9b34fb"
+    CURRENT_CHAR_UUID = "0000fff2-0000-1000-8000-00805f9b34fb"
+    SOC_CHAR_UUID = "0000fff3-0000-1000-8000-00805f9b34fb"
+    TEMP_CHAR_UUID = "0000fff4-0000-1000-8000-00805f9b34fb"
+
+    # Campo -> (attributo UUID, formato struct little endian, scala)
+    # ADATTA formato e scala al protocollo della tua batteria
+    CHARACTERISTICS = {
+        "voltage": ("VOLTAGE_CHAR_UUID", "<H", 0.01),     # centesimi di V
+        "current": ("CURRENT_CHAR_UUID", "<h", 0.01),     # centesimi di A, negativo in scarica
+        "soc": ("SOC_CHAR_UUID", "<B", 1),                # %
+        "temperature": ("TEMP_CHAR_UUID", "<h", 0.1),     # decimi di °C
+    }
+
+    def __init__(self, device_name: str = "Ecoworthy", device_address: Optional[str] = None,
+                 client_factory: Optional[Callable] = None):
+        """
+        Args:
+            device_name: Nome BLE usato per la scansione
+            device_address: MAC address (salta la scansione)
+            client_factory: Crea il client GATT dato il disconnected_callback
+                            (default: BleakClient; bms_simulator per i test)
+        """
+        self.device_name = device_name
+        self.device_address = device_address
+        self.client_factory = client_factory
+        self.client = None
+        self.is_connected = False
+
+        # Campi aggiornati via notifica e campi letti a intervalli
+        self.notifying: Set[str] = set()
+        self.polled: Set[str] = set(self.CHARACTERISTICS)
+
+        self.updated = asyncio.Event()
+        self.notifications = 0
+        self.reads = 0
+        self.last_update: Optional[float] = None
+
+        self.battery_data = {
+            "voltage": None,
+            "current": None,
+            "soc": None,
+            "temperature": None,
+            "power": None,
+            "status": "disconnected",
+            "update_mode": None,
+        }
+
+    # ==================== CONNESSIONE ====================
+
+    async def connect(self) -> bool:
+        """Connette, sottoscrive le notifiche e legge i valori iniziali"""
+        try:
+            self.client = await self._open_client()
+        except Exception as e:
+            print(f"❌ Connessione BLE fallita: {e}")
+            self.client = None
+        if self.client is None:
+            self.battery_data["status"] = "not_found"
+            return False
+
+        self.is_connected = True
+        try:
+            await self._subscribe()
+
+            # Valori iniziali anche per i campi notificati (il BMS li invia al prossimo cambio)
+            await self._read_fields(self.CHARACTERISTICS)
+        except Exception:
+            # Niente stato a metà: annulla sottoscrizioni e collegamento (l'errore resta quello originale)
+            with contextlib.suppress(Exception):
+                await self.disconnect()
+            raise
+        self.battery_data["status"] = "connected"
+        self.battery_data["update_mode"] = self.update_mode
+        print(f"✓ Batteria connessa (aggiornamenti: {self.update_mode})")
+        return True
+
+    async def _open_client(self):
+        if self.client_factory is not None:
+            client = self.client_factory(self._on_disconnect)
+        else:
+            from bleak import BleakClient, BleakScanner
+
+            target = self.device_address
+            if target is None:
+                target = await BleakScanner.find_device_by_name(self.device_name, timeout=SCAN_TIMEOUT)
+                if target is None:
+                    print(f"❌ Batteria {self.device_name} non trovata")
+                    return None
+            client = BleakClient(target, disconnected_callback=self._on_disconnect)
+
+        await client.connect()
+        return client
+
+    async def _subscribe(self):
+        """Sottoscrive le caratteristiche con notify/indicate, le altre restano in polling"""
+        self.notifying, self.polled = set(), set()
+        for field, (uuid_attr, _, _) in self.CHARACTERISTICS.items():
+            uuid = getattr(self, uuid_attr)
+            characteristic = self.client.services.get_characteristic(uuid)
+            properties = characteristic.properties if characteristic is not None else []
+            if "notify" not in properties and "indicate" not in properties:
+                self.polled.add(field)
+                continue
+            try:
+                await self.client.start_notify(uuid, self._notification_handler(field))
+                self.notifying.add(field)
+            except Exception as e:
+                print(f"⚠️  Notifiche {field} non disponibili ({e}), uso il polling")
+                self.polled.add(field)
+
+    async def disconnect(self):
+        try:
+            if self.client is not None and self.is_connected:
+                for field in self.notifying:
+                    try:
+                        await self.client.stop_notify(getattr(self, self.CHARACTERISTICS[field][0]))
+                    except Exception:
+                        pass
+                await self.client.disconnect()
+        finally:
+            # Stato azzerato anche se il client fallisce la disconnessione
+            self.is_connected = False
+            self.notifying = set()
+            self.battery_data["status"] = "disconnected"
+
+    def _on_disconnect(self, client):
+        """Connessione persa (callback del client): sveglia chi attende un aggiornamento"""
+        self.is_connected = False
+        self.battery_data["status"] = "disconnected"
+        self.updated.set()
+
+    @property
+    def update_mode(self) -> str:
+        if not self.notifying:
+            return "poll"
+        return "notify" if not self.polled else "mixed"
+
+    # ==================== DATI ====================
+
+    def _notification_handler(self, field: str):
+        def handle(sender, data: bytearray):
+            self._apply(field, data)
+            self.notifications += 1
+            self.updated.set()
+        return handle
+
+    def _apply(self, field: str, data: bytes):
+        _, fmt, scale = self.CHARACTERISTICS[field]
+        value = struct.unpack_from(fmt, data)[0] * scale
+        self.battery_data[field] = round(value, 3)
+
+        voltage, current = self.battery_data["voltage"], self.battery_data["current"]
+        if voltage is not None and current is not None:
+            self.battery_data["power"] = round(abs(voltage * current), 2)
+        self.last_update = time.time()
+
+    async def _read_fields(self, fields):
+        for field in fields:
+            data = await self.client.read_gatt_char(getattr(self, self.CHARACTERISTICS[field][0]))
+            self.reads += 1
+            self._apply(field, data)
+
+    async def read_all_data(self) -> Dict:
+        """Legge le caratteristiche senza notifiche (tutte se il BMS non le supporta)"""
+        if self.is_connected:
+            await self._read_fields(self.polled)
+        return self.battery_data
+
+    async def wait_update(self, timeout: float) -> bool:
+        """
+        Attende una notifica (e le altre dello stesso ciclo del BMS)
+
+        Returns:
+            bool: True se sono arrivati nuovi valori entro `timeout`
+        """
+        try:
+            await asyncio.wait_for(self.updated.wait(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        await asyncio.sleep(NOTIFY_COALESCE)
+        self.updated.clear()
+        return self.is_connected
+
+    def get_data(self) -> Dict:
+        return self.battery_data
@@ -0,0 +1,229 @@
+"""
+Emulatore ELM327 su pseudo-terminale (per sviluppo e test senza mezzo)
+Risponde ai comandi AT di base e al modo 01 con valori che variano nel
+tempo, con latenza configurabile come un adattatore reale. Le richieste
+multi-PID ricevono risposte ISO-TP multi-frame come sul CAN.
+
+Esegui:
+    python elm327_emulator.py [--latency 0.06] [--single-pid]
+e avvia il backend con la porta stampata:
+    VEHICLE_SOURCE=obd OBD_PORT=/dev/pts/N python main.py
+
+Verifiche del parser di obd_source sulle risposte dell'emulatore:
+    python elm327_emulator.py --check
+"""
+
+import argparse
+import math
+import os
+import threading
+import time
+import tty
+from typing import Dict, List, Optional
+
+from obd_source import DEFAULT_PIDS, NO_DATA_LINES, parse_mode01, supported_from_bitmap
+
+# PID del modo 01 risposti dall'emulatore (0x46 volutamente assente)
+SUPPORTED_PIDS = (0x05, 0x0C, 0x0D, 0x20, 0x2F, 0x40, 0x42)
+
+
+def _pid_bitmap(base: int) -> bytes:
+    bits = 0
+    for pid in SUPPORTED_PIDS:
+        if base < pid <= base + 32:
+            bits |= 1 << (32 - (pid - base))
+    return bits.to_bytes(4, "big")
+
+
+class Elm327Emulator:
+    """ELM327 simulato sul lato master di una pty"""
+
+    def __init__(self, latency: float = 0.06, per_pid: float = 0.005, multi_pid: bool = True):
+        """
+        Args:
+            latency: Secondi di risposta per richiesta (come la centralina)
+            per_pid: Secondi aggiuntivi per ogni PID della richiesta
+            multi_pid: False per rispondere solo al primo PID di ogni richiesta
+        """
+        self.latency = latency
+        self.per_pid = per_pid
+        self.multi_pid = multi_pid
+        self.echo = True
+        self.spaces = True
+        self.started = time.monotonic()
+        self.requests = 0
+        self.master: Optional[int] = None
+        self.port: Optional[str] = None
+        self.thread: Optional[threading.Thread] = None
+
+    def start(self) -> str:
+        """Apre la pty e ritorna il percorso da usare come porta seriale"""
+        self.master, slave = os.openpty()
+        tty.setraw(slave)
+        self.port = os.ttyname(slave)
+        self.thread = threading.Thread(target=self._serve, name="elm327-emulator", daemon=True)
+        self.thread.start()
+        return self.port
+
+    def _serve(self):
+        buffer = b""
+        while True:
+            try:
+                chunk = os.read(self.master, 1024)
+            except OSError:
+                return
+            buffer += chunk
+            while b"\r" in buffer:
+                line, buffer = buffer.split(b"\r", 1)
+                command = line.decode(errors="replace").strip().upper().replace(" ", "")
+                if not command:
+                    continue
+                reply = self.respond(command)
+                echo = command + "\r" if self.echo else ""
+                os.write(self.master, (echo + "\r".join(reply) + "\r\r>").encode())
+
+    # ==================== COMANDI ====================
+
+    def respond(self, command: str) -> List[str]:
+        if command.startswith("AT"):
+            return self._at(command[2:])
+        if command.startswith("01") and len(command) >= 4 and len(command) % 2 == 0:
+            pids = [int(command[i:i + 2], 16) for i in range(2, len(command), 2)]
+            time.sleep(self.latency + self.per_pid * len(pids))
+            self.requests += 1
+            return self._mode01(pids)
+        return ["?"]
+
+    def _at(self, command: str) -> List[str]:
+        if command == "Z":
+            self.echo = self.spaces = True
+            time.sleep(0.2)
+            return ["", "ELM327 v1.5"]
+        if command in ("E0", "E1"):
+            self.echo = command == "E1"
+        elif command in ("S0", "S1"):
+            self.spaces = command == "S1"
+        elif command == "RV":
+            return [f"{int.from_bytes(self._values()[0x42], 'big') / 1000:.1f}V"]
+        return ["OK"]
+
+    def _mode01(self, pids: List[int]) -> List[str]:
+        if not self.multi_pid:
+            pids = pids[:1]
+        values = self._values()
+        payload = bytearray([0x41])
+        for pid in pids:
+            if pid in values:
+                payload += bytes([pid]) + values[pid]
+        if len(payload) == 1:
+            return ["NO DATA"]
+        return self._frames(bytes(payload))
+
+    def _frames(self, payload: bytes) -> List[str]:
+        """Riga singola fino a 7 byte, altrimenti ISO-TP (first frame + consecutive, padding 00)"""
+        if len(payload) <= 7:
+            return [self._hex(payload)]
+        lines = [f"{len(payload):03X}", "0:" + self._hex(payload[:6])]
+        rest, index = payload[6:], 1
+        while rest:
+            frame = rest[:7].ljust(7, b"\x00")
+            lines.append(f"{index % 16:X}:" + self._hex(frame))
+            rest, index = rest[7:], index + 1
+        return lines
+
+    def _hex(self, data: bytes) -> str:
+        return (" " if self.spaces else "").join(f"{b:02X}" for b in data)
+
+    def _values(self) -> Dict[int, bytes]:
+        """Valori correnti: giro in città con accelerazioni periodiche"""
+        t = time.monotonic() - self.started
+        speed = max(0.0, 55 + 35 * math.sin(t / 20) + 5 * math.sin(t / 3))
+        rpm = 800 + speed * 28
+        fuel = max(0.0, 70 - t / 600)
+        values = {
+            0x05: bytes([int(min(90.0, 20 + t / 4)) + 40]),
+            0x0C: int(rpm * 4).to_bytes(2, "big"),
+            0x0D: bytes([int(speed)]),
+            0x2F: bytes([int(fuel * 255 / 100)]),
+            0x42: int((13.8 + 0.1 * math.sin(t)) * 1000).to_bytes(2, "big"),
+        }
+        for base in (0x00, 0x20, 0x40):
+            values[base] = _pid_bitmap(base)
+        return values
+
+
+# ==================== VERIFICHE ====================
+
+def run_checks():
+    """parse_mode01 e supported_from_bitmap sulle risposte dell'emulatore (valori congelati)"""
+    emulator = Elm327Emulator(latency=0.0, per_pid=0.0)
+    values = emulator._values()
+    emulator._values = lambda: values
+    lengths = {pid.pid: pid.length for pid in DEFAULT_PIDS}
+
+    # Riga singola
+    lines = emulator.respond("010D")
+    assert len(lines) == 1, f"risposta a riga singola attesa: {lines}"
+    assert parse_mode01(lines, lengths) == {0x0D: values[0x0D]}, "PID 0x0D non letto"
+    print("✓ Risposta a riga singola")
+
+    # Multi-PID: 11 byte -> ISO-TP (lunghezza, first frame, consecutive con padding)
+    pids = (0x0C, 0x0D, 0x42, 0x05)
+    for spaces in (True, False):
+        emulator.spaces = spaces
+        lines = emulator.respond("01" + "".join(f"{pid:02X}" for pid in pids))
+        assert len(lines) > 2 and lines[0] == "00B", f"risposta ISO-TP attesa: {lines}"
+        parsed = parse_mode01(lines, lengths)
+        assert parsed == {pid: values[pid] for pid in pids}, f"multi-frame: {parsed}"
+    rpm = next(pid for pid in DEFAULT_PIDS if pid.pid == 0x0C)
+    assert rpm.decode(parsed[0x0C]) == int.from_bytes(values[0x0C], "big") / 4
+    print(f"✓ Multi-frame ISO-TP ({len(lines)} righe, con e senza spazi)")
+
+    # Due centraline nella stessa risposta
+    lines = emulator.respond("010C0D4205") + emulator.respond("010D")
+    assert parse_mode01(lines, lengths)[0x0D] == values[0x0D], "seconda risposta persa"
+    print("✓ Risposte di più centraline")
+
+    # PID 0x46 non supportato: NO DATA da solo, ignorato in una richiesta multi-PID
+    lines = emulator.respond("0146")
+    assert lines and lines[0].startswith(NO_DATA_LINES), f"NO DATA atteso: {lines}"
+    assert parse_mode01(lines, lengths) == {}
+    assert parse_mode01(emulator.respond("010D46"), lengths) == {0x0D: values[0x0D]}
+    print("✓ PID 0x46 non supportato")
+
+    # Maschere 0100/0120/0140
+    supported = []
+    for base in (0x00, 0x20, 0x40):
+        data = parse_mode01(emulator.respond(f"01{base:02X}"), {base: 4})[base]
+        supported += supported_from_bitmap(base, data)
+    assert supported == sorted(SUPPORTED_PIDS), f"PID supportati: {[hex(p) for p in supported]}"
+    print(f"✓ PID supportati dalle maschere: {' '.join(f'{p:02X}' for p in supported)}")
+
+    # Centralina senza multi-PID: risponde solo al primo
+    emulator.multi_pid = False
+    assert parse_mode01(emulator.respond("010C0D"), lengths) == {0x0C: values[0x0C]}
+    print("✓ Centralina a PID singolo")
+    print("✓ Verifiche ELM327 superate")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Emulatore ELM327 su pty")
+    parser.add_argument("--latency", type=float, default=0.06, help="Secondi per richiesta")
+    parser.add_argument("--single-pid", action="store_true", help="Centralina senza richieste multi-PID")
+    parser.add_argument("--check", action="store_true", help="Verifica il parser OBD sulle risposte ed esce")
+    args = parser.parse_args()
+
+    if args.check:
+        run_checks()
+        raise SystemExit
+
+    emulator = Elm327Emulator(latency=args.latency, multi_pid=not args.single_pid)
+    port = emulator.start()
+    print(f"✓ ELM327 emulato su {port} (latenza {args.latency * 1000:.0f}ms)")
+    print(f"  VEHICLE_SOURCE=obd OBD_PORT={port} python main.py")
+    try:
+        while True:
+            time.sleep(10)
+            print(f"  {emulator.requests} richieste servite")
+    except KeyboardInterrupt:
+        pass
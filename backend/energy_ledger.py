@@ -0,0 +1,255 @@
+"""
+Contabilità energetica della batteria servizi
+Integra la potenza (tensione x corrente, positiva = carica) fra due letture
+e accumula i Wh entrati e usciti in bucket per minuto, ora e giorno.
+I tre livelli sono aggiornati insieme ad ogni lettura (O(1)): una richiesta
+su 7 giorni legge 168 bucket orari, senza scorrere i campioni grezzi.
+
+- minuti: ultime 48 ore
+- ore: ultimi 90 giorni
+- giorni (mezzanotte locale): ultimi 10 anni
+
+I bucket sono salvati su disco (ENERGY_FILE) e ricaricati all'avvio.
+"""
+
+import asyncio
+import bisect
+import json
+import os
+import time
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from task_supervisor import task_supervisor
+
+ENERGY_FILE = os.getenv("ENERGY_FILE", str(Path(__file__).parent / "data" / "energy.json"))
+
+# Salvataggio su disco al massimo ogni N secondi
+ENERGY_SAVE_INTERVAL = 60.0
+
+# Buchi più lunghi fra due letture non vengono integrati (batteria non letta)
+MAX_GAP = 600.0
+
+# Livello -> (ampiezza in secondi, bucket conservati); il giorno segue l'ora locale
+LEVELS = {
+    "minute": (60, 48 * 60),
+    "hour": (3600, 90 * 24),
+    "day": (86400, 3650),
+}
+
+# Finestra massima interrogabile per livello (la sua conservazione)
+RETENTION_SECONDS = {level: size * count for level, (size, count) in LEVELS.items()}
+
+# Risoluzione automatica: la più fine con al massimo ~400 bucket
+AUTO_RESOLUTION = (("minute", 6 * 3600), ("hour", 14 * 86400), ("day", None))
+
+
+def day_start(timestamp: float) -> int:
+    """Mezzanotte locale del giorno di `timestamp` (epoch)"""
+    moment = datetime.fromtimestamp(timestamp)
+    return int(datetime(moment.year, moment.month, moment.day).timestamp())
+
+
+def auto_resolution(window: float) -> str:
+    """Livello più fine adatto alla finestra (secondi)"""
+    return next(level for level, limit in AUTO_RESOLUTION if limit is None or window <= limit)
+
+
+def bucket_start(level: str, timestamp: float) -> int:
+    if level == "day":
+        return day_start(timestamp)
+    size = LEVELS[level][0]
+    return int(timestamp // size * size)
+
+
+class EnergyLedger:
+    """Wh in carica e in scarica per minuto, ora e giorno"""
+
+    def __init__(self, path: str = ENERGY_FILE):
+        self.path = Path(path)
+        self.persist = False
+        self.dirty = False
+        # Livello -> {inizio bucket: [wh_in, wh_out, secondi coperti]} e inizi ordinati (per bisect)
+        self.buckets: Dict[str, Dict[int, List[float]]] = {level: {} for level in LEVELS}
+        self.keys: Dict[str, List[int]] = {level: [] for level in LEVELS}
+        self.last: Optional[Tuple[float, float]] = None
+        self.current_day: Optional[Tuple[int, int]] = None
+
+    # ==================== INTEGRAZIONE ====================
+
+    def add(self, timestamp: float, voltage: Optional[float], current: Optional[float]):
+        """
+        Aggiunge una lettura batteria
+
+        Args:
+            timestamp: Epoch della lettura
+            voltage: Tensione (V)
+            current: Corrente (A, positiva = carica)
+        """
+        if not isinstance(voltage, (int, float)) or not isinstance(current, (int, float)):
+            return
+        power = voltage * current
+
+        if self.last is not None:
+            last_time, last_power = self.last
+            dt = timestamp - last_time
+            if 0 < dt <= MAX_GAP:
+                self._integrate(last_time, timestamp, (last_power + power) / 2)
+        self.last = (timestamp, power)
+
+    def _integrate(self, start: float, end: float, power: float):
+        """Distribuisce l'energia dell'intervallo sui minuti attraversati"""
+        t = start
+        while t < end:
+            minute = int(t // 60 * 60)
+            segment_end = min(end, minute + 60)
+            seconds = segment_end - t
+            wh = power * seconds / 3600
+            wh_in, wh_out = (wh, 0.0) if wh > 0 else (0.0, -wh)
+
+            # Minuto e ora per aritmetica, giorno ricalcolato solo al cambio di data
+            keys = {"minute": minute, "hour": int(t // 3600 * 3600), "day": self._day_key(t)}
+            for level, key in keys.items():
+                bucket = self.buckets[level].get(key)
+                if bucket is None:
+                    bucket = self._new_bucket(level, key)
+                bucket[0] += wh_in
+                bucket[1] += wh_out
+                bucket[2] += seconds
+            t = segment_end
+        self.dirty = True
+
+    def _day_key(self, timestamp: float) -> int:
+        if self.current_day is None or not self.current_day[0] <= timestamp < self.current_day[1]:
+            start = day_start(timestamp)
+            following = datetime.fromtimestamp(start) + timedelta(days=1)
+            self.current_day = (start, int(following.timestamp()))
+        return self.current_day[0]
+
+    def _new_bucket(self, level: str, key: int) -> List[float]:
+        buckets, keys = self.buckets[level], self.keys[level]
+        bucket = buckets[key] = [0.0, 0.0, 0.0]
+        if not keys or key > keys[-1]:
+            keys.append(key)
+        else:
+            # Orologio tornato indietro (es. dopo un riavvio con l'ora sbagliata)
+            bisect.insort(keys, key)
+        retention = LEVELS[level][1]
+        while len(keys) > retention:
+            del buckets[keys.pop(0)]
+        return bucket
+
+    # ==================== INTERROGAZIONE ====================
+
+    def query(self, window: float, resolution: Optional[str] = None, end: Optional[float] = None) -> Dict:
+        """
+        Energia per bucket nella finestra (solo bucket con dati)
+
+        Args:
+            window: Secondi fino a `end`
+            resolution: minute, hour o day (default: scelta dalla finestra)
+            end: Fine finestra (default: adesso)
+
+        Returns:
+            dict: Colonne t/wh_in/wh_out/wh_net/covered_s e totali
+        """
+        end = time.time() if end is None else end
+        start = end - window
+        resolution = resolution or auto_resolution(window)
+
+        result = {
+            "start": start,
+            "end": end,
+            "resolution": resolution,
+            "t": [],
+            "wh_in": [],
+            "wh_out": [],
+            "wh_net": [],
+            "covered_s": [],
+        }
+        buckets = self.buckets[resolution]
+        for key in self._keys(resolution, start, end):
+            wh_in, wh_out, covered = buckets[key]
+            result["t"].append(key)
+            result["wh_in"].append(round(wh_in, 2))
+            result["wh_out"].append(round(wh_out, 2))
+            result["wh_net"].append(round(wh_in - wh_out, 2))
+            result["covered_s"].append(round(covered))
+
+        result["totals"] = {
+            "wh_in": round(sum(result["wh_in"]), 2),
+            "wh_out": round(sum(result["wh_out"]), 2),
+            "wh_net": round(sum(result["wh_net"]), 2),
+        }
+        return result
+
+    def _keys(self, level: str, start: float, end: float) -> List[int]:
+        """Inizi dei bucket esistenti che toccano [start, end), per bisect sugli inizi ordinati"""
+        keys = self.keys[level]
+        if not keys or end <= keys[0]:
+            return []
+        # Inizio del bucket che contiene `start` (senza uscire dai bucket registrati)
+        first = bucket_start(level, max(start, keys[0]))
+        return keys[bisect.bisect_left(keys, first):bisect.bisect_left(keys, end)]
+
+    # ==================== PERSISTENZA ====================
+
+    def load(self):
+        """Ricarica i bucket salvati (bloccante)"""
+        if not self.path.exists():
+            return
+        try:
+            data = json.loads(self.path.read_text())
+        except (OSError, ValueError) as e:
+            print(f"❌ File energia non leggibile ({e}), riparto da zero")
+            return
+
+        for level in LEVELS:
+            for key, wh_in, wh_out, covered in data.get(level, []):
+                self.buckets[level][int(key)] = [wh_in, wh_out, covered]
+            self.keys[level] = sorted(self.buckets[level])
+
+    def _write(self, data: Dict):
+        """Scrittura atomica (bloccante, eseguita in un thread)"""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(data))
+        os.replace(tmp, self.path)
+
+    async def save(self):
+        """Salva su disco se ci sono modifiche"""
+        if not self.persist or not self.dirty:
+            return
+        self.dirty = False
+        data = {
+            level: [[key, *self.buckets[level][key]] for key in keys]
+            for level, keys in self.keys.items()
+        }
+        await asyncio.to_thread(self._write, data)
+
+    # ==================== LIFECYCLE ====================
+
+    async def start(self):
+        """Carica i bucket salvati e avvia il salvataggio periodico"""
+        self.persist = True
+        await asyncio.to_thread(self.load)
+        task_supervisor.spawn("energy_save", self._save_loop)
+        print(f"✓ Contabilità energia: {len(self.buckets['day'])} giorni registrati")
+
+    async def _save_loop(self):
+        while True:
+            await asyncio.sleep(ENERGY_SAVE_INTERVAL)
+            try:
+                await self.save()
+            except Exception as e:
+                print(f"❌ Errore salvataggio energia: {e}")
+
+    async def stop(self):
+        """Ferma il salvataggio periodico e salva l'ultimo stato"""
+        await task_supervisor.cancel("energy_save")
+        await self.save()
+
+
+# Contabilità condivisa dal servizio batteria
+energy_ledger = EnergyLedger()
@@ -0,0 +1,29 @@
+"""
+API Routes per le previsioni
+Ore a vuoto/pieno dei serbatoi e autonomia della batteria
+"""
+
+from fastapi import APIRouter
+
+from forecaster import forecaster
+from shared_state import shared_state
+
+router = APIRouter(prefix="/api/forecast", tags=["forecast"])
+
+
+@router.get("")
+async def get_forecast():
+    """
+    Previsioni correnti con intervallo di confidenza al 95%
+
+    Returns:
+        dict: tanks (per serbatoio) e battery (trend SoC e autonomia al carico attuale);
+              hours None = mai nell'orizzonte, null per serbatoio = dati insufficienti
+    """
+    if shared_state.is_follower:
+        return await shared_state.call("forecast")
+    return forecaster.summary()
+
+
+# Le regressioni sono alimentate solo nell'owner (SHARED_STATE)
+shared_state.register("forecast", get_forecast)
@@ -0,0 +1,269 @@
+"""
+Previsioni di svuotamento/riempimento di serbatoi e batteria
+Per ogni grandezza una regressione lineare su finestra mobile, aggiornata
+in modo incrementale (somme scorrevoli: O(1) per campione, nessun refit).
+Dalla pendenza e dal suo errore standard si ricavano le ore stimate fino
+a vuoto/pieno con un intervallo di confidenza al 95%.
+
+Per la batteria si aggiunge l'autonomia al carico attuale, calcolata dalla
+corrente misurata e dalla capacità nominale (BATTERY_CAPACITY_AH).
+"""
+
+import math
+import os
+import time
+from collections import deque
+from typing import Dict, Optional
+
+from vehicle_state import CamperState
+
+# Configurazione (sovrascrivibile da ambiente)
+FORECAST_WINDOW = float(os.getenv("FORECAST_WINDOW_MINUTES", "30")) * 60
+BATTERY_CAPACITY_AH = float(os.getenv("BATTERY_CAPACITY_AH", "100"))
+
+# Pubblicazione su CamperState al massimo ogni N secondi
+FORECAST_PUBLISH_INTERVAL = 5.0
+
+# Servono almeno questi campioni/secondi per una stima
+MIN_SAMPLES = 10
+MIN_SPAN = 60.0
+
+# Quantile normale per l'intervallo al 95%
+Z_95 = 1.96
+
+# Oltre questo orizzonte la previsione è riportata come "mai" (None)
+MAX_HOURS = 24 * 30
+
+# Grandezza -> livello obiettivo (0 = si svuota, 100 = si riempie)
+TANK_TARGETS = {
+    "fuel_level": 0.0,
+    "water_tank": 0.0,
+    "grey_water": 100.0,
+    "black_water": 100.0,
+}
+
+
+class RollingRegression:
+    """
+    Regressione lineare y = a + b*t su una finestra temporale mobile
+    Le somme sono aggiornate all'ingresso e all'uscita di ogni campione;
+    i tempi sono relativi a un'origine che segue la finestra, così le somme
+    dei quadrati restano piccole e numericamente stabili.
+    """
+
+    def __init__(self, window: float = FORECAST_WINDOW):
+        self.window = window
+        self.samples: deque = deque()
+        self.origin: Optional[float] = None
+        self.clear()
+
+    def clear(self):
+        self.samples.clear()
+        self.origin = None
+        self.n = 0
+        self.st = self.sy = self.stt = self.sty = self.syy = 0.0
+
+    def add(self, timestamp: float, value: float):
+        """Aggiunge un campione ed elimina quelli usciti dalla finestra (O(1) ammortizzato)"""
+        timestamp, value = float(timestamp), float(value)
+        if self.samples and timestamp <= self.samples[-1][0]:
+            # Tempo all'indietro (es. replay ricominciato): serie nuova
+            self.clear()
+
+        if self.origin is None:
+            self.origin = timestamp
+        elif timestamp - self.origin > 2 * self.window:
+            self._rebase(timestamp - self.window)
+
+        t = timestamp - self.origin
+        self.samples.append((timestamp, value))
+        self._accumulate(t, value, 1)
+
+        cutoff = timestamp - self.window
+        while self.samples[0][0] < cutoff:
+            old_time, old_value = self.samples.popleft()
+            self._accumulate(old_time - self.origin, old_value, -1)
+
+    def _accumulate(self, t: float, y: float, sign: int):
+        self.n += sign
+        self.st += sign * t
+        self.sy += sign * y
+        self.stt += sign * t * t
+        self.sty += sign * t * y
+        self.syy += sign * y * y
+
+    def _rebase(self, origin: float):
+        """Sposta l'origine dei tempi trasformando le somme (t' = t - d)"""
+        d = origin - self.origin
+        self.stt += -2 * d * self.st + self.n * d * d
+        self.sty -= d * self.sy
+        self.st -= self.n * d
+        self.origin = origin
+
+    @property
+    def span(self) -> float:
+        return self.samples[-1][0] - self.samples[0][0] if self.samples else 0.0
+
+    def fit(self) -> Optional[Dict[str, float]]:
+        """
+        Pendenza (unità/ora), suo errore standard e valore stimato all'ultimo campione
+
+        Returns:
+            dict | None: None se i campioni non bastano
+        """
+        n = self.n
+        if n < MIN_SAMPLES or self.span < MIN_SPAN:
+            return None
+
+        sxx = self.stt - self.st * self.st / n
+        if sxx <= 0:
+            return None
+        sxy = self.sty - self.st * self.sy / n
+        syy = self.syy - self.sy * self.sy / n
+
+        slope = sxy / sxx
+        intercept = (self.sy - slope * self.st) / n
+        residual = max(0.0, syy - slope * sxy) / (n - 2)
+        slope_se = math.sqrt(residual / sxx)
+
+        latest = self.samples[-1][0] - self.origin
+        return {
+            "slope": slope * 3600,
+            "slope_se": slope_se * 3600,
+            "value": intercept + slope * latest,
+        }
+
+
+def hours_until(current: float, target: float, rate: float) -> Optional[float]:
+    """Ore per raggiungere `target` alla velocità `rate` (unità/ora); None se mai"""
+    if rate == 0 or (target - current) / rate < 0:
+        return None
+    hours = (target - current) / rate
+    return hours if hours <= MAX_HOURS else None
+
+
+def forecast_level(regression: RollingRegression, target: float) -> Optional[Dict]:
+    """Previsione con intervallo di confidenza verso un livello obiettivo"""
+    fit = regression.fit()
+    if fit is None:
+        return None
+
+    current, slope, margin = fit["value"], fit["slope"], Z_95 * fit["slope_se"]
+    # Pendenza più ripida -> arrivo prima (limite inferiore delle ore) e viceversa
+    steep, shallow = (slope - margin, slope + margin) if target < current else (slope + margin, slope - margin)
+
+    return {
+        "level": round(current, 1),
+        "rate_per_hour": round(slope, 3),
+        "hours": _round(hours_until(current, target, slope)),
+        "hours_low": _round(hours_until(current, target, steep)),
+        "hours_high": _round(hours_until(current, target, shallow)),
+        "samples": regression.n,
+    }
+
+
+def _round(value: Optional[float]) -> Optional[float]:
+    return round(value, 2) if value is not None else None
+
+
+class Forecaster:
+    """Regressioni per serbatoi e batteria, pubblicate su stato e API"""
+
+    def __init__(self, window: float = FORECAST_WINDOW, capacity_ah: float = BATTERY_CAPACITY_AH):
+        self.capacity_ah = capacity_ah
+        self.tanks = {field: RollingRegression(window) for field in TANK_TARGETS}
+        self.soc = RollingRegression(window)
+        self.current = RollingRegression(window)
+        self.battery_data: Dict[str, float] = {}
+        self.last_publish = 0.0
+
+    # ==================== CAMPIONI ====================
+
+    def update_tanks(self, state: CamperState, timestamp: Optional[float] = None):
+        """Aggiunge i livelli correnti dei serbatoi (tick di telemetria veicolo)"""
+        timestamp = time.time() if timestamp is None else timestamp
+        for field, regression in self.tanks.items():
+            regression.add(timestamp, float(getattr(state, field)))
+
+        now = time.monotonic()
+        if now - self.last_publish >= FORECAST_PUBLISH_INTERVAL:
+            self.last_publish = now
+            state.forecast = self.tank_forecast()
+
+    def update_battery(self, data: Dict, timestamp: Optional[float] = None):
+        """Aggiunge una lettura batteria (soc %, corrente A: negativa = scarica)"""
+        timestamp = time.time() if timestamp is None else timestamp
+        if isinstance(data.get("soc"), (int, float)):
+            self.soc.add(timestamp, float(data["soc"]))
+        if isinstance(data.get("current"), (int, float)):
+            self.current.add(timestamp, float(data["current"]))
+        self.battery_data = data
+
+    # ==================== PREVISIONI ====================
+
+    def tank_forecast(self) -> Dict[str, Optional[Dict]]:
+        """Ore a vuoto (carburante, acqua) o a pieno (grigie, nere)"""
+        return {
+            field: forecast_level(regression, TANK_TARGETS[field])
+            for field, regression in self.tanks.items()
+        }
+
+    def battery_forecast(self) -> Dict[str, Optional[Dict]]:
+        """
+        Autonomia batteria
+
+        - trend: regressione dello SoC (ore a 0% o a 100%)
+        - at_load: autonomia alla corrente attuale, con intervallo dalla
+          dispersione della corrente nella finestra
+        """
+        soc = self.battery_data.get("soc")
+        current = self.battery_data.get("current")
+
+        trend = None
+        fit = self.soc.fit()
+        if fit is not None:
+            target = 0.0 if fit["slope"] < 0 else 100.0
+            trend = forecast_level(self.soc, target)
+            if trend is not None:
+                trend["target"] = target
+
+        at_load = None
+        if isinstance(soc, (int, float)) and isinstance(current, (int, float)) and current != 0:
+            charging = current > 0
+            remaining_ah = (100 - soc if charging else soc) / 100 * self.capacity_ah
+            hours = remaining_ah / abs(current)
+
+            low = high = None
+            n = self.current.n
+            if n >= 2:
+                mean = self.current.sy / n
+                spread = Z_95 * math.sqrt(max(0.0, (self.current.syy - self.current.sy * mean) / (n - 1)))
+                # Carico più/meno intenso del solito -> autonomia più corta/lunga
+                strong, weak = abs(current) + spread, abs(current) - spread
+                low = remaining_ah / strong
+                high = remaining_ah / weak if weak > 0 else None
+
+            at_load = {
+                "mode": "charging" if charging else "discharging",
+                "current": round(current, 2),
+                "hours": _round(min(hours, MAX_HOURS)),
+                "hours_low": _round(min(low, MAX_HOURS)) if low is not None else None,
+                "hours_high": _round(high) if high is not None and high <= MAX_HOURS else None,
+            }
+
+        return {
+            "capacity_ah": self.capacity_ah,
+            "trend": trend,
+            "at_load": at_load,
+        }
+
+    def summary(self) -> Dict:
+        return {
+            "window_minutes": self.soc.window / 60,
+            "tanks": self.tank_forecast(),
+            "battery": self.battery_forecast(),
+        }
+
+
+# Forecaster condiviso da simulazione/sensori e servizio batteria
+forecaster = Forecaster()
@@ -0,0 +1,77 @@
+"""
+API Routes per lo storico telemetria
+Bucket min/max/media per grafici di serbatoi, tensioni e batteria
+"""
+
+import asyncio
+import time
+
+from fastapi import APIRouter, HTTPException
+
+from shared_state import shared_state
+from telemetry_history import MAX_BUCKETS, aggregate_buckets, history
+from telemetry_log import telemetry_log
+
+router = APIRouter(prefix="/api/history", tags=["history"])
+
+
+@router.get("")
+async def list_metrics():
+    """Metriche disponibili con frequenza e campioni in memoria"""
+    if shared_state.is_follower:
+        return await shared_state.call("history_metrics")
+    return {"metrics": history.metrics(), "log": telemetry_log.stats()}
+
+
+@router.get("/{metric}")
+async def get_metric_history(metric: str, window: float = 3600, resolution: float = 60, source: str = "auto"):
+    """
+    Storico aggregato di una metrica
+
+    Args:
+        metric: Nome metrica (es. water_tank, battery_voltage)
+        window: Finestra in secondi fino ad adesso (default 1 ora)
+        resolution: Ampiezza bucket in secondi (default 1 minuto)
+        source: "memory", "disk" oppure "auto" (disco solo se la memoria non copre la finestra)
+
+    Returns:
+        dict: Colonne t/min/max/mean/count
+    """
+    if shared_state.is_follower:
+        return await shared_state.call(
+            "history", metric=metric, window=window, resolution=resolution, source=source
+        )
+
+    if metric not in history.buffers:
+        raise HTTPException(status_code=404, detail=f"Metrica sconosciuta: {metric}")
+
+    if window <= 0 or resolution <= 0:
+        raise HTTPException(status_code=400, detail="window e resolution devono essere positivi")
+
+    if window / resolution > MAX_BUCKETS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Troppi bucket richiesti (max {MAX_BUCKETS}): aumenta resolution"
+        )
+
+    if source not in ("auto", "memory", "disk"):
+        raise HTTPException(status_code=400, detail="source deve essere auto, memory o disk")
+
+    end = time.time()
+    start = end - window
+
+    if source == "memory" or (source == "auto" and history.covers(metric, start)):
+        result = history.buckets(metric, window, resolution, end=end)
+        result["source"] = "memory"
+        return result
+
+    # Lettura mmap dei segmenti fuori dall'event loop
+    times, values = await asyncio.to_thread(telemetry_log.read, metric, start, end)
+    result = aggregate_buckets(metric, times, values, start, end, resolution)
+    result["source"] = "disk"
+    return result
+
+
+# Storico in memoria e log su disco sono scritti solo dall'owner (SHARED_STATE)
+shared_state.register("history_metrics", list_metrics)
+shared_state.register("history", get_metric_history)
@@ -0,0 +1,81 @@
+"""
+Cache degli snapshot HTTP con ETag e GET condizionali
+Gli endpoint di stato interrogati in polling serializzano il payload una
+sola volta per versione e rispondono 304 se il client ha già quella versione.
+"""
+
+import hashlib
+import time
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from fastapi import Request, Response
+
+from broadcast_hub import encode_json
+
+# Distingue le versioni di avvii diversi (i contatori ripartono da zero)
+BOOT_ID = format(int(time.time() * 1000), "x")
+
+
+class VersionedSnapshot:
+    """Payload serializzato una volta per versione, con il relativo ETag"""
+
+    def __init__(self, name: str, build: Callable[[], Dict[str, Any]]):
+        self.name = name
+        self.build = build
+        self.version: Optional[Tuple[str, int]] = None
+        self.etag = ""
+        self.body = ""
+
+    def get(self, version: int, boot_id: str = BOOT_ID) -> Tuple[str, str]:
+        """
+        Ritorna (etag, body JSON) per la versione indicata
+
+        Args:
+            version: Versione corrente della sorgente dati
+            boot_id: Avvio che ha prodotto la versione (un worker follower
+                     passa quello dell'owner, così l'ETag è uguale in ogni worker)
+        """
+        if (boot_id, version) != self.version:
+            self.body = encode_json(self.build())
+            self.etag = f'"{self.name}-{boot_id}-{version}"'
+            self.version = (boot_id, version)
+        return self.etag, self.body
+
+
+def content_etag(name: str, body: str) -> str:
+    """ETag calcolato dal contenuto, per sorgenti senza contatore di versione"""
+    digest = hashlib.blake2b(body.encode(), digest_size=8).hexdigest()
+    return f'"{name}-{digest}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Confronto debole di If-None-Match (RFC 7232)"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    return False
+
+
+def conditional_response(request: Request, etag: str, body: str) -> Response:
+    """
+    Risposta JSON con ETag, oppure 304 se il client ha già questa versione
+
+    Args:
+        request: Richiesta HTTP (per If-None-Match)
+        etag: ETag della versione corrente
+        body: JSON già serializzato
+    """
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+
+    return Response(content=body, media_type="application/json", headers=headers)
@@ -0,0 +1,215 @@
+"""
+Watchdog dell'event loop (opzionale)
+Un task sul loop aggiorna un battito; un thread separato controlla che il
+battito non si fermi. Se il loop resta bloccato oltre la soglia, il thread
+campiona lo stack del thread del loop (sys._current_frames) e attribuisce
+il blocco alla chiamata del progetto più interna (es. un subprocess.run
+dentro una route async).
+
+Attivazione (variabili d'ambiente):
+    LOOP_WATCHDOG=true
+    LOOP_WATCHDOG_THRESHOLD_MS=100   (default)
+
+I blocchi finiscono nel log alla fine di ogni stallo e sono consultabili
+su GET /api/debug/loop-blocks.
+"""
+
+import asyncio
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import Counter
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from task_supervisor import task_supervisor
+
+LOOP_WATCHDOG_ENABLED = os.getenv("LOOP_WATCHDOG", "false").lower() == "true"
+LOOP_WATCHDOG_THRESHOLD = float(os.getenv("LOOP_WATCHDOG_THRESHOLD_MS", "100")) / 1000
+
+# Cartella del backend: i frame fuori (stdlib, site-packages) non sono "colpevoli"
+PROJECT_DIR = str(Path(__file__).resolve().parent)
+
+# Frame del progetto conservati per ogni punto di blocco
+STACK_DEPTH = 8
+
+# Punti di blocco distinti conservati (i successivi sono solo contati)
+MAX_SITES = 100
+
+
+class BlockingSite:
+    """Statistiche di un punto di chiamata che ha bloccato il loop"""
+
+    def __init__(self, site: str, stack: List[str]):
+        self.site = site
+        self.stack = stack
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.last_at = 0.0
+
+    def to_dict(self) -> Dict:
+        return {
+            "site": self.site,
+            "count": self.count,
+            "total_ms": round(self.total * 1000, 1),
+            "max_ms": round(self.max * 1000, 1),
+            "last_at": self.last_at,
+            "stack": self.stack,
+        }
+
+
+class LoopWatchdog:
+    """Rileva i blocchi dell'event loop e registra dove avvengono"""
+
+    def __init__(self, threshold: float = LOOP_WATCHDOG_THRESHOLD):
+        self.threshold = threshold
+        # Il battito è più fitto della soglia per non confondere attesa e blocco
+        self.beat_interval = threshold / 2
+        self.poll_interval = max(0.005, threshold / 4)
+
+        self.last_beat = time.monotonic()
+        self.loop_thread_id: Optional[int] = None
+        self.thread: Optional[threading.Thread] = None
+        self.stopping = threading.Event()
+        self.lock = threading.Lock()
+
+        self.sites: Dict[str, BlockingSite] = {}
+        self.stalls = 0
+        self.unattributed = 0
+        self.blocked_total = 0.0
+
+    @property
+    def running(self) -> bool:
+        return self.thread is not None and self.thread.is_alive()
+
+    # ==================== LIFECYCLE ====================
+
+    async def start(self):
+        """Avvia battito e thread di controllo (da chiamare sul loop da sorvegliare)"""
+        if self.running:
+            return
+
+        self.loop_thread_id = threading.get_ident()
+        self.last_beat = time.monotonic()
+        self.stopping.clear()
+        task_supervisor.spawn("loop_watchdog_beat", self._heartbeat)
+        self.thread = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self.thread.start()
+        print(f"✓ Watchdog event loop attivo (soglia {self.threshold * 1000:.0f}ms)")
+
+    async def stop(self):
+        """Ferma battito e thread"""
+        self.stopping.set()
+        await task_supervisor.cancel("loop_watchdog_beat")
+        if self.thread:
+            await asyncio.to_thread(self.thread.join, 1.0)
+        self.thread = None
+
+    async def _heartbeat(self):
+        while True:
+            self.last_beat = time.monotonic()
+            await asyncio.sleep(self.beat_interval)
+
+    # ==================== THREAD DI CONTROLLO ====================
+
+    def _watch(self):
+        stall_started: Optional[float] = None
+        samples: Counter = Counter()
+        stacks: Dict[str, List[str]] = {}
+
+        while not self.stopping.wait(self.poll_interval):
+            now = time.monotonic()
+            beat = self.last_beat
+            blocked = now - beat > self.beat_interval + self.threshold
+
+            if blocked:
+                if stall_started is None:
+                    stall_started = beat + self.beat_interval
+                site, stack = self._sample()
+                samples[site] += 1
+                stacks.setdefault(site, stack)
+                continue
+
+            if stall_started is not None:
+                # Il loop è ripartito: durata = fino all'ultimo battito
+                duration = max(0.0, beat - stall_started)
+                self._record(samples, stacks, duration)
+                stall_started = None
+                samples = Counter()
+                stacks = {}
+
+    def _sample(self):
+        """Stack del thread del loop ridotto ai frame del progetto"""
+        frame = sys._current_frames().get(self.loop_thread_id)
+        if frame is None:
+            return "<sconosciuto>", []
+
+        entries = traceback.extract_stack(frame)
+        project = [entry for entry in entries if entry.filename.startswith(PROJECT_DIR)]
+        if not project:
+            innermost = entries[-1]
+            return f"{Path(innermost.filename).name}:{innermost.lineno} {innermost.name}", []
+
+        stack = [
+            f"{Path(entry.filename).name}:{entry.lineno} {entry.name}: {entry.line}"
+            for entry in project[-STACK_DEPTH:]
+        ]
+        # Chiamata del progetto più interna; la chiamata esterna bloccante resta nello stack
+        culprit = project[-1]
+        if culprit is not entries[-1]:
+            stack.append(f"-> {Path(entries[-1].filename).name}:{entries[-1].lineno} {entries[-1].name}")
+        return f"{Path(culprit.filename).name}:{culprit.lineno} {culprit.name}", stack
+
+    def _record(self, samples: Counter, stacks: Dict[str, List[str]], duration: float):
+        """Attribuisce lo stallo al punto campionato più spesso"""
+        with self.lock:
+            self.stalls += 1
+            self.blocked_total += duration
+
+            if not samples:
+                self.unattributed += 1
+                return
+
+            site_name, _ = samples.most_common(1)[0]
+            site = self.sites.get(site_name)
+            if site is None:
+                if len(self.sites) >= MAX_SITES:
+                    self.unattributed += 1
+                    return
+                site = self.sites[site_name] = BlockingSite(site_name, stacks[site_name])
+
+            site.count += 1
+            site.total += duration
+            site.max = max(site.max, duration)
+            site.last_at = time.time()
+
+        print(f"⚠️  Event loop bloccato per {duration * 1000:.0f}ms in {site_name}")
+
+    # ==================== REPORT ====================
+
+    def report(self) -> Dict:
+        """Punti di blocco ordinati per tempo totale"""
+        with self.lock:
+            sites = sorted(self.sites.values(), key=lambda s: s.total, reverse=True)
+            return {
+                "enabled": self.running,
+                "threshold_ms": self.threshold * 1000,
+                "stalls": self.stalls,
+                "unattributed": self.unattributed,
+                "blocked_total_ms": round(self.blocked_total * 1000, 1),
+                "sites": [site.to_dict() for site in sites],
+            }
+
+    def reset(self):
+        """Azzera le statistiche (es. tra due fasi di un benchmark)"""
+        with self.lock:
+            self.sites.clear()
+            self.stalls = 0
+            self.unattributed = 0
+            self.blocked_total = 0.0
+
+
+loop_watchdog = LoopWatchdog()
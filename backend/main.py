@@ -3,28 +3,72 @@ Backend FastAPI per sistema infotainment camper
 Include gestione veicolo, media e batteria
 """
 
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+# Per primo: misura il costo di import di ogni modulo del backend
+from service_registry import services, startup_report
+startup_report.install_import_timer()
+
+from fastapi import FastAPI, HTTPException, Request, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 from pydantic import BaseModel
+from contextlib import asynccontextmanager
 import asyncio
+import os
 import random
-import json
+import time
 from datetime import datetime
-from typing import List
+from typing import TYPE_CHECKING, Dict, Optional, Tuple
 
 # Import routers
 from media_routes import router as media_router
+from history_routes import router as history_router
+from trip_routes import router as trip_router
+from forecast_routes import router as forecast_router
+from alert_routes import router as alert_router
 from battery_service import router as battery_router
-from battery_service import startup_battery_service, shutdown_battery_service
+from battery_service import startup_battery_service, shutdown_battery_service, battery_hub
+import battery_service
+
+from broadcast_hub import BroadcastHub, HubConnection
+from http_cache import BOOT_ID, VersionedSnapshot, conditional_response
+from vehicle_state import STATE_FIELDS, camper
+from vehicle_stream import FrameCache, TopicScheduler, VehicleStreamClient
+from vehicle_binary import BINARY_SUBPROTOCOL, encode_gauge_frame
+from telemetry_history import history
+from loop_watchdog import LOOP_WATCHDOG_ENABLED, loop_watchdog
+from metrics import MetricsMiddleware, Sampled, broadcast_seconds, monitor_event_loop, registry
+from telemetry_log import LOG_DIR, telemetry_log
+from trip_computer import trip_computer
+from forecaster import forecaster
+from alerts import alert_engine
+from replay_source import ReplayEngine, recording_from_env
+from shared_state import shared_state
+from task_supervisor import task_supervisor
+
+if TYPE_CHECKING:
+    # Importati solo con VEHICLE_SOURCE=can/obd (python-can e pyserial)
+    from can_source import CanSource
+    from obd_source import ObdSource
 
 # ============================================
 # INIZIALIZZAZIONE APP
 # ============================================
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Avvio e arresto dell'app (i loop in background sono del supervisore)"""
+    await startup_event()
+    try:
+        yield
+    finally:
+        await shutdown_event()
+
+
 app = FastAPI(
     title="Camper Infotainment System",
     description="API per controllo completo del camper",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # CORS per permettere richieste dal frontend
@@ -34,50 +78,52 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag"],
 )
 
+# Latenza per route (esposta su /metrics)
+app.add_middleware(MetricsMiddleware)
+
 # Registra routers
 app.include_router(media_router, tags=["media"])
 app.include_router(battery_router, tags=["battery"])
+app.include_router(history_router, tags=["history"])
+app.include_router(trip_router, tags=["trips"])
+app.include_router(forecast_router, tags=["forecast"])
+app.include_router(alert_router, tags=["alerts"])
 
 
 # ============================================
 # STATO GLOBALE CAMPER
 # ============================================
 
-class CamperState:
-    """Stato globale del camper (mock per sviluppo)"""
-    
-    def __init__(self):
-        self.speed = 0.0
-        self.rpm = 0
-        self.fuel_level = 75.0
-        self.water_tank = 80.0
-        self.grey_water = 20.0
-        self.black_water = 15.0
-        self.battery_main = 12.6
-        self.battery_service = 13.2
-        self.temperature_inside = 22.0
-        self.temperature_outside = 18.0
-        self.lights = {
-            "headlights": False,
-            "position": False,
-            "interior": False,
-            "awning": False
-        }
-        self.doors = {
-            "driver": False,
-            "passenger": False,
-            "sliding": False,
-            "rear": False
-        }
-        self.engine_running = False
-        self.total_km = 45328
-
-camper = CamperState()
-
-# WebSocket connections attive
-active_connections: List[WebSocket] = []
+# WebSocket connections attive (un writer per connessione)
+vehicle_hub = BroadcastHub("veicolo")
+vehicle_frames = FrameCache()
+
+# Client che hanno negoziato il subprotocol binario dei gauge
+gauge_hub = BroadcastHub("gauge", late_after=0.1)
+gauge_seq = 0
+gauge_broadcast_seconds = broadcast_seconds.labels("gauge")
+
+# Cadenze simulazione/stream
+SIM_TICK = 0.5
+GAUGE_TICK = 1 / 30
+
+# Metriche veicolo storicizzate ad ogni tick di simulazione
+HISTORY_METRICS = (
+    "speed",
+    "rpm",
+    "fuel_level",
+    "water_tank",
+    "grey_water",
+    "black_water",
+    "battery_main",
+    "battery_service",
+    "temperature_inside",
+    "temperature_outside",
+)
+history.register(HISTORY_METRICS, rate_hz=1 / SIM_TICK)
 
 
 # ============================================
@@ -94,6 +140,12 @@ class DoorStatus(BaseModel):
     door_id: str
     is_open: bool
 
+class VehicleCommands(BaseModel):
+    """Modello per comandi multipli (scene): applicati tutti o nessuno"""
+    lights: Dict[str, bool] = {}
+    doors: Dict[str, bool] = {}
+    engine_running: Optional[bool] = None
+
 
 # ============================================
 # ENDPOINTS PRINCIPALI
@@ -109,35 +161,33 @@ async def root():
         "services": [
             "camper_control",
             "media_player",
-            "battery_monitor"
+            "battery_monitor",
+            "telemetry_history"
         ]
     }
 
+def status_version() -> Tuple[int, str]:
+    """Versione e avvio dello stato veicolo: nei follower quelli dell'owner, uguali in ogni worker"""
+    return follower_vehicle_version or (camper.version, BOOT_ID)
+
+
+# Snapshot serializzato una volta per versione di stato
+status_snapshot = VersionedSnapshot(
+    "vehicle",
+    lambda: {"version": status_version()[0], **camper.snapshot()}
+)
+
 @app.get("/api/status")
-async def get_status():
+async def get_status(request: Request):
     """
     Ritorna lo stato completo del camper
+    Supporta If-None-Match: risponde 304 se lo stato non è cambiato
     
     Returns:
         dict: Tutti i dati del veicolo
     """
-    return {
-        "speed": camper.speed,
-        "rpm": camper.rpm,
-        "fuel_level": camper.fuel_level,
-        "water_tank": camper.water_tank,
-        "grey_water": camper.grey_water,
-        "black_water": camper.black_water,
-        "battery_main": camper.battery_main,
-        "battery_service": camper.battery_service,
-        "temperature_inside": camper.temperature_inside,
-        "temperature_outside": camper.temperature_outside,
-        "lights": camper.lights,
-        "doors": camper.doors,
-        "engine_running": camper.engine_running,
-        "total_km": camper.total_km,
-        "timestamp": datetime.now().isoformat()
-    }
+    etag, body = status_snapshot.get(*status_version())
+    return conditional_response(request, etag, body)
 
 
 # ============================================
@@ -156,9 +206,11 @@ async def control_light(light_id: str, control: LightControl):
     Returns:
         dict: Risultato operazione
     """
-    if light_id in camper.lights:
-        camper.lights[light_id] = control.state
-        await broadcast_update()
+    if shared_state.is_follower:
+        return await shared_state.call("light", light_id=light_id, control=control.dict())
+    
+    if camper.set_light(light_id, control.state):
+        await broadcast_update("lights")
         return {
             "success": True,
             "light": light_id,
@@ -182,16 +234,64 @@ async def toggle_engine():
     Returns:
         dict: Stato motore
     """
-    camper.engine_running = not camper.engine_running
+    if shared_state.is_follower:
+        return await shared_state.call("engine_toggle")
     
-    if not camper.engine_running:
-        camper.speed = 0
-        camper.rpm = 0
+    camper.set_engine(not camper.engine_running)
+    await broadcast_update("drive")
     
-    await broadcast_update()
+    return {
+        "success": True,
+        "engine_running": camper.engine_running
+    }
+
+
+# ============================================
+# COMANDI MULTIPLI
+# ============================================
+
+@app.post("/api/commands")
+async def apply_commands(commands: VehicleCommands):
+    """
+    Applica più comandi luci/porte/motore in modo atomico
+    Es. scena "notte": {"lights": {"headlights": false, "position": false,
+    "interior": true, "awning": false}}. Se un ID non esiste non viene
+    applicato nulla; i client ricevono un unico frame con tutte le modifiche.
+    
+    Args:
+        commands: Luci, porte e stato motore desiderati
+    
+    Returns:
+        dict: Versione di stato risultante e comandi applicati
+    """
+    if shared_state.is_follower:
+        return await shared_state.call("commands", commands=commands.dict())
+    
+    unknown = [f"lights.{light_id}" for light_id in commands.lights if light_id not in camper.lights]
+    unknown += [f"doors.{door_id}" for door_id in commands.doors if door_id not in camper.doors]
+    if unknown:
+        raise HTTPException(status_code=404, detail=f"ID sconosciuti: {', '.join(unknown)}")
+    
+    # Nessun await tra le modifiche: nessun frame può vedere uno stato parziale
+    topics = set()
+    for light_id, state in commands.lights.items():
+        camper.set_light(light_id, state)
+        topics.add("lights")
+    for door_id, is_open in commands.doors.items():
+        camper.set_door(door_id, is_open)
+        topics.add("doors")
+    if commands.engine_running is not None:
+        camper.set_engine(commands.engine_running)
+        topics.add("drive")
+    
+    if topics:
+        await broadcast_update(*topics)
     
     return {
         "success": True,
+        "version": camper.version,
+        "lights": camper.lights,
+        "doors": camper.doors,
         "engine_running": camper.engine_running
     }
 
@@ -208,56 +308,226 @@ async def websocket_endpoint(websocket: WebSocket):
     Args:
         websocket: Connessione WebSocket
     """
+    if BINARY_SUBPROTOCOL in websocket.scope.get("subprotocols", []):
+        await gauge_websocket_session(websocket)
+        return
+    
     await websocket.accept()
-    active_connections.append(websocket)
+    client = VehicleStreamClient(websocket)
+    connection = vehicle_hub.register(websocket, context=client)
+    vehicle_scheduler.subscribe(connection)
+
+    # Keyframe iniziale
+    connection.send(render_vehicle_frame, key="state")
     
-    print(f"✓ WebSocket connesso (totale: {len(active_connections)})")
+    print(f"✓ WebSocket connesso (totale: {len(vehicle_hub)})")
     
     try:
         while True:
-            # Mantiene la connessione attiva
-            await websocket.receive_text()
+            # Subscribe, ack e richieste di resync dal client
+            if client.handle_message(await websocket.receive_text()):
+                vehicle_scheduler.subscribe(connection)
+                connection.send(render_vehicle_frame, key="state")
     except WebSocketDisconnect:
-        active_connections.remove(websocket)
-        print(f"✗ WebSocket disconnesso (rimasti: {len(active_connections)})")
-
-
-async def broadcast_update():
-    """
-    Invia aggiornamenti a tutti i client WebSocket connessi
-    """
-    if active_connections:
-        status = {
-            "speed": camper.speed,
-            "rpm": camper.rpm,
-            "fuel_level": camper.fuel_level,
-            "water_tank": camper.water_tank,
-            "grey_water": camper.grey_water,
-            "black_water": camper.black_water,
-            "battery_main": camper.battery_main,
-            "battery_service": camper.battery_service,
-            "temperature_inside": camper.temperature_inside,
-            "temperature_outside": camper.temperature_outside,
-            "lights": camper.lights,
-            "doors": camper.doors,
-            "engine_running": camper.engine_running,
-            "total_km": camper.total_km,
-            "timestamp": datetime.now().isoformat()
-        }
-        
-        # Invia a tutti i client connessi
-        disconnected = []
-        for connection in active_connections:
-            try:
-                await connection.send_json(status)
-            except Exception as e:
-                print(f"Errore invio WebSocket: {e}")
-                disconnected.append(connection)
+        pass
+    finally:
+        vehicle_scheduler.unsubscribe(connection)
+        vehicle_hub.unregister(connection)
+        print(f"✗ WebSocket disconnesso (rimasti: {len(vehicle_hub)})")
+
+
+async def gauge_websocket_session(websocket: WebSocket):
+    """
+    Sessione con subprotocol binario: frame compatti a 30 Hz per i gauge
+    
+    Args:
+        websocket: Connessione WebSocket non ancora accettata
+    """
+    await websocket.accept(subprotocol=BINARY_SUBPROTOCOL)
+    connection = gauge_hub.register(websocket)
+    connection.send(next_gauge_frame())
+    
+    print(f"✓ WebSocket gauge connesso (totale: {len(gauge_hub)})")
+    
+    try:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+    except WebSocketDisconnect:
+        pass
+    finally:
+        gauge_hub.unregister(connection)
+        print(f"✗ WebSocket gauge disconnesso (rimasti: {len(gauge_hub)})")
+
+
+def next_gauge_frame() -> bytes:
+    """Frame binario dello stato corrente con il prossimo numero di sequenza"""
+    global gauge_seq
+    gauge_seq += 1
+    return encode_gauge_frame(camper, gauge_seq)
+
+
+async def gauge_stream_loop():
+    """
+    Pubblica i frame binari ai client gauge a 30 Hz quando lo stato cambia
+    (almeno uno al secondo come heartbeat)
+    """
+    last_version = None
+    last_sent = 0.0
+    loop = asyncio.get_running_loop()
+    
+    while True:
+        task_supervisor.iteration()
+        now = loop.time()
+        if len(gauge_hub) and (camper.version != last_version or now - last_sent >= 1.0):
+            with gauge_broadcast_seconds.time():
+                gauge_hub.publish(next_gauge_frame(), key="state")
+            last_version = camper.version
+            last_sent = now
         
-        # Rimuovi connessioni morte
-        for conn in disconnected:
-            if conn in active_connections:
-                active_connections.remove(conn)
+        await asyncio.sleep(GAUGE_TICK)
+
+
+def render_vehicle_frame(connection: HubConnection):
+    """
+    Calcola il frame (keyframe o delta) per una connessione al momento
+    dell'invio, così i frame scartati dalla coda non perdono modifiche
+    """
+    return connection.context.render(camper, vehicle_frames)
+
+
+# Campionamento per topic e frequenza dei client JSON
+vehicle_scheduler = TopicScheduler(camper, render_vehicle_frame)
+
+# Allarmi attivati o rientrati: invio immediato, senza attendere il topic
+alert_engine.on_change = lambda: vehicle_scheduler.notify("alerts")
+
+
+async def broadcast_update(*topics: str):
+    """
+    Segnala una modifica allo scheduler dei topic: i gruppi già scaduti
+    (e quelli dei topic indicati) inviano dopo una breve finestra di
+    coalescenza, gli altri alla loro prossima scadenza.
+    Non attende l'invio: ogni connessione ha il suo writer.
+    
+    Args:
+        topics: Topic modificati da un comando dell'utente
+    """
+    vehicle_scheduler.notify(*topics)
+
+
+@app.get("/api/broadcast/stats")
+async def get_broadcast_stats():
+    """
+    Contatori dei WebSocket (inviati, scartati, in ritardo, espulsi)
+    
+    Returns:
+        dict: Statistiche per canale
+    """
+    return {
+        "vehicle": {**vehicle_hub.stats(), "scheduler": vehicle_scheduler.stats()},
+        "gauges": gauge_hub.stats(),
+        "battery": battery_hub.stats(),
+        "shared_state": shared_state.stats()
+    }
+
+
+# ============================================
+# METRICHE
+# ============================================
+
+def websocket_hubs():
+    return {"veicolo": vehicle_hub, "gauge": gauge_hub, "batteria": battery_hub}
+
+
+Sampled(
+    "camper_ws_connections",
+    "Connessioni WebSocket attive per canale",
+    ("channel",),
+    lambda: {(name,): len(hub) for name, hub in websocket_hubs().items()}
+)
+Sampled(
+    "camper_ws_frames_total",
+    "Frame WebSocket per canale ed esito (sent, dropped, coalesced, late, evicted, errors)",
+    ("channel", "outcome"),
+    lambda: {
+        (name, outcome): getattr(hub, outcome)
+        for name, hub in websocket_hubs().items()
+        for outcome in ("sent", "dropped", "coalesced", "late", "evicted", "errors")
+    },
+    kind="counter"
+)
+Sampled(
+    "camper_can_frames_total",
+    "Frame CAN per esito (decoded, unknown, unavailable, errors)",
+    ("outcome",),
+    lambda: {(outcome,): count for outcome, count in vehicle_can.counters().items()} if vehicle_can else {},
+    kind="counter"
+)
+Sampled(
+    "camper_task_cpu_seconds_total",
+    "Tempo CPU dell'event loop speso in ogni task in background",
+    ("task",),
+    lambda: {(stats.name,): stats.cpu_seconds for stats in task_supervisor.tasks.values()},
+    kind="counter"
+)
+Sampled(
+    "camper_task_restarts_total",
+    "Riavvii dei task in background dopo un errore",
+    ("task",),
+    lambda: {(stats.name,): stats.restarts for stats in task_supervisor.tasks.values()},
+    kind="counter"
+)
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """
+    Metriche in formato testo Prometheus
+    Latenza per route, WebSocket, broadcast, loop batteria e ritardo dell'event loop
+    """
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/api/debug/loop-blocks")
+async def get_loop_blocks(reset: bool = False):
+    """
+    Punti di chiamata che hanno bloccato l'event loop (watchdog, LOOP_WATCHDOG=true)
+    
+    Args:
+        reset: Azzera le statistiche dopo averle lette
+    
+    Returns:
+        dict: Stalli rilevati e punti di blocco ordinati per tempo totale
+    """
+    report = loop_watchdog.report()
+    if reset:
+        loop_watchdog.reset()
+    return report
+
+
+@app.get("/api/debug/startup")
+async def get_startup_report():
+    """
+    Tempi di avvio: import per modulo, fasi dello startup e servizi hardware
+    
+    Returns:
+        dict: Import (totale e proprio), fasi, servizi (primo uso o background)
+    """
+    return startup_report.report(services)
+
+
+@app.get("/api/debug/tasks")
+async def get_background_tasks():
+    """
+    Loop in background del supervisore, dal più costoso in CPU
+    
+    Returns:
+        dict: Per task stato (running/backoff/finished/failed/cancelled), riavvii,
+              ultimo errore, tempo di vita, tempo e CPU spesi nel task, risvegli e giri
+    """
+    return {"tasks": task_supervisor.stats()}
 
 
 # ============================================
@@ -271,12 +541,29 @@ async def simulate_driving():
     """
     print("🚐 Simulazione guida avviata")
     
+    # Velocità e giri vengono integrati a 30 Hz per avere aghi fluidi,
+    # il resto (e il broadcast JSON) resta a 500ms
+    substeps = int(round(SIM_TICK / GAUGE_TICK))
+    rpm_noise = 0.0
+    
     while True:
-        if camper.engine_running:
-            # Simula variazioni realistiche velocità
-            camper.speed = max(0, min(120, camper.speed + random.uniform(-2, 3)))
-            camper.rpm = int(camper.speed * 40 + random.uniform(-100, 100))
+        task_supervisor.iteration()
+        rpm_noise = random.uniform(-100, 100)
+        
+        for _ in range(substeps):
+            if camper.engine_running:
+                # Simula variazioni realistiche velocità
+                delta = random.uniform(-2, 3) / substeps
+                camper.speed = max(0, min(120, camper.speed + delta))
+                camper.rpm = max(0, int(camper.speed * 40 + rpm_noise))
+            else:
+                # Motore spento
+                camper.speed = 0
+                camper.rpm = 0
             
+            await asyncio.sleep(GAUGE_TICK)
+        
+        if camper.engine_running:
             # Consumo carburante
             if camper.speed > 0:
                 camper.fuel_level = max(0, camper.fuel_level - 0.001)
@@ -284,10 +571,6 @@ async def simulate_driving():
             # Variazioni batterie
             camper.battery_main = 12.4 + random.uniform(-0.1, 0.1)
             camper.battery_service = 13.0 + random.uniform(-0.2, 0.2)
-        else:
-            # Motore spento
-            camper.speed = 0
-            camper.rpm = 0
         
         # Temperatura varia lentamente
         camper.temperature_inside += random.uniform(-0.1, 0.1)
@@ -298,45 +581,321 @@ async def simulate_driving():
         camper.grey_water = min(100, camper.grey_water + random.uniform(0, 0.005))
         camper.black_water = min(100, camper.black_water + random.uniform(0, 0.003))
         
-        # Broadcast aggiornamenti
-        await broadcast_update()
+        record_vehicle_telemetry(time.time())
         
-        # Aggiorna ogni 500ms
-        await asyncio.sleep(0.5)
+        # Broadcast aggiornamenti (ogni 500ms, ai topic già scaduti)
+        await broadcast_update()
+
+
+def record_vehicle_telemetry(now: float):
+    """Storico, log su disco, parziali, previsioni serbatoi e allarmi di un tick veicolo"""
+    # Storico (memoria + log su disco)
+    sample = {metric: getattr(camper, metric) for metric in HISTORY_METRICS}
+    history.record(sample, now)
+    telemetry_log.record(sample, now)
+    
+    # Computer di bordo (parziali e contachilometri) e previsioni serbatoi
+    trip_computer.update(now)
+    forecaster.update_tanks(camper, now)
+    alert_engine.observe(camper, now)
+
+
+# ============================================
+# REPLAY SESSIONI
+# ============================================
+
+# Motore di replay attivo (None con la simulazione casuale)
+vehicle_replay: Optional[ReplayEngine] = None
+
+# Tempo di registrazione dell'ultimo campione riprodotto
+replay_last_sample: Optional[float] = None
+
+
+async def on_replay_sample(recorded_at: float):
+    """
+    Campione di replay applicato: storico in memoria, parziali, previsioni e broadcast
+    Non scrive sul log su disco, per non mescolare dati riprodotti e reali.
+    
+    Args:
+        recorded_at: Tempo del campione nella registrazione
+    """
+    global replay_last_sample
+    
+    # Storico ordinato nel tempo: riparte vuoto all'inizio del replay e a ogni giro
+    if replay_last_sample is None or recorded_at < replay_last_sample:
+        history.clear()
+    replay_last_sample = recorded_at
+    
+    history.record({metric: getattr(camper, metric) for metric in HISTORY_METRICS}, recorded_at)
+    trip_computer.update(recorded_at)
+    forecaster.update_tanks(camper, recorded_at)
+    alert_engine.observe(camper, recorded_at)
+    await broadcast_update()
+
+
+async def start_vehicle_source():
+    """Avvia la sorgente dati veicolo scelta con VEHICLE_SOURCE"""
+    global vehicle_replay
+    
+    source = os.getenv("VEHICLE_SOURCE", "simulation").lower()
+    if source in ("can", "obd"):
+        await trip_computer.start()
+        started = await start_can_source() if source == "can" else await start_obd_source()
+        if not started:
+            task_supervisor.spawn("simulation", simulate_driving)
+        return
+    
+    try:
+        recording = await asyncio.to_thread(recording_from_env, LOG_DIR)
+    except Exception as e:
+        print(f"❌ Replay non disponibile ({e}), uso la simulazione")
+        recording = None
+    
+    if recording is not None and len(recording) == 0:
+        recording = None
+    
+    # Il replay non deve alterare contachilometri e parziali salvati
+    await trip_computer.start(persist=recording is None)
+    
+    if recording is None:
+        task_supervisor.spawn("simulation", simulate_driving)
+        return
+    
+    vehicle_replay = ReplayEngine(
+        camper,
+        recording,
+        speed=float(os.getenv("REPLAY_SPEED", "1")),
+        loop=os.getenv("REPLAY_LOOP", "true").lower() == "true",
+        on_sample=on_replay_sample
+    )
+    task_supervisor.spawn("replay", vehicle_replay.run)
+
+
+# ============================================
+# BUS CAN
+# ============================================
+
+# Sorgente CAN attiva (VEHICLE_SOURCE=can)
+vehicle_can: Optional["CanSource"] = None
+
+
+async def start_can_source() -> bool:
+    """Apre il bus CAN; False (simulazione) se non disponibile"""
+    global vehicle_can
+    
+    from can_source import CanSource
+    source = CanSource(camper, on_batch=broadcast_update)
+    try:
+        await source.start()
+    except Exception as e:
+        print(f"❌ Bus CAN non disponibile ({e}), uso la simulazione")
+        return False
+    
+    vehicle_can = source
+    task_supervisor.spawn("bus_telemetry", bus_telemetry_loop)
+    return True
+
+
+# ============================================
+# OBD-II (ELM327)
+# ============================================
+
+# Sorgente OBD-II attiva (VEHICLE_SOURCE=obd)
+vehicle_obd: Optional["ObdSource"] = None
+
+
+async def start_obd_source() -> bool:
+    """Apre l'adattatore ELM327; False (simulazione) se non disponibile"""
+    global vehicle_obd
+    
+    from obd_source import ObdSource
+    source = ObdSource(camper, on_batch=broadcast_update)
+    try:
+        await source.start()
+    except Exception as e:
+        print(f"❌ Adattatore OBD-II non disponibile ({e}), uso la simulazione")
+        source.adapter.close()
+        return False
+    
+    vehicle_obd = source
+    task_supervisor.spawn("bus_telemetry", bus_telemetry_loop)
+    return True
+
+
+async def bus_telemetry_loop():
+    """Storico e parziali alla cadenza della simulazione (CAN/OBD aggiornano lo stato più spesso)"""
+    while True:
+        await asyncio.sleep(SIM_TICK)
+        task_supervisor.iteration()
+        record_vehicle_telemetry(time.time())
+
+
+@app.get("/api/replay/status")
+async def get_replay_status():
+    """
+    Sorgente dati veicolo e avanzamento del replay
+    
+    Returns:
+        dict: Stato replay (o sorgente "simulation")
+    """
+    if shared_state.is_follower:
+        return follower_replay_status or {"source": "simulation"}
+    if vehicle_can is not None:
+        return vehicle_can.stats()
+    if vehicle_obd is not None:
+        return vehicle_obd.stats()
+    if vehicle_replay is None:
+        return {"source": "simulation"}
+    return vehicle_replay.status()
+
+
+# ============================================
+# STATO CONDIVISO TRA WORKER (SHARED_STATE)
+# ============================================
+
+def shared_snapshot() -> dict:
+    """Stato pubblicato dall'owner nel segmento condiviso"""
+    return {
+        "vehicle": {field: getattr(camper, field) for field in STATE_FIELDS},
+        "updated_at": camper.updated_at.isoformat(),
+        "battery": battery_service.build_battery_status(),
+        "replay": vehicle_replay.status() if vehicle_replay else None,
+        # Versioni dell'owner: i follower le usano negli ETag
+        "boot_id": BOOT_ID,
+        "versions": {"vehicle": camper.version, "battery": battery_service.battery_version},
+    }
+
+
+def shared_version():
+    """Cambia quando cambia qualcosa da pubblicare"""
+    return camper.version, battery_service.battery_version
+
+
+async def apply_shared_snapshot(snapshot: dict):
+    """Specchia lo stato dell'owner nel worker follower"""
+    global follower_replay_status, follower_vehicle_version
+    
+    # Le bande morte di CamperState scartano i campi invariati
+    for field, value in snapshot["vehicle"].items():
+        setattr(camper, field, value)
+    # Stesso timestamp e stessa versione dell'owner: stesso body e stesso ETag in ogni worker
+    camper.updated_at = datetime.fromisoformat(snapshot["updated_at"])
+    boot_id, versions = snapshot["boot_id"], snapshot["versions"]
+    follower_vehicle_version = (versions["vehicle"], boot_id)
+    follower_replay_status = snapshot.get("replay")
+    await battery_service.apply_shared_battery(snapshot["battery"], (versions["battery"], boot_id))
+    await broadcast_update()
+
+
+# Stato del replay e versione dello stato dell'owner visti da un follower
+follower_replay_status: Optional[dict] = None
+follower_vehicle_version: Optional[Tuple[int, str]] = None
+
+
+async def promote_to_owner():
+    """Follower promosso a owner (il precedente è terminato): riprende l'I/O"""
+    global follower_replay_status, follower_vehicle_version
+    
+    follower_replay_status = None
+    follower_vehicle_version = None
+    await battery_service.apply_shared_battery(None)
+    await start_owner_services()
+
+
+async def start_owner_services():
+    """Log, sorgente veicolo, batteria e pubblicazione dello stato (owner o processo unico)"""
+    # Log telemetria: ripristina lo storico prima di nuovi campioni
+    with startup_report.phase("telemetry_log"):
+        await telemetry_log.start(history)
+    
+    # Avvia simulazione guida (o replay di una sessione)
+    with startup_report.phase("vehicle_source"):
+        await start_vehicle_source()
+    
+    # Avvia servizio batteria
+    with startup_report.phase("battery_service"):
+        await startup_battery_service()
+    
+    if shared_state.role == "owner":
+        with startup_report.phase("shared_state"):
+            await shared_state.start_owner(shared_snapshot, shared_version)
+
+
+async def owner_light(light_id: str, control: dict):
+    return await control_light(light_id, LightControl(**control))
+
+
+async def owner_commands(commands: dict):
+    return await apply_commands(VehicleCommands(**commands))
+
+
+# Comandi che un follower inoltra all'owner
+shared_state.register("light", owner_light)
+shared_state.register("engine_toggle", toggle_engine)
+shared_state.register("commands", owner_commands)
 
 
 # ============================================
 # LIFECYCLE EVENTS
 # ============================================
 
-@app.on_event("startup")
 async def startup_event():
     """Eseguito all'avvio dell'applicazione"""
     print("\n" + "="*50)
     print("🚐 CAMPER INFOTAINMENT SYSTEM")
     print("="*50)
     
-    # Avvia simulazione guida
-    asyncio.create_task(simulate_driving())
+    # Con più worker (SHARED_STATE) solo l'owner fa I/O: i follower specchiano
+    # (un follower che trova il lock libero durante l'attesa diventa owner)
+    if shared_state.elect() == "follower":
+        with startup_report.phase("shared_state"):
+            await shared_state.start_follower(apply_shared_snapshot, promote_to_owner)
+    if not shared_state.is_follower:
+        await start_owner_services()
     
-    # Avvia servizio batteria
-    await startup_battery_service()
+    task_supervisor.spawn("gauge_stream", gauge_stream_loop)
+    task_supervisor.spawn("loop_lag", monitor_event_loop)
+    if LOOP_WATCHDOG_ENABLED:
+        await loop_watchdog.start()
+    task_supervisor.spawn("vehicle_scheduler", vehicle_scheduler.run)
+    
+    # Bluetooth, audio e driver BLE: in background, a cruscotto già servito
+    startup_report.mark_ready()
+    task_supervisor.spawn("services_warm_up", services.warm_up, restart=False)
     
     print("\n✓ Sistema avviato correttamente")
+    startup_report.print_summary()
     print(f"✓ API disponibile su http://localhost:8000")
     print(f"✓ Documentazione su http://localhost:8000/docs")
     print("="*50 + "\n")
 
 
-@app.on_event("shutdown")
 async def shutdown_event():
     """Eseguito allo spegnimento dell'applicazione"""
     print("\n" + "="*50)
     print("🛑 Arresto sistema...")
     
+    # Chiudi WebSocket veicolo
+    await vehicle_hub.close_all()
+    await gauge_hub.close_all()
+    
+    # Ferma i loop in background prima di chiudere log e sorgenti
+    await task_supervisor.shutdown()
+    
     # Arresta servizio batteria
     await shutdown_battery_service()
     
+    # Scarica gli ultimi campioni su disco (solo chi li scrive)
+    if not shared_state.is_follower:
+        await telemetry_log.stop()
+        await trip_computer.stop()
+    if vehicle_can is not None:
+        await vehicle_can.stop()
+    if vehicle_obd is not None:
+        await vehicle_obd.stop()
+    await loop_watchdog.stop()
+    await shared_state.stop()
+    
     print("✓ Sistema arrestato")
     print("="*50 + "\n")
 
@@ -4,29 +4,44 @@ API Routes per controllo audio
 - FM e USB mock per ora (reali su RPi)
 """
 
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Request
 from pydantic import BaseModel
 from typing import Optional, List
 import platform
 import os
 
 # Import servizi
-from bluetooth_service import BluetoothService
-
-# Bluetooth reale sempre
-bluetooth_service = BluetoothService()
+from broadcast_hub import encode_json
+from http_cache import conditional_response, content_etag
+from service_registry import services
 
 # FM e USB mock per ora
 IS_RASPBERRY_PI = os.path.exists('/proc/device-tree/model')
 
-if IS_RASPBERRY_PI:
-    print("[API] Rilevato Raspberry Pi")
-    from audio_hardware_service import AudioHardwareService
-    audio_service = AudioHardwareService()
-else:
+
+def create_bluetooth_service():
+    """Bluetooth reale sempre (l'import prova bleak: lento sul Pi)"""
+    from bluetooth_service import BluetoothService
+    return BluetoothService()
+
+
+def create_audio_service():
+    """Audio hardware su Raspberry Pi, mock altrove"""
+    if IS_RASPBERRY_PI:
+        print("[API] Rilevato Raspberry Pi")
+        from audio_hardware_service import AudioHardwareService
+        return AudioHardwareService()
+    
     print(f"[API] Rilevato {platform.system()} - FM/USB mock, Bluetooth REALE")
     from audio_mock_service import AudioMockService
-    audio_service = AudioMockService()
+    return AudioMockService()
+
+
+# Creati al primo uso o in background dopo l'avvio
+services.register("bluetooth", create_bluetooth_service)
+services.register("audio", create_audio_service)
+bluetooth_service = services.proxy("bluetooth")
+audio_service = services.proxy("audio")
 
 router = APIRouter(prefix="/api/media", tags=["media"])
 
@@ -194,16 +209,17 @@ async def stop_usb():
 # ==================== CONTROLLO GENERALE ====================
 
 @router.get("/status")
-async def get_media_status():
-    """Stato audio completo"""
+async def get_media_status(request: Request):
+    """Stato audio completo (ETag sul contenuto, 304 se invariato)"""
     audio_status = audio_service.get_status()
     bt_device = bluetooth_service.get_connected_device()
     
-    return {
+    body = encode_json({
         **audio_status,
         "bluetooth_connected": bt_device is not None,
         "bluetooth_device": bt_device
-    }
+    })
+    return conditional_response(request, content_etag("media", body), body)
 
 @router.post("/stop-all")
 async def stop_all_media():
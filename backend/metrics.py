@@ -0,0 +1,353 @@
+"""
+Metriche in formato Prometheus (testo, esposte su /metrics)
+Contatori e istogrammi a bucket fissi preallocati: registrare un valore
+costa una bisect e due somme, nessuna allocazione sul percorso caldo.
+
+- Counter / Histogram: aggiornati dal codice (.labels(...) va memorizzato)
+- Sampled: valori letti solo allo scrape (es. contatori già tenuti dagli hub)
+"""
+
+import asyncio
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, List, Sequence, Tuple
+
+# Bucket di latenza (secondi): da 0.5ms a 10s
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Intervallo di campionamento del ritardo dell'event loop
+LOOP_LAG_INTERVAL = 0.25
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class CounterChild:
+    """Serie di un contatore per una combinazione di label"""
+
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount: float = 1):
+        self.value += amount
+
+
+class HistogramChild:
+    """Serie di un istogramma: conteggi per bucket preallocati"""
+
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def time(self) -> "_Timer":
+        """Context manager che registra la durata del blocco"""
+        return _Timer(self)
+
+
+class _Timer:
+    __slots__ = ("child", "start")
+
+    def __init__(self, child: HistogramChild):
+        self.child = child
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.child.observe(time.perf_counter() - self.start)
+
+
+class Metric:
+    """Base comune: nome, descrizione, label e serie per combinazione"""
+
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.children: Dict[Tuple[str, ...], object] = {}
+        registry.register(self)
+
+    def labels(self, *values: str):
+        """Serie per i valori di label indicati (creata al primo uso)"""
+        child = self.children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name}: attese label {self.labelnames}")
+            child = self.children[values] = self._new_child()
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(Metric):
+    """Contatore monotono"""
+
+    kind = "counter"
+
+    def _new_child(self):
+        return CounterChild()
+
+    def inc(self, amount: float = 1):
+        """Incremento della serie senza label"""
+        self.labels().inc(amount)
+
+    def render(self) -> List[str]:
+        lines = self.header()
+        for values, child in self.children.items():
+            lines.append(f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(child.value)}")
+        return lines
+
+
+class Histogram(Metric):
+    """Istogramma a bucket cumulativi"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.bounds = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return HistogramChild(self.bounds)
+
+    def observe(self, value: float):
+        """Osservazione sulla serie senza label"""
+        self.labels().observe(value)
+
+    def render(self) -> List[str]:
+        lines = self.header()
+        for values, child in self.children.items():
+            cumulative = 0
+            for bound, count in zip(self.bounds + (float("inf"),), child.counts):
+                cumulative += count
+                labels = _format_labels(self.labelnames, values, f'le="{_format_value(bound)}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, values)
+            lines.append(f"{self.name}_sum{labels} {_format_value(child.sum)}")
+            lines.append(f"{self.name}_count{labels} {child.count}")
+        return lines
+
+
+class Sampled(Metric):
+    """Valori calcolati allo scrape da una funzione {(label...): valore}"""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str],
+                 collect: Callable[[], Dict[Tuple[str, ...], float]], kind: str = "gauge"):
+        self.kind = kind
+        self.collect = collect
+        super().__init__(name, documentation, labelnames)
+
+    def labels(self, *values: str):
+        # Nessuna serie da aggiornare: i valori arrivano tutti da collect()
+        raise TypeError(f"{self.name}: metrica campionata allo scrape, i valori vengono da collect()")
+
+    def render(self) -> List[str]:
+        lines = self.header()
+        for values, value in self.collect().items():
+            lines.append(f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(value)}")
+        return lines
+
+
+class MetricsRegistry:
+    """Insieme delle metriche esposte su /metrics"""
+
+    def __init__(self):
+        self.metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric):
+        if metric.name in self.metrics:
+            raise ValueError(f"Metrica già registrata: {metric.name}")
+        self.metrics[metric.name] = metric
+
+    def render(self) -> str:
+        """Esposizione in formato testo Prometheus 0.0.4"""
+        lines = []
+        for metric in self.metrics.values():
+            try:
+                lines.extend(metric.render())
+            except Exception as e:
+                print(f"❌ Errore metrica {metric.name}: {e}")
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+# ============================================
+# METRICHE CONDIVISE
+# ============================================
+
+http_request_seconds = Histogram(
+    "camper_http_request_duration_seconds",
+    "Durata delle richieste HTTP per route",
+    ("group", "method", "route")
+)
+http_requests = Counter(
+    "camper_http_requests_total",
+    "Richieste HTTP per route e codice di stato",
+    ("group", "method", "route", "status")
+)
+broadcast_seconds = Histogram(
+    "camper_broadcast_duration_seconds",
+    "Durata di un broadcast (campionamento e accodamento dei frame)",
+    ("channel",)
+)
+ws_send_seconds = Histogram(
+    "camper_ws_send_duration_seconds",
+    "Durata di rendering e invio di un frame a un client",
+    ("channel",)
+)
+battery_loop_seconds = Histogram(
+    "camper_battery_loop_duration_seconds",
+    "Durata di un'iterazione di battery_monitoring_loop (lettura, storico, broadcast)"
+)
+loop_lag_seconds = Histogram(
+    "camper_event_loop_lag_seconds",
+    "Ritardo del risveglio dell'event loop rispetto al previsto",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+)
+
+
+# ============================================
+# MIDDLEWARE HTTP
+# ============================================
+
+class MetricsMiddleware:
+    """
+    Middleware ASGI che misura ogni richiesta HTTP
+    La route è il template FastAPI (es. /api/lights/{light_id}), ricavato
+    dall'endpoint che il router lascia nello scope.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.routes: Dict[object, str] = {}
+        self.children: Dict[Tuple, Tuple[Tuple[str, ...], HistogramChild, Dict[int, CounterChild]]] = {}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            self._observe(scope, status, time.perf_counter() - start)
+
+    def _observe(self, scope, status: int, elapsed: float):
+        endpoint = scope.get("endpoint")
+        key = (scope["method"], endpoint)
+        series = self.children.get(key)
+        if series is None:
+            route = self._route_path(scope, endpoint)
+            labels = (route_group(route), scope["method"], route)
+            series = self.children[key] = (labels, http_request_seconds.labels(*labels), {})
+
+        labels, histogram, counters = series
+        histogram.observe(elapsed)
+        counter = counters.get(status)
+        if counter is None:
+            counter = counters[status] = http_requests.labels(*labels, str(status))
+        counter.inc()
+
+    def _route_path(self, scope, endpoint) -> str:
+        if endpoint is None:
+            return "<unmatched>"
+        if not self.routes:
+            app = scope.get("app")
+            for route in getattr(app, "routes", ()):
+                self.routes.setdefault(getattr(route, "endpoint", None), route.path)
+        return self.routes.get(endpoint, "<unmatched>")
+
+
+def route_group(path: str) -> str:
+    """Area funzionale di una route (media, battery, history, vehicle, system)"""
+    for prefix, group in (
+        ("/api/media", "media"),
+        ("/api/battery", "battery"),
+        ("/api/history", "history"),
+        ("/api/", "vehicle"),
+    ):
+        if path.startswith(prefix):
+            return group
+    return "system"
+
+
+# ============================================
+# RITARDO EVENT LOOP
+# ============================================
+
+loop_lag_last = 0.0
+loop_lag_max = 0.0
+
+
+async def monitor_event_loop(interval: float = LOOP_LAG_INTERVAL):
+    """
+    Misura di quanto il risveglio di una sleep arriva in ritardo
+    Un valore alto indica codice bloccante sull'event loop.
+    """
+    global loop_lag_last, loop_lag_max
+    loop = asyncio.get_running_loop()
+
+    while True:
+        start = loop.time()
+        await asyncio.sleep(interval)
+        lag = max(0.0, loop.time() - start - interval)
+        loop_lag_seconds.observe(lag)
+        loop_lag_last = lag
+        loop_lag_max = max(loop_lag_max, lag)
+
+
+Sampled(
+    "camper_event_loop_lag_last_seconds",
+    "Ultimo ritardo misurato dell'event loop",
+    (),
+    lambda: {(): loop_lag_last}
+)
+Sampled(
+    "camper_event_loop_lag_max_seconds",
+    "Ritardo massimo dell'event loop dall'avvio",
+    (),
+    lambda: {(): loop_lag_max}
+)
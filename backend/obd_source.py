@@ -0,0 +1,392 @@
+"""
+Dati veicolo da OBD-II tramite adattatore ELM327 (VEHICLE_SOURCE=obd)
+Per i mezzi senza accesso diretto al CAN. Ogni richiesta all'adattatore
+costa 50-100ms, quindi i PID non vengono letti tutti in giro:
+- priorità: giri e velocità ad ogni ciclo, gli altri ogni N secondi
+- richieste multi-PID ("01 0C 0D 05": fino a 6 PID per richiesta) se la
+  centralina le supporta, altrimenti un PID per richiesta
+- intervalli adattivi: se la latenza misurata dell'adattatore allunga il
+  ciclo oltre TARGET_CYCLE, i PID lenti vengono diradati in proporzione
+- i PID non supportati (maschere 0100/0120/0140) non vengono richiesti
+
+Il polling seriale gira in un thread; i valori di ogni ciclo vengono
+applicati a CamperState sull'event loop.
+
+Configurazione:
+    OBD_PORT=/dev/ttyUSB0   (o la pty stampata da elm327_emulator.py)
+    OBD_BAUDRATE=38400
+
+Installazione: pip install pyserial
+"""
+
+import asyncio
+import os
+import re
+import threading
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Sequence
+
+try:
+    import serial
+    SERIAL_AVAILABLE = True
+except ImportError:
+    serial = None
+    SERIAL_AVAILABLE = False
+
+from vehicle_state import CamperState
+
+OBD_PORT = os.getenv("OBD_PORT", "/dev/ttyUSB0")
+OBD_BAUDRATE = int(os.getenv("OBD_BAUDRATE", "38400"))
+
+# Timeout di una risposta dell'adattatore (ATZ e la ricerca del protocollo sono lenti)
+COMMAND_TIMEOUT = 2.0
+PROTOCOL_SEARCH_TIMEOUT = 10.0
+
+# Durata a cui punta un ciclo dei PID veloci e durata minima (per non saturare l'adattatore)
+TARGET_CYCLE = 0.2
+MIN_CYCLE = 0.05
+
+# Massimo PID per richiesta multi-PID (limite ELM327 / ISO 15765)
+MAX_PIDS_PER_REQUEST = 6
+
+# Peso della nuova misura nella media mobile esponenziale della latenza
+LATENCY_SMOOTHING = 0.2
+
+# Sopra questi giri il motore è considerato acceso
+ENGINE_RUNNING_RPM = 300
+
+# Attesa prima di riaprire l'adattatore dopo un errore
+RECONNECT_DELAY = 5.0
+
+# Righe dell'ELM327 che non contengono dati
+NO_DATA_LINES = ("NO DATA", "?", "STOPPED", "CAN ERROR", "BUS INIT", "UNABLE TO CONNECT", "ERROR")
+
+HEX_LINE = re.compile(r"^[0-9A-F]+$")
+ISOTP_LENGTH = re.compile(r"^[0-9A-F]{3}$")
+ISOTP_FRAME = re.compile(r"^[0-9A-F]:")
+
+
+class ObdPid:
+    """PID del modo 01 con decodifica, campo di CamperState e cadenza"""
+
+    def __init__(self, pid: int, name: str, length: int, decode: Callable[[bytes], float],
+                 field: Optional[str] = None, interval: float = 0.0, priority: int = 0):
+        """
+        Args:
+            pid: Numero PID (modo 01)
+            name: Nome del valore
+            length: Byte di dati nella risposta
+            decode: Byte -> valore fisico
+            field: Campo di CamperState (None = solo in /api/replay/status)
+            interval: Secondi tra due letture (0 = ogni ciclo)
+            priority: Ordine tra i PID scaduti nello stesso ciclo (più basso = prima)
+        """
+        self.pid = pid
+        self.name = name
+        self.length = length
+        self.decode = decode
+        self.field = field
+        self.interval = interval
+        self.priority = priority
+
+
+DEFAULT_PIDS = (
+    ObdPid(0x0C, "rpm", 2, lambda d: (d[0] * 256 + d[1]) / 4, field="rpm"),
+    ObdPid(0x0D, "speed", 1, lambda d: float(d[0]), field="speed"),
+    ObdPid(0x42, "module_voltage", 2, lambda d: (d[0] * 256 + d[1]) / 1000,
+           field="battery_main", interval=5.0, priority=1),
+    ObdPid(0x05, "coolant_temperature", 1, lambda d: d[0] - 40.0, interval=10.0, priority=2),
+    ObdPid(0x2F, "fuel_level", 1, lambda d: d[0] * 100 / 255, field="fuel_level", interval=30.0, priority=3),
+    ObdPid(0x46, "ambient_temperature", 1, lambda d: d[0] - 40.0,
+           field="temperature_outside", interval=60.0, priority=4),
+)
+
+
+def parse_mode01(lines: Sequence[str], lengths: Dict[int, int]) -> Dict[int, bytes]:
+    """
+    Dati per PID da una risposta del modo 01 (spazi e header disattivati)
+
+    Gestisce sia risposte a riga singola ("410C1AF8") sia multi-frame ISO-TP
+    ("00A", "0:410C1AF80D3C", "1:05..."), anche da più centraline.
+
+    Args:
+        lines: Righe della risposta senza prompt
+        lengths: Byte di dati di ogni PID noto
+    """
+    responses: List[bytes] = []
+    frames, total = "", None
+    for line in lines:
+        line = line.replace(" ", "")
+        if ISOTP_LENGTH.match(line):
+            if frames:
+                responses.append(bytes.fromhex(frames)[:total])
+            frames, total = "", int(line, 16)
+        elif ISOTP_FRAME.match(line):
+            frames += line[2:]
+        elif HEX_LINE.match(line) and len(line) % 2 == 0:
+            responses.append(bytes.fromhex(line))
+    if frames:
+        responses.append(bytes.fromhex(frames)[:total])
+
+    values: Dict[int, bytes] = {}
+    for data in responses:
+        if not data or data[0] != 0x41:
+            continue
+        i = 1
+        while i < len(data):
+            length = lengths.get(data[i])
+            if length is None or i + 1 + length > len(data):
+                break
+            values[data[i]] = data[i + 1:i + 1 + length]
+            i += 1 + length
+    return values
+
+
+def supported_from_bitmap(base: int, data: bytes) -> List[int]:
+    """PID supportati da una maschera 0100/0120/0140 (bit 31 = base + 1)"""
+    bits = int.from_bytes(data, "big")
+    return [base + i + 1 for i in range(32) if bits & (1 << (31 - i))]
+
+
+class Elm327:
+    """Adattatore ELM327 su porta seriale (chiamate bloccanti)"""
+
+    def __init__(self, port: str = OBD_PORT, baudrate: int = OBD_BAUDRATE):
+        self.port = port
+        self.baudrate = baudrate
+        self.connection = None
+        self.version = None
+
+    def open(self):
+        self.connection = serial.Serial(self.port, self.baudrate, timeout=COMMAND_TIMEOUT)
+        self.version = (self.command("ATZ") or ["?"])[-1]
+        for setup in ("ATE0", "ATL0", "ATS0", "ATH0", "ATAT2", "ATSP0"):
+            self.command(setup)
+
+    def close(self):
+        if self.connection:
+            self.connection.close()
+            self.connection = None
+
+    def command(self, command: str, timeout: float = COMMAND_TIMEOUT) -> List[str]:
+        """Invia un comando e ritorna le righe della risposta (fino al prompt ">")"""
+        connection = self.connection
+        connection.timeout = timeout
+        connection.reset_input_buffer()
+        connection.write(command.encode() + b"\r")
+        raw = connection.read_until(b">").decode(errors="replace")
+        if not raw.endswith(">"):
+            raise TimeoutError(f"Nessuna risposta ELM327 a {command}")
+
+        lines = [line.strip() for line in raw[:-1].replace("\n", "\r").split("\r")]
+        # Con l'eco ancora attivo (prima di ATE0) la prima riga è il comando
+        return [line for line in lines if line and line != command and line != "SEARCHING..."]
+
+    def query(self, pids: Sequence[ObdPid], timeout: float = COMMAND_TIMEOUT) -> Dict[int, bytes]:
+        """Richiesta modo 01 per uno o più PID"""
+        request = "01" + "".join(f"{pid.pid:02X}" for pid in pids)
+        lines = self.command(request, timeout)
+        if any(line.startswith(NO_DATA_LINES) for line in lines):
+            return {}
+        return parse_mode01(lines, {pid.pid: pid.length for pid in pids})
+
+    def supported_pids(self) -> List[int]:
+        """PID del modo 01 supportati dalla centralina (la prima richiesta cerca il protocollo)"""
+        supported: List[int] = []
+        for base in (0x00, 0x20, 0x40):
+            probe = ObdPid(base, "supported", 4, lambda d: 0.0)
+            timeout = PROTOCOL_SEARCH_TIMEOUT if base == 0 else COMMAND_TIMEOUT
+            data = self.query([probe], timeout).get(base)
+            if data is None:
+                break
+            supported += supported_from_bitmap(base, data)
+            if base + 0x20 not in supported:
+                break
+        return supported
+
+
+class PidScheduler:
+    """Sceglie i PID da leggere in ogni ciclo e li raggruppa in richieste"""
+
+    def __init__(self, pids: Sequence[ObdPid]):
+        self.pids = list(pids)
+        self.multi_pid = True
+        self.last_polled: Dict[int, float] = {pid.pid: float("-inf") for pid in pids}
+        self.latency: Optional[float] = None
+
+    def record_latency(self, seconds: float):
+        if self.latency is None:
+            self.latency = seconds
+        else:
+            self.latency += LATENCY_SMOOTHING * (seconds - self.latency)
+
+    @property
+    def stretch(self) -> float:
+        """Fattore di diradamento dei PID lenti (1 = intervalli nominali)"""
+        if self.latency is None:
+            return 1.0
+        fast = [pid for pid in self.pids if pid.interval == 0]
+        cycle = self.latency * len(self.group(fast))
+        return max(1.0, cycle / TARGET_CYCLE)
+
+    def due(self, now: float) -> List[ObdPid]:
+        """PID veloci più i lenti scaduti, in ordine di priorità"""
+        stretch = self.stretch
+        due = [
+            pid for pid in self.pids
+            if pid.interval == 0 or now - self.last_polled[pid.pid] >= pid.interval * stretch
+        ]
+        return sorted(due, key=lambda pid: (pid.priority, self.last_polled[pid.pid]))
+
+    def group(self, pids: Sequence[ObdPid]) -> List[List[ObdPid]]:
+        """Richieste da inviare (una per PID se il multi-PID non è supportato)"""
+        size = MAX_PIDS_PER_REQUEST if self.multi_pid else 1
+        return [list(pids[i:i + size]) for i in range(0, len(pids), size)]
+
+    def polled(self, pids: Sequence[ObdPid], now: float):
+        for pid in pids:
+            self.last_polled[pid.pid] = now
+
+
+class ObdSource:
+    """Polling dell'ELM327 in un thread e applicazione dei valori su CamperState"""
+
+    def __init__(self, state: CamperState, port: str = OBD_PORT, baudrate: int = OBD_BAUDRATE,
+                 pids: Sequence[ObdPid] = DEFAULT_PIDS,
+                 on_batch: Optional[Callable[[], Awaitable[None]]] = None):
+        """
+        Args:
+            state: Stato da alimentare
+            port, baudrate: Porta seriale dell'adattatore
+            pids: PID da leggere
+            on_batch: Chiamata dopo ogni ciclo che ha letto dei valori
+        """
+        self.state = state
+        self.adapter = Elm327(port, baudrate)
+        self.pids = list(pids)
+        self.scheduler = PidScheduler(pids)
+        self.on_batch = on_batch
+
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.thread: Optional[threading.Thread] = None
+        self.stopping = threading.Event()
+
+        self.values: Dict[str, float] = {}
+        self.unsupported: List[str] = []
+        self.cycles = 0
+        self.requests = 0
+        self.errors = 0
+        self.last_cycle = 0.0
+
+    # ==================== LIFECYCLE ====================
+
+    async def start(self):
+        """
+        Apre l'adattatore, rileva PID e multi-PID supportati e avvia il polling
+
+        Raises:
+            RuntimeError: se pyserial non è installato
+            serial.SerialException / TimeoutError: se l'adattatore non risponde
+        """
+        if not SERIAL_AVAILABLE:
+            raise RuntimeError("Libreria pyserial non installata. Esegui: pip install pyserial")
+
+        self.loop = asyncio.get_running_loop()
+        await asyncio.to_thread(self._connect)
+        self.stopping.clear()
+        self.thread = threading.Thread(target=self._poll_loop, name="obd-poller", daemon=True)
+        self.thread.start()
+        mode = "multi-PID" if self.scheduler.multi_pid else "un PID per richiesta"
+        print(f"✓ OBD-II {self.adapter.version} su {self.adapter.port} ({len(self.scheduler.pids)} PID, {mode})")
+
+    def _connect(self):
+        """Apertura e rilevamento (bloccante)"""
+        self.adapter.open()
+
+        supported = set(self.adapter.supported_pids())
+        if supported:
+            self.unsupported = [pid.name for pid in self.pids if pid.pid not in supported]
+            self.scheduler = PidScheduler([pid for pid in self.pids if pid.pid in supported])
+
+        fast = [pid for pid in self.scheduler.pids if pid.interval == 0]
+        if len(fast) >= 2:
+            # Le centraline senza multi-PID rispondono solo al primo
+            self.scheduler.multi_pid = len(self.adapter.query(fast[:2])) == 2
+
+    async def stop(self):
+        self.stopping.set()
+        if self.thread:
+            await asyncio.to_thread(self.thread.join, COMMAND_TIMEOUT * 2)
+        self.adapter.close()
+        self.thread = None
+
+    # ==================== POLLING (THREAD) ====================
+
+    def _poll_loop(self):
+        scheduler = self.scheduler
+        while not self.stopping.is_set():
+            started = time.monotonic()
+            values: Dict[int, bytes] = {}
+            try:
+                for request in scheduler.group(scheduler.due(started)):
+                    sent = time.monotonic()
+                    values.update(self.adapter.query(request))
+                    scheduler.record_latency(time.monotonic() - sent)
+                    scheduler.polled(request, sent)
+                    self.requests += 1
+            except Exception as e:
+                if self.stopping.is_set():
+                    break
+                self.errors += 1
+                print(f"❌ Errore OBD-II: {e}")
+                self._reconnect()
+                continue
+
+            self.cycles += 1
+            self.last_cycle = time.monotonic() - started
+            if values:
+                asyncio.run_coroutine_threadsafe(self._apply(values), self.loop)
+            self.stopping.wait(max(0.0, MIN_CYCLE - self.last_cycle))
+
+    def _reconnect(self):
+        self.adapter.close()
+        while not self.stopping.wait(RECONNECT_DELAY):
+            try:
+                self.adapter.open()
+                return
+            except Exception as e:
+                print(f"❌ Adattatore OBD-II non disponibile: {e}")
+
+    # ==================== APPLICAZIONE (EVENT LOOP) ====================
+
+    async def _apply(self, raw: Dict[int, bytes]):
+        by_pid = {pid.pid: pid for pid in self.pids}
+        for number, data in raw.items():
+            pid = by_pid[number]
+            value = pid.decode(data)
+            self.values[pid.name] = round(value, 3)
+            if pid.field:
+                setattr(self.state, pid.field, value)
+            if pid.field == "rpm":
+                self.state.engine_running = value >= ENGINE_RUNNING_RPM
+        if self.on_batch:
+            await self.on_batch()
+
+    # ==================== STATISTICHE ====================
+
+    def stats(self) -> Dict:
+        scheduler = self.scheduler
+        return {
+            "source": "obd",
+            "port": self.adapter.port,
+            "adapter": self.adapter.version,
+            "multi_pid": scheduler.multi_pid,
+            "latency_ms": round(scheduler.latency * 1000, 1) if scheduler.latency is not None else None,
+            "interval_stretch": round(scheduler.stretch, 2),
+            "cycle_ms": round(self.last_cycle * 1000, 1),
+            "cycles": self.cycles,
+            "requests": self.requests,
+            "errors": self.errors,
+            "unsupported": self.unsupported,
+            "values": self.values,
+        }
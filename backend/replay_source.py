@@ -0,0 +1,290 @@
+"""
+Sorgente replay per CamperState
+Riproduce una sessione registrata (log telemetria su disco) oppure un
+percorso sintetico deterministico (seed) a velocità 1x-100x, così i test
+di performance di cruscotto e broadcast sono riproducibili tra build.
+
+Selezione all'avvio (variabili d'ambiente):
+    VEHICLE_SOURCE=simulation|replay|synthetic   (default: simulation)
+    REPLAY_PATH=<cartella log>                   (default: log telemetria)
+    REPLAY_FROM / REPLAY_TO=<ISO o epoch>        (finestra da riprodurre)
+    REPLAY_SPEED=1..100                          (default: 1)
+    REPLAY_LOOP=true|false                       (default: true)
+    REPLAY_SEED=<int>, REPLAY_HOURS=<ore>        (solo synthetic, default 42 e 4)
+"""
+
+import asyncio
+import os
+import time
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, Optional
+
+import numpy as np
+
+from telemetry_log import TelemetryLog
+from vehicle_state import CamperState
+
+# Campi numerici che una registrazione può contenere
+REPLAY_FIELDS = (
+    "speed",
+    "rpm",
+    "fuel_level",
+    "water_tank",
+    "grey_water",
+    "black_water",
+    "battery_main",
+    "battery_service",
+    "temperature_inside",
+    "temperature_outside",
+)
+
+MIN_SPEED = 1.0
+MAX_SPEED = 100.0
+
+
+class Recording:
+    """Sessione allineata su una timeline comune: una colonna per campo"""
+
+    def __init__(self, times: np.ndarray, columns: Dict[str, np.ndarray], name: str):
+        self.times = times
+        self.columns = columns
+        self.name = name
+
+    def __len__(self) -> int:
+        return len(self.times)
+
+    @property
+    def duration(self) -> float:
+        return float(self.times[-1] - self.times[0]) if len(self.times) > 1 else 0.0
+
+
+def parse_time(value: Optional[str]) -> Optional[float]:
+    """Epoch da stringa ISO o numerica (None se vuota)"""
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
+
+def load_recording(path: str, start: Optional[float] = None, end: Optional[float] = None) -> Recording:
+    """
+    Carica una sessione dal log telemetria (bloccante: usare in un thread)
+
+    Args:
+        path: Cartella del log segmentato
+        start: Epoch inizio (default: inizio log)
+        end: Epoch fine (default: fine log)
+
+    Returns:
+        Recording: Campi interpolati sulla timeline dei campioni
+    """
+    log = TelemetryLog(path)
+    log._load_catalog()
+
+    start = 0.0 if start is None else start
+    end = float("inf") if end is None else end
+
+    series = {}
+    for field in REPLAY_FIELDS:
+        times, values = log.read(field, start, end)
+        if len(times):
+            order = np.argsort(times, kind="stable")
+            series[field] = (times[order], values[order].astype(np.float64))
+
+    if "speed" not in series:
+        raise ValueError(f"Nessuna registrazione di velocità in {path}")
+
+    # Timeline = campioni di velocità, gli altri campi interpolati sopra
+    timeline = series["speed"][0]
+    columns = {
+        field: np.interp(timeline, times, values)
+        for field, (times, values) in series.items()
+    }
+    return Recording(timeline, columns, name=f"log:{path}")
+
+
+def synthetic_drive(seed: int = 42, hours: float = 4.0, rate_hz: float = 2.0) -> Recording:
+    """
+    Percorso di montagna sintetico e deterministico
+
+    Tornanti in salita/discesa, tratti veloci di fondovalle e soste,
+    generati da un RNG con seed: stessa sequenza a ogni esecuzione.
+
+    Args:
+        seed: Seed del generatore
+        hours: Durata del percorso
+        rate_hz: Frequenza dei campioni
+
+    Returns:
+        Recording: Sessione sintetica
+    """
+    rng = np.random.default_rng(seed)
+    n = int(hours * 3600 * rate_hz)
+    dt = 1 / rate_hz
+    times = np.arange(n) * dt
+
+    # Profilo a segmenti: (velocità obiettivo, durata in secondi)
+    targets = np.empty(n)
+    i = 0
+    while i < n:
+        kind = rng.choice(["hairpins", "valley", "village", "stop"], p=[0.45, 0.3, 0.2, 0.05])
+        target, seconds = {
+            "hairpins": (rng.uniform(25, 45), rng.uniform(120, 600)),
+            "valley": (rng.uniform(70, 95), rng.uniform(300, 1200)),
+            "village": (rng.uniform(30, 50), rng.uniform(60, 240)),
+            "stop": (0.0, rng.uniform(30, 300)),
+        }[kind]
+        length = int(seconds * rate_hz)
+        targets[i:i + length] = target
+        i += length
+
+    # Inseguimento del target (accelerazione limitata) + rumore
+    speed = np.empty(n)
+    current = 0.0
+    noise = rng.normal(0, 0.6, n)
+    for k in range(n):
+        current += min(2.0 * dt, max(-3.0 * dt, targets[k] - current)) + noise[k] * dt
+        current = min(120.0, max(0.0, current))
+        speed[k] = current
+
+    # Marcia stimata e giri
+    gear_ratio = np.select(
+        [speed < 15, speed < 30, speed < 50, speed < 70, speed < 90],
+        [110, 70, 50, 38, 32],
+        default=28
+    )
+    rpm = np.where(speed > 0.5, 800 + speed * gear_ratio, 800.0)
+
+    # Quota: salite sui tornanti, consumi maggiori in salita
+    climb = np.where((targets > 0) & (targets < 46), 1.0, -0.3)
+    fuel = 90.0 - np.cumsum(speed * dt / 3600 * (0.14 + 0.06 * climb)) * 100 / 90
+    water = 95.0 - times / 3600 * 1.5
+    grey = 10.0 + times / 3600 * 1.2
+    black = 8.0 + times / 3600 * 0.4
+
+    # Temperatura esterna cala con la quota, interna segue lentamente
+    altitude = np.cumsum(np.where(speed > 0, climb * speed * dt / 3600 * 60, 0))
+    temp_out = 24.0 - altitude / 150 + rng.normal(0, 0.05, n)
+    temp_in = 21.0 + (temp_out - temp_out.mean()) * 0.2
+
+    columns = {
+        "speed": speed,
+        "rpm": rpm,
+        "fuel_level": np.clip(fuel, 0, 100),
+        "water_tank": np.clip(water, 0, 100),
+        "grey_water": np.clip(grey, 0, 100),
+        "black_water": np.clip(black, 0, 100),
+        "battery_main": 14.1 + rng.normal(0, 0.03, n),
+        "battery_service": 13.4 + rng.normal(0, 0.05, n),
+        "temperature_inside": temp_in,
+        "temperature_outside": temp_out,
+    }
+    return Recording(times, columns, name=f"synthetic:seed={seed}")
+
+
+class ReplayEngine:
+    """
+    Applica una Recording a CamperState rispettando i tempi (scalati)
+    on_sample riceve il tempo di registrazione del campione, così chi integra
+    nel tempo (es. computer di bordo) non dipende dalla velocità di replay.
+    """
+
+    def __init__(
+        self,
+        state: CamperState,
+        recording: Recording,
+        speed: float = 1.0,
+        loop: bool = True,
+        on_sample: Optional[Callable[[float], Awaitable[None]]] = None
+    ):
+        self.state = state
+        self.recording = recording
+        self.speed = max(MIN_SPEED, min(MAX_SPEED, speed))
+        self.loop = loop
+        self.on_sample = on_sample
+
+        self.position = 0
+        self.laps = 0
+        self.started_at: Optional[float] = None
+        self.behind = 0
+
+    def apply(self, index: int):
+        """Scrive su CamperState i valori del campione `index`"""
+        state = self.state
+        for field, column in self.recording.columns.items():
+            value = float(column[index])
+            setattr(state, field, int(value) if field == "rpm" else value)
+        state.engine_running = state.rpm > 0
+
+    async def run(self):
+        """Loop di replay (task in background)"""
+        recording = self.recording
+        times = recording.times
+        print(f"⏯️  Replay {recording.name}: {len(recording)} campioni, "
+              f"{recording.duration / 3600:.1f}h a {self.speed:g}x")
+
+        while True:
+            self.started_at = time.monotonic()
+            origin = times[0]
+
+            for index in range(len(times)):
+                self.position = index
+                due = self.started_at + (times[index] - origin) / self.speed
+                delay = due - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                else:
+                    # In ritardo sul tempo scalato: nessuna attesa, ma cede il loop
+                    self.behind += 1
+                    await asyncio.sleep(0)
+
+                self.apply(index)
+                if self.on_sample:
+                    await self.on_sample(float(times[index]))
+
+            self.laps += 1
+            if not self.loop:
+                break
+
+        self.state.speed = 0
+        self.state.rpm = 0
+        self.state.engine_running = False
+        print(f"⏹️  Replay {recording.name} terminato")
+
+    def status(self) -> Dict:
+        """Avanzamento del replay"""
+        total = len(self.recording)
+        return {
+            "source": self.recording.name,
+            "speed": self.speed,
+            "loop": self.loop,
+            "samples": total,
+            "position": self.position,
+            "progress": round(self.position / max(1, total - 1), 4),
+            "recording_seconds": self.recording.duration,
+            "laps": self.laps,
+            "late_samples": self.behind,
+        }
+
+
+def recording_from_env(default_path: str) -> Optional[Recording]:
+    """
+    Crea la Recording richiesta da VEHICLE_SOURCE (None = simulazione casuale)
+    Bloccante per il replay da log: chiamare in un thread.
+    """
+    source = os.getenv("VEHICLE_SOURCE", "simulation").lower()
+
+    if source == "replay":
+        return load_recording(
+            os.getenv("REPLAY_PATH", default_path),
+            parse_time(os.getenv("REPLAY_FROM")),
+            parse_time(os.getenv("REPLAY_TO"))
+        )
+    if source == "synthetic":
+        return synthetic_drive(
+            seed=int(os.getenv("REPLAY_SEED", "42")),
+            hours=float(os.getenv("REPLAY_HOURS", "4"))
+        )
+    return None
@@ -0,0 +1,255 @@
+"""
+Registro dei servizi hardware e report dei tempi di avvio
+I servizi costosi da creare (Bluetooth, audio, driver BLE della batteria)
+non vengono più istanziati all'import dei moduli: si registra una factory
+e l'istanza nasce al primo uso oppure in background, poco dopo che l'app
+ha iniziato a servire il cruscotto.
+
+    services.register("audio", create_audio_service)
+    audio_service = services.proxy("audio")   # usabile come l'istanza
+
+Il report di avvio (GET /api/debug/startup) riporta:
+- import: tempo di ogni modulo del backend (totale, e proprio esclusi i
+  moduli del backend importati a sua volta)
+- fasi: passi dello startup di main.py
+- servizi: tempo di creazione e se è avvenuta al primo uso o in background
+"""
+
+import asyncio
+import importlib.abc
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+# Cartella del backend: solo i suoi moduli compaiono nel report import
+PROJECT_DIR = str(Path(__file__).resolve().parent)
+
+# Attesa dopo lo startup prima di creare i servizi in background
+WARMUP_DELAY = 1.0
+
+
+# ============================================
+# REGISTRO SERVIZI
+# ============================================
+
+class ServiceEntry:
+    """Servizio registrato e il suo stato di inizializzazione"""
+
+    def __init__(self, name: str, factory: Callable[[], Any], background: bool):
+        self.name = name
+        self.factory = factory
+        self.background = background
+        self.instance: Any = None
+        self.state = "pending"
+        self.init_seconds: Optional[float] = None
+        self.initialized_by: Optional[str] = None
+        self.error: Optional[str] = None
+        self.lock = threading.Lock()
+
+    def to_dict(self) -> Dict:
+        return {
+            "name": self.name,
+            "state": self.state,
+            "init_ms": round(self.init_seconds * 1000, 1) if self.init_seconds is not None else None,
+            "initialized_by": self.initialized_by,
+            "error": self.error,
+        }
+
+
+class LazyService:
+    """Segnaposto che crea il servizio al primo accesso a un attributo"""
+
+    def __init__(self, registry: "ServiceRegistry", name: str):
+        object.__setattr__(self, "_registry", registry)
+        object.__setattr__(self, "_name", name)
+
+    def __getattr__(self, attr: str):
+        return getattr(self._registry.get(self._name), attr)
+
+    def __setattr__(self, attr: str, value: Any):
+        setattr(self._registry.get(self._name), attr, value)
+
+
+class ServiceRegistry:
+    """Factory dei servizi hardware, create al primo uso o in background"""
+
+    def __init__(self):
+        self.entries: Dict[str, ServiceEntry] = {}
+
+    def register(self, name: str, factory: Callable[[], Any], background: bool = True):
+        """
+        Registra un servizio
+
+        Args:
+            name: Nome del servizio
+            factory: Crea l'istanza (gli import pesanti vanno dentro la factory)
+            background: Crealo anche in background dopo l'avvio (False = solo al primo uso)
+        """
+        self.entries[name] = ServiceEntry(name, factory, background)
+
+    def get(self, name: str) -> Any:
+        """Istanza del servizio, creata ora se necessario (può bloccare)"""
+        entry = self.entries[name]
+        if entry.state != "ready":
+            self._construct(entry, "first_use")
+        return entry.instance
+
+    def proxy(self, name: str) -> LazyService:
+        return LazyService(self, name)
+
+    def _construct(self, entry: ServiceEntry, initialized_by: str):
+        with entry.lock:
+            if entry.state == "ready":
+                return
+            started = time.perf_counter()
+            try:
+                entry.instance = entry.factory()
+            except Exception as e:
+                # Nessuna istanza: il prossimo uso riprova
+                entry.state = "failed"
+                entry.error = str(e)
+                raise
+            finally:
+                entry.init_seconds = time.perf_counter() - started
+            entry.state = "ready"
+            entry.initialized_by = initialized_by
+            entry.error = None
+
+    async def warm_up(self, delay: float = WARMUP_DELAY):
+        """Crea in un thread, uno alla volta, i servizi non ancora usati"""
+        await asyncio.sleep(delay)
+        for entry in list(self.entries.values()):
+            if not entry.background or entry.state == "ready":
+                continue
+            try:
+                await asyncio.to_thread(self._construct, entry, "background")
+            except Exception as e:
+                print(f"❌ Servizio {entry.name} non inizializzato: {e}")
+        ready = sum(entry.state == "ready" for entry in self.entries.values())
+        print(f"✓ Servizi hardware pronti ({ready}/{len(self.entries)})")
+
+    def stats(self) -> List[Dict]:
+        return [entry.to_dict() for entry in self.entries.values()]
+
+
+# ============================================
+# TEMPI DI AVVIO
+# ============================================
+
+class _TimedLoader(importlib.abc.Loader):
+    """Loader che misura l'esecuzione di un modulo e delega il resto all'originale"""
+
+    def __init__(self, loader, name: str, report: "StartupReport"):
+        self.loader = loader
+        self.name = name
+        self.report = report
+
+    def create_module(self, spec):
+        return self.loader.create_module(spec)
+
+    def exec_module(self, module):
+        self.report._enter_import(self.name)
+        try:
+            self.loader.exec_module(module)
+        finally:
+            self.report._exit_import(self.name)
+
+    def __getattr__(self, attr: str):
+        return getattr(self.loader, attr)
+
+
+class _ImportTimer(importlib.abc.MetaPathFinder):
+    """Avvolge nel loader temporizzato i moduli del backend"""
+
+    def __init__(self, report: "StartupReport"):
+        self.report = report
+
+    def find_spec(self, fullname, path, target=None):
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, "find_spec"):
+                continue
+            spec = finder.find_spec(fullname, path, target)
+            if spec is not None:
+                break
+        else:
+            return None
+
+        if spec.loader is None or not (spec.origin or "").startswith(PROJECT_DIR):
+            return spec
+        spec.loader = _TimedLoader(spec.loader, fullname, self.report)
+        return spec
+
+
+class StartupReport:
+    """Tempi di import dei moduli, fasi di startup e servizi"""
+
+    def __init__(self):
+        self.created = time.perf_counter()
+        self.ready_at: Optional[float] = None
+        self.imports: Dict[str, Dict[str, float]] = {}
+        self.phases: List[Dict] = []
+        self.stack: List[List] = []
+        self.finder: Optional[_ImportTimer] = None
+
+    def install_import_timer(self):
+        """Misura da qui in poi gli import dei moduli del backend"""
+        if self.finder is None:
+            self.finder = _ImportTimer(self)
+            sys.meta_path.insert(0, self.finder)
+
+    def uninstall_import_timer(self):
+        if self.finder is not None:
+            sys.meta_path.remove(self.finder)
+            self.finder = None
+
+    def _enter_import(self, name: str):
+        # [nome, inizio, tempo dei moduli figli]
+        self.stack.append([name, time.perf_counter(), 0.0])
+
+    def _exit_import(self, name: str):
+        _, started, children = self.stack.pop()
+        total = time.perf_counter() - started
+        if self.stack:
+            self.stack[-1][2] += total
+        self.imports[name] = {"total": total, "self": total - children}
+
+    @contextmanager
+    def phase(self, name: str):
+        """Misura un passo dello startup"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases.append({"name": name, "ms": round((time.perf_counter() - started) * 1000, 1)})
+
+    def mark_ready(self):
+        """App pronta a servire: smette di misurare gli import"""
+        self.ready_at = time.perf_counter()
+        self.uninstall_import_timer()
+
+    def report(self, registry: Optional[ServiceRegistry] = None) -> Dict:
+        imports = sorted(self.imports.items(), key=lambda item: item[1]["total"], reverse=True)
+        return {
+            "ready_ms": round((self.ready_at - self.created) * 1000, 1) if self.ready_at else None,
+            "imports": [
+                {"module": name, "total_ms": round(t["total"] * 1000, 1), "self_ms": round(t["self"] * 1000, 1)}
+                for name, t in imports
+            ],
+            "phases": self.phases,
+            "services": registry.stats() if registry else [],
+        }
+
+    def print_summary(self, top: int = 5):
+        print(f"✓ Avvio in {(self.ready_at - self.created) * 1000:.0f}ms (dettagli su /api/debug/startup)")
+        imports = sorted(self.imports.items(), key=lambda item: item[1]["self"], reverse=True)
+        for name, timing in imports[:top]:
+            print(f"  import {name:<20} {timing['self'] * 1000:>7.1f}ms")
+        for phase in sorted(self.phases, key=lambda p: p["ms"], reverse=True)[:top]:
+            print(f"  avvio  {phase['name']:<20} {phase['ms']:>7.1f}ms")
+
+
+services = ServiceRegistry()
+startup_report = StartupReport()
@@ -0,0 +1,418 @@
+"""
+Stato condiviso tra worker uvicorn (SHARED_STATE=true)
+Con `uvicorn main:app --workers N` ogni worker importa main.py: senza
+coordinamento ognuno avrebbe la sua simulazione e la sua connessione BLE.
+
+- Owner: il primo worker che ottiene il lock esclusivo su data/owner.lock.
+  È l'unico a fare I/O hardware (simulazione/sensori, batteria, log su disco,
+  parziali) e scrive lo stato in un segmento di memoria condivisa.
+- Follower: gli altri worker. Servono HTTP/WebSocket leggendo il segmento
+  (specchiandolo nel proprio CamperState) e inoltrano all'owner, via socket
+  Unix, i comandi che modificano lo stato o toccano l'hardware.
+  Se l'owner termina, il primo follower che ottiene il lock ne prende il
+  ruolo; gli altri si agganciano al segmento del nuovo owner.
+
+Segmento (seqlock, un solo scrittore):
+    [seq u64][lunghezza u32][pid owner u32][payload JSON ...]
+Lo scrittore porta seq a dispari, scrive il payload, lo riporta a pari.
+Il lettore copia il payload senza lock e lo accetta solo se seq era pari e
+non è cambiato durante la copia, altrimenti riprova. Il pid nell'intestazione
+evita che un follower si agganci al segmento di un avvio precedente.
+"""
+
+import asyncio
+import json
+import mmap
+import os
+import struct
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: niente flock, il multi-worker non è supportato
+    fcntl = None
+
+from fastapi import HTTPException
+
+from broadcast_hub import encode_json
+from task_supervisor import task_supervisor
+
+SHARED_STATE_ENABLED = os.getenv("SHARED_STATE", "false").lower() == "true"
+SHARED_STATE_NAME = os.getenv("SHARED_STATE_NAME", "camper-state")
+SHARED_STATE_DIR = Path(os.getenv("SHARED_STATE_DIR", str(Path(__file__).parent / "data")))
+
+# Su Linux /dev/shm è in RAM; altrimenti il file mappato sta nella cartella dati
+SHM_DIR = Path("/dev/shm")
+SEGMENT_PATH = (SHM_DIR if SHM_DIR.is_dir() else SHARED_STATE_DIR) / f"{SHARED_STATE_NAME}.state"
+SEGMENT_SIZE = 256 * 1024
+HEADER = struct.Struct("<QII")
+
+# Frequenza di pubblicazione (owner) e di lettura (follower)
+SYNC_INTERVAL = 1 / 30
+
+# Attesa massima del primo stato dell'owner all'avvio di un follower (secondi)
+ATTACH_TIMEOUT = float(os.getenv("SHARED_STATE_ATTACH_TIMEOUT", "30"))
+
+# Ogni quanto un follower controlla che l'owner sia ancora quello del segmento (secondi)
+OWNER_CHECK_INTERVAL = 1.0
+
+# Tentativi di lettura consistente prima di rinunciare al giro
+READ_RETRIES = 100
+
+# Timeout delle chiamate all'owner (la discovery BLE dura 10s)
+RPC_TIMEOUT = 15.0
+
+# Dimensione massima di un messaggio RPC (lo storico aggregato può superare i 64KB di default)
+RPC_LIMIT = 16 * 1024 * 1024
+
+
+class SeqlockSegment:
+    """Segmento di memoria condivisa (file mappato) a scrittore singolo con letture seqlock"""
+
+    def __init__(self, path: Path = SEGMENT_PATH, create: bool = False, size: int = SEGMENT_SIZE):
+        self.path = path
+        self.owner = create
+        if create:
+            # File nuovo sostituito in modo atomico: chi ha mappato quello vecchio
+            # (es. rimasto da un avvio terminato male) non lo vede troncare
+            tmp = path.with_suffix(".tmp")
+            with open(tmp, "wb") as f:
+                f.truncate(size)
+                f.write(HEADER.pack(0, 0, os.getpid()))
+            os.replace(tmp, path)
+        with open(path, "r+b" if create else "rb") as f:
+            access = mmap.ACCESS_WRITE if create else mmap.ACCESS_READ
+            self.buf = mmap.mmap(f.fileno(), 0, access=access)
+
+        self.capacity = len(self.buf) - HEADER.size
+        self.seq = 0
+        self.last_read = 0
+        self.retries = 0
+
+    @property
+    def owner_pid(self) -> int:
+        return HEADER.unpack_from(self.buf, 0)[2]
+
+    def write(self, payload: bytes):
+        """Pubblica un payload (solo owner)"""
+        if len(payload) > self.capacity:
+            raise ValueError(f"Stato condiviso troppo grande ({len(payload)} byte)")
+
+        buf = self.buf
+        self.seq += 1
+        struct.pack_into("<Q", buf, 0, self.seq)
+        buf[HEADER.size:HEADER.size + len(payload)] = payload
+        struct.pack_into("<I", buf, 8, len(payload))
+        self.seq += 1
+        struct.pack_into("<Q", buf, 0, self.seq)
+
+    def read(self) -> Optional[bytes]:
+        """
+        Ultimo payload consistente, None se invariato dall'ultima lettura
+
+        Returns:
+            bytes | None: Payload copiato
+        """
+        buf = self.buf
+        for _ in range(READ_RETRIES):
+            seq, length, _ = HEADER.unpack_from(buf, 0)
+            if seq == self.last_read:
+                return None
+            if seq & 1:
+                self.retries += 1
+                continue
+
+            payload = bytes(buf[HEADER.size:HEADER.size + length])
+            if struct.unpack_from("<Q", buf, 0)[0] == seq:
+                self.last_read = seq
+                return payload if length else None
+            self.retries += 1
+        return None
+
+    def close(self):
+        self.buf.close()
+        if self.owner:
+            self.path.unlink(missing_ok=True)
+
+
+class OwnerRPC:
+    """Chiamate dai follower all'owner su socket Unix (JSON una riga per messaggio)"""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.handlers: Dict[str, Callable[..., Awaitable[Any]]] = {}
+        self.server: Optional[asyncio.AbstractServer] = None
+        self.calls = 0
+
+    def register(self, name: str, handler: Callable[..., Awaitable[Any]]):
+        """Registra un'operazione eseguibile solo dall'owner"""
+        self.handlers[name] = handler
+
+    async def serve(self):
+        self.path.unlink(missing_ok=True)
+        self.server = await asyncio.start_unix_server(self._handle, path=str(self.path), limit=RPC_LIMIT)
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request = json.loads(await reader.readline())
+            handler = self.handlers.get(request.get("op"))
+            if handler is None:
+                response = {"error": f"Operazione sconosciuta: {request.get('op')}", "status": 404}
+            else:
+                self.calls += 1
+                try:
+                    response = {"result": await handler(**request.get("args", {}))}
+                except HTTPException as e:
+                    response = {"error": e.detail, "status": e.status_code}
+                except Exception as e:
+                    response = {"error": str(e), "status": 500}
+            writer.write(encode_json(response).encode() + b"\n")
+            await writer.drain()
+        finally:
+            writer.close()
+
+    async def call(self, op: str, **args) -> Any:
+        """
+        Esegue un'operazione sull'owner
+
+        Raises:
+            OwnerCallError: se l'owner risponde con un errore o non è raggiungibile
+        """
+        try:
+            reader, writer = await asyncio.wait_for(
+                asyncio.open_unix_connection(str(self.path), limit=RPC_LIMIT), timeout=RPC_TIMEOUT
+            )
+        except (OSError, asyncio.TimeoutError) as e:
+            raise OwnerCallError(503, f"Owner non raggiungibile: {e}")
+
+        try:
+            writer.write(encode_json({"op": op, "args": args}).encode() + b"\n")
+            await writer.drain()
+            response = json.loads(await asyncio.wait_for(reader.readline(), timeout=RPC_TIMEOUT))
+        except asyncio.TimeoutError:
+            raise OwnerCallError(504, f"Timeout chiamata owner: {op}")
+        finally:
+            writer.close()
+
+        if "error" in response:
+            raise OwnerCallError(response.get("status", 500), response["error"])
+        return response["result"]
+
+    async def close(self):
+        if self.server:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+            self.path.unlink(missing_ok=True)
+
+
+class OwnerCallError(HTTPException):
+    """Errore di una chiamata all'owner, restituito al client con lo stesso status"""
+
+
+class SharedState:
+    """
+    Ruolo del worker e sincronizzazione dello stato
+
+    role:
+        "single"   - processo unico (SHARED_STATE non attivo): nessun cambiamento
+        "owner"    - pubblica lo stato e serve le chiamate dei follower
+        "follower" - specchia lo stato e inoltra i comandi
+    """
+
+    def __init__(self, directory: Path = SHARED_STATE_DIR):
+        self.directory = directory
+        self.role = "single"
+        self.lock_file = None
+        self.segment: Optional[SeqlockSegment] = None
+        self.rpc = OwnerRPC(directory / "owner.sock")
+        self.published = 0
+        self.applied = 0
+        self.reattached = 0
+        self.promoted = False
+
+    @property
+    def is_follower(self) -> bool:
+        return self.role == "follower"
+
+    def elect(self) -> str:
+        """Decide il ruolo del worker (lock esclusivo non bloccante)"""
+        if not SHARED_STATE_ENABLED:
+            return self.role
+        if fcntl is None:
+            print("⚠️  SHARED_STATE richiede fcntl (Linux/macOS): uso processo singolo")
+            return self.role
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+        # "a+" e non "w": un follower non deve cancellare il pid scritto dall'owner
+        self.lock_file = open(self.directory / "owner.lock", "a+")
+        self.role = "owner" if self._take_lock() else "follower"
+        print(f"✓ Stato condiviso: worker {os.getpid()} è {self.role}")
+        return self.role
+
+    def _take_lock(self) -> bool:
+        """Prova a diventare owner (lock libero: nessun owner o owner terminato)"""
+        try:
+            fcntl.flock(self.lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            return False
+        self.lock_file.truncate(0)
+        self.lock_file.write(str(os.getpid()))
+        self.lock_file.flush()
+        return True
+
+    async def start_owner(self, snapshot: Callable[[], Dict], version: Callable[[], Any]):
+        """
+        Crea il segmento, avvia la pubblicazione e il server RPC
+
+        Args:
+            snapshot: Stato da pubblicare
+            version: Valore che cambia quando lo stato cambia
+        """
+        self.segment = SeqlockSegment(create=True)
+        self.segment.write(encode_json(snapshot()).encode())
+        await self.rpc.serve()
+        task_supervisor.spawn("shared_state_sync", lambda: self._publish_loop(snapshot, version))
+
+    async def _publish_loop(self, snapshot, version):
+        last = version()
+        while True:
+            await asyncio.sleep(SYNC_INTERVAL)
+            current = version()
+            if current != last:
+                last = current
+                self.segment.write(encode_json(snapshot()).encode())
+                self.published += 1
+
+    async def start_follower(self, apply: Callable[[Dict], Awaitable[None]],
+                             promote: Callable[[], Awaitable[None]]):
+        """
+        Si collega al segmento dell'owner e specchia lo stato
+        Se nel frattempo il lock si libera (owner terminato) il worker diventa
+        owner e ritorna subito: l'avvio prosegue come per l'owner.
+
+        Args:
+            apply: Applica uno snapshot allo stato locale
+            promote: Avvia i servizi dell'owner (promozione a runtime)
+
+        Raises:
+            RuntimeError: L'owner non pubblica lo stato entro ATTACH_TIMEOUT
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + ATTACH_TIMEOUT
+
+        while True:
+            self.segment = self._open_owner_segment()
+            if self.segment is not None:
+                break
+            if self._take_lock():
+                self.role = "owner"
+                self.promoted = True
+                print(f"✓ Stato condiviso: nessun owner attivo, worker {os.getpid()} diventa owner")
+                return
+            if loop.time() >= deadline:
+                raise RuntimeError(
+                    f"l'owner (pid {self._owner_pid()}) non ha pubblicato lo stato entro {ATTACH_TIMEOUT:g}s"
+                )
+            # L'owner sta ancora avviandosi (o il segmento è di un avvio precedente)
+            await asyncio.sleep(0.2)
+
+        task_supervisor.spawn("shared_state_sync", lambda: self._mirror_loop(apply, promote))
+
+    def _owner_pid(self) -> Optional[int]:
+        """Pid scritto dall'owner nel file di lock"""
+        self.lock_file.seek(0)
+        content = self.lock_file.read().strip()
+        return int(content) if content.isdigit() else None
+
+    def _open_owner_segment(self) -> Optional[SeqlockSegment]:
+        """Segmento dell'owner attuale, None se non l'ha ancora creato"""
+        try:
+            segment = SeqlockSegment()
+        except (FileNotFoundError, ValueError):
+            return None
+        if segment.owner_pid == self._owner_pid():
+            return segment
+        segment.close()
+        return None
+
+    async def _mirror_loop(self, apply, promote):
+        loop = asyncio.get_running_loop()
+        checked = loop.time()
+
+        while True:
+            payload = self.segment.read()
+            if payload is not None:
+                try:
+                    await apply(json.loads(payload))
+                    self.applied += 1
+                except Exception as e:
+                    print(f"❌ Errore stato condiviso: {e}")
+
+            if loop.time() - checked >= OWNER_CHECK_INTERVAL:
+                checked = loop.time()
+                if self._check_owner(promote):
+                    return
+            await asyncio.sleep(SYNC_INTERVAL)
+
+    def _check_owner(self, promote) -> bool:
+        """
+        Owner terminato: prende il lock e si promuove. Owner cambiato: si aggancia
+        al suo segmento (appena creato).
+
+        Returns:
+            bool: True se questo worker è diventato owner (il mirror si ferma)
+        """
+        if self._take_lock():
+            print(f"⚠️  Owner {self.segment.owner_pid} terminato: worker {os.getpid()} diventa owner")
+            self.segment.close()
+            self.segment = None
+            self.role = "owner"
+            self.promoted = True
+            # Task separato: la promozione riavvia "shared_state_sync" come pubblicazione
+            task_supervisor.spawn("shared_state_promote", promote, restart=False)
+            return True
+
+        if self.segment.owner_pid != self._owner_pid():
+            segment = self._open_owner_segment()
+            if segment is not None:
+                self.segment.close()
+                self.segment = segment
+                self.reattached += 1
+                print(f"✓ Stato condiviso: agganciato al nuovo owner {segment.owner_pid}")
+        return False
+
+    def register(self, op: str, handler: Callable[..., Awaitable[Any]]):
+        """Operazione che i follower possono inoltrare all'owner"""
+        self.rpc.register(op, handler)
+
+    async def call(self, op: str, **args) -> Any:
+        """Inoltra un'operazione all'owner (solo follower)"""
+        return await self.rpc.call(op, **args)
+
+    async def stop(self):
+        await task_supervisor.cancel("shared_state_sync")
+        await self.rpc.close()
+        if self.segment:
+            self.segment.close()
+            self.segment = None
+        if self.lock_file:
+            self.lock_file.close()
+            self.lock_file = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "role": self.role,
+            "pid": os.getpid(),
+            "published": self.published,
+            "applied": self.applied,
+            "reattached": self.reattached,
+            "promoted": self.promoted,
+            "rpc_calls": self.rpc.calls,
+            "read_retries": self.segment.retries if self.segment else 0,
+        }
+
+
+shared_state = SharedState()
@@ -0,0 +1,284 @@
+"""
+Stima dello stato di carica (SoC) della batteria servizi
+Lo SoC riportato dal BMS è a passi dell'1% e deriva nel tempo. Qui lo SoC è
+stimato dal backend con un filtro di Kalman a due stati:
+
+    x = [soc, g]        soc: frazione 0..1,  g = 1 / capacità (1/Ah)
+
+- predizione (coulomb counting): soc += corrente * dt * g
+  (corrente positiva = carica, integrata con la regola dei trapezi)
+- misura: SoC ricavato dalla tensione a vuoto (curva OCV, tensione
+  corretta per la caduta sulla resistenza interna), con varianza che cresce
+  dove la curva è piatta e con correnti alte
+- la capacità è osservabile dal confronto fra Ah contati e variazione di SoC
+  vista dalla tensione: salute = capacità stimata / nominale
+
+Ogni campione costa O(1). estimate_batch() rifà la stima su uno storico
+intero con NumPy (minimi quadrati pesati: soc_ocv ≈ soc0 + g * Ah contati)
+e può reinizializzare il filtro, ad esempio alla connessione della batteria.
+"""
+
+import math
+import os
+import time
+from typing import Dict, Optional
+
+import numpy as np
+
+from forecaster import BATTERY_CAPACITY_AH
+
+# Resistenza interna del pacco (ohm): V morsetti = OCV + I * R
+BATTERY_INTERNAL_RESISTANCE = float(os.getenv("BATTERY_INTERNAL_RESISTANCE", "0.01"))
+
+# Curva OCV di un pacco LiFePO4 12.8V a riposo (SoC frazione -> V)
+# ADATTA alla chimica della tua batteria
+OCV_SOC = np.array([0.0, 0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1.0])
+OCV_VOLTS = np.array([12.00, 12.80, 13.00, 13.05, 13.10, 13.15, 13.20, 13.25, 13.30, 13.35, 13.60])
+
+# Rumore: tensione (V), errore IR per ampere (V/A), corrente (A)
+VOLTAGE_SIGMA = 0.02
+IR_SIGMA_PER_AMP = 0.003
+CURRENT_SIGMA = 0.2
+
+# Deriva ammessa della capacità (frazione della nominale per radice di ora)
+CAPACITY_DRIFT = 0.002
+
+# Pendenza minima della curva usata per la varianza (V per unità di SoC)
+MIN_OCV_SLOPE = 0.05
+
+# Buchi più lunghi non vengono integrati (batteria non letta)
+MAX_GAP = 600.0
+
+# Capacità ammessa rispetto alla nominale
+CAPACITY_MIN, CAPACITY_MAX = 0.5, 1.2
+
+# Incertezze minime dopo una stima batch (il filtro deve poter correggere)
+MIN_SOC_SIGMA = 0.005
+MIN_CAPACITY_SIGMA = 0.01
+
+# Sotto questa escursione di Ah (frazione della nominale) la capacità
+# non è osservabile nella stima batch
+MIN_BATCH_AH = 0.05
+
+
+def soc_from_voltage(voltage, current=0.0):
+    """SoC (frazione) dalla tensione, corretta per la caduta IR (scalari o array)"""
+    ocv = np.asarray(voltage) - np.asarray(current) * BATTERY_INTERNAL_RESISTANCE
+    return np.interp(ocv, OCV_VOLTS, OCV_SOC)
+
+
+def voltage_soc_sigma(voltage, current=0.0):
+    """Deviazione standard dello SoC da tensione: alta dove la curva OCV è piatta"""
+    ocv = np.asarray(voltage) - np.asarray(current) * BATTERY_INTERNAL_RESISTANCE
+    index = np.clip(np.searchsorted(OCV_VOLTS, ocv) - 1, 0, len(OCV_VOLTS) - 2)
+    slope = (OCV_VOLTS[index + 1] - OCV_VOLTS[index]) / (OCV_SOC[index + 1] - OCV_SOC[index])
+    sigma_v = VOLTAGE_SIGMA + IR_SIGMA_PER_AMP * np.abs(current)
+    return sigma_v / np.maximum(slope, MIN_OCV_SLOPE)
+
+
+class SocEstimator:
+    """Filtro di Kalman SoC/capacità aggiornato ad ogni lettura batteria"""
+
+    def __init__(self, capacity_ah: float = BATTERY_CAPACITY_AH):
+        self.nominal_ah = capacity_ah
+        self.reset()
+
+    def reset(self):
+        self.x: Optional[np.ndarray] = None
+        self.P = np.zeros((2, 2))
+        self.last_time: Optional[float] = None
+        self.last_current: Optional[float] = None
+        self.coulomb_ah = 0.0
+        self.samples = 0
+        self.batch: Optional[Dict] = None
+
+    # ==================== FILTRO ====================
+
+    def initialize(self, soc: float, sigma: float, capacity_ah: Optional[float] = None,
+                   capacity_sigma: Optional[float] = None):
+        """Stato iniziale (SoC frazione e capacità con le loro incertezze)"""
+        capacity_ah = capacity_ah or self.nominal_ah
+        capacity_sigma = capacity_sigma or 0.2 * capacity_ah
+        g = 1 / capacity_ah
+        self.x = np.array([min(1.0, max(0.0, soc)), g])
+        self.P = np.diag([sigma ** 2, (capacity_sigma * g * g) ** 2])
+
+    def update(self, data: Dict, timestamp: Optional[float] = None):
+        """
+        Aggiunge una lettura batteria
+
+        Args:
+            data: Dati del monitor (voltage V, current A: negativa = scarica, soc % del BMS)
+            timestamp: Epoch della lettura (default: adesso)
+        """
+        voltage, current = data.get("voltage"), data.get("current")
+        if not isinstance(voltage, (int, float)) or not isinstance(current, (int, float)):
+            return
+        timestamp = time.time() if timestamp is None else timestamp
+
+        if self.x is None:
+            # Primo campione: SoC del BMS se c'è (migliore dell'OCV sotto carico)
+            bms_soc = data.get("soc")
+            if isinstance(bms_soc, (int, float)):
+                self.initialize(bms_soc / 100, 0.05)
+            else:
+                self.initialize(float(soc_from_voltage(voltage, current)), float(voltage_soc_sigma(voltage, current)))
+        else:
+            dt = timestamp - self.last_time
+            if 0 < dt <= MAX_GAP:
+                last_current = current if self.last_current is None else self.last_current
+                self._predict((current + last_current) / 2, dt)
+            elif dt > MAX_GAP:
+                # Periodo non osservato: solo la tensione può dire dove siamo
+                self.P[0, 0] += 0.1 ** 2
+            self._correct(voltage, current)
+
+        self.last_time = timestamp
+        self.last_current = current
+        self.samples += 1
+
+    def _predict(self, current: float, dt: float):
+        hours = dt / 3600
+        amp_hours = current * hours
+        self.coulomb_ah += amp_hours
+
+        F = np.array([[1.0, amp_hours], [0.0, 1.0]])
+        g = self.x[1]
+        Q = np.diag([
+            (CURRENT_SIGMA * hours * g) ** 2,
+            (CAPACITY_DRIFT * math.sqrt(hours) * g) ** 2,
+        ])
+        self.x = F @ self.x
+        self.P = F @ self.P @ F.T + Q
+
+    def _correct(self, voltage: float, current: float):
+        z = float(soc_from_voltage(voltage, current))
+        R = float(voltage_soc_sigma(voltage, current)) ** 2
+
+        # H = [1, 0]
+        S = self.P[0, 0] + R
+        K = self.P[:, 0] / S
+        self.x = self.x + K * (z - self.x[0])
+        self.P = self.P - np.outer(K, self.P[0, :])
+        self._clamp()
+
+    def _clamp(self):
+        self.x[0] = min(1.0, max(0.0, self.x[0]))
+        g_min = 1 / (CAPACITY_MAX * self.nominal_ah)
+        g_max = 1 / (CAPACITY_MIN * self.nominal_ah)
+        self.x[1] = min(g_max, max(g_min, self.x[1]))
+
+    # ==================== BATCH ====================
+
+    def estimate_batch(self, times: np.ndarray, voltage: np.ndarray, current: np.ndarray,
+                       apply: bool = True) -> Optional[Dict]:
+        """
+        Stima SoC e capacità su uno storico completo (vettoriale)
+
+        Args:
+            times, voltage, current: Campioni allineati in ordine cronologico
+            apply: Reinizializza il filtro con il risultato
+
+        Returns:
+            dict: soc finale (%), capacità (Ah) con incertezze e numero di campioni,
+                  None se i campioni sono troppo pochi
+        """
+        times, voltage, current = (np.asarray(a, dtype=float) for a in (times, voltage, current))
+        if len(times) < 10:
+            return None
+
+        # Coulomb counting vettoriale (trapezi, buchi lunghi esclusi)
+        dt = np.diff(times)
+        step_ah = (current[1:] + current[:-1]) / 2 * dt / 3600
+        step_ah[(dt <= 0) | (dt > MAX_GAP)] = 0.0
+        counted_ah = np.concatenate(([0.0], np.cumsum(step_ah)))
+
+        z = soc_from_voltage(voltage, current)
+        weights = 1 / voltage_soc_sigma(voltage, current)
+
+        # Minimi quadrati pesati: z ≈ soc0 + g * Ah contati
+        if np.ptp(counted_ah) >= MIN_BATCH_AH * self.nominal_ah:
+            A = np.column_stack((np.ones_like(counted_ah), counted_ah)) * weights[:, None]
+            solution, _, _, _ = np.linalg.lstsq(A, z * weights, rcond=None)
+            soc0, g = solution
+            residual = z - (soc0 + g * counted_ah)
+            scale = max(1.0, float(np.sum((residual * weights) ** 2)) / max(1, len(z) - 2))
+            covariance = np.linalg.inv(A.T @ A) * scale
+            g_min = 1 / (CAPACITY_MAX * self.nominal_ah)
+            g_max = 1 / (CAPACITY_MIN * self.nominal_ah)
+            if not g_min <= g <= g_max:
+                g = min(g_max, max(g_min, g))
+                covariance[1, 1] = max(covariance[1, 1], (0.2 * g) ** 2)
+        else:
+            # Escursione troppo piccola: capacità attuale, solo SoC iniziale
+            g = self.x[1] if self.x is not None else 1 / self.nominal_ah
+            w2 = weights ** 2
+            soc0 = float(np.sum((z - g * counted_ah) * w2) / np.sum(w2))
+            covariance = np.diag([1 / float(np.sum(w2)), (0.2 * g) ** 2])
+
+        # SoC finale e sua varianza (soc0 + g * Ah finali)
+        jacobian = np.array([1.0, counted_ah[-1]])
+        soc_end = float(min(1.0, max(0.0, soc0 + g * counted_ah[-1])))
+        soc_var = float(jacobian @ covariance @ jacobian)
+        capacity = float(1 / g)
+        capacity_sigma = math.sqrt(max(0.0, covariance[1, 1])) * capacity * capacity
+
+        result = {
+            "soc": round(soc_end * 100, 1),
+            "soc_sigma": round(math.sqrt(soc_var) * 100, 1),
+            "capacity_ah": round(capacity, 1),
+            "capacity_sigma_ah": round(capacity_sigma, 1),
+            "health": round(capacity / self.nominal_ah * 100, 1),
+            "samples": len(times),
+            "hours": round(float(times[-1] - times[0]) / 3600, 2),
+            "counted_ah": round(float(counted_ah[-1]), 2),
+            "until": float(times[-1]),
+        }
+        if apply:
+            self.apply_batch(result)
+        return result
+
+    def apply_batch(self, result: Dict):
+        """Reinizializza il filtro con una stima batch (dal thread dell'event loop)"""
+        self.initialize(
+            result["soc"] / 100,
+            max(result["soc_sigma"] / 100, MIN_SOC_SIGMA),
+            result["capacity_ah"],
+            max(result["capacity_sigma_ah"], MIN_CAPACITY_SIGMA * result["capacity_ah"])
+        )
+        self.last_time = result["until"]
+        self.last_current = None
+        self.batch = result
+
+    def estimate_from_history(self, history, window: float = 24 * 3600, apply: bool = True) -> Optional[Dict]:
+        """Stima batch sulle ultime `window` ore di battery_voltage/battery_current"""
+        if "battery_voltage" not in history.buffers:
+            return None
+        end = time.time()
+        v_times, voltage = history.buffers["battery_voltage"].window(end - window, end + 1)
+        c_times, current = history.buffers["battery_current"].window(end - window, end + 1)
+        # Stesso campione = stesso timestamp
+        times, v_index, c_index = np.intersect1d(v_times, c_times, return_indices=True)
+        return self.estimate_batch(times, voltage[v_index], current[c_index], apply=apply)
+
+    # ==================== REPORT ====================
+
+    def summary(self) -> Optional[Dict]:
+        if self.x is None:
+            return None
+        soc, g = (float(value) for value in self.x)
+        capacity = 1 / g
+        return {
+            "soc": round(soc * 100, 1),
+            "soc_sigma": round(math.sqrt(max(0.0, self.P[0, 0])) * 100, 1),
+            "capacity_ah": round(capacity, 1),
+            "capacity_sigma_ah": round(math.sqrt(max(0.0, self.P[1, 1])) * capacity * capacity, 1),
+            "health": round(capacity / self.nominal_ah * 100, 1),
+            "coulomb_ah": round(self.coulomb_ah, 2),
+            "samples": self.samples,
+            "last_batch": self.batch,
+        }
+
+
+# Stimatore condiviso dal servizio batteria
+soc_estimator = SocEstimator()
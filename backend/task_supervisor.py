@@ -0,0 +1,214 @@
+"""
+Supervisore dei loop in background
+Ogni loop di lunga durata (simulazione, batteria, gauge, scheduler...) è
+avviato con un nome e resta di proprietà del supervisore:
+
+    task_supervisor.spawn("simulation", simulate_driving)
+
+- se il loop solleva un'eccezione viene riavviato dopo un backoff
+  esponenziale (1s, 2s, 4s... fino a 60s; si azzera dopo 60s senza errori)
+- se termina normalmente resta "finished" (nessun riavvio)
+- allo spegnimento tutti i task vengono cancellati e attesi con un timeout
+
+Contabilità per task (GET /api/debug/tasks e /metrics):
+- wall: tempo di vita; busy: tempo passato dentro il task
+- cpu: tempo CPU del thread dell'event loop speso dentro il task (il lavoro
+  spostato su altri thread con asyncio.to_thread non è incluso)
+- steps: risvegli del task; iterations: giri del loop, se il loop chiama
+  task_supervisor.iteration()
+"""
+
+import asyncio
+import collections.abc
+import time
+from contextvars import ContextVar
+from typing import Awaitable, Callable, Dict, List, Optional
+
+# Backoff dei riavvii (secondi)
+BACKOFF_INITIAL = 1.0
+BACKOFF_MAX = 60.0
+
+# Un task che gira da almeno questo tempo riparte dal backoff iniziale
+BACKOFF_RESET = 60.0
+
+# Attesa massima della cancellazione allo spegnimento
+SHUTDOWN_TIMEOUT = 5.0
+
+
+class TaskStats:
+    """Stato e contatori di un task supervisionato"""
+
+    def __init__(self, name: str, factory: Callable[[], Awaitable], restart: bool):
+        self.name = name
+        self.factory = factory
+        self.restart = restart
+        self.task: Optional[asyncio.Task] = None
+        self.state = "starting"
+        self.created = time.perf_counter()
+        self.ended: Optional[float] = None
+        self.restarts = 0
+        self.backoff = 0.0
+        self.last_error: Optional[str] = None
+        self.busy_seconds = 0.0
+        self.cpu_seconds = 0.0
+        self.steps = 0
+        self.iterations = 0
+
+    def to_dict(self) -> Dict:
+        wall = (self.ended or time.perf_counter()) - self.created
+        return {
+            "name": self.name,
+            "state": self.state,
+            "restarts": self.restarts,
+            "backoff_s": self.backoff,
+            "last_error": self.last_error,
+            "wall_s": round(wall, 3),
+            "busy_s": round(self.busy_seconds, 4),
+            "cpu_s": round(self.cpu_seconds, 4),
+            "cpu_percent": round(self.cpu_seconds / wall * 100, 2) if wall > 0 else 0.0,
+            "steps": self.steps,
+            "iterations": self.iterations,
+        }
+
+
+class _MeteredCoroutine(collections.abc.Coroutine):
+    """Coroutine che misura tempo e CPU di ogni passo eseguito dall'event loop"""
+
+    def __init__(self, coro, stats: TaskStats):
+        self.coro = coro
+        self.stats = stats
+
+    def send(self, value):
+        return self._step(self.coro.send, value)
+
+    def throw(self, *args):
+        return self._step(self.coro.throw, *args)
+
+    def close(self):
+        self.coro.close()
+
+    def __await__(self):
+        return self
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return self.send(None)
+
+    def _step(self, method, *args):
+        stats = self.stats
+        started, started_cpu = time.perf_counter(), time.thread_time()
+        try:
+            return method(*args)
+        finally:
+            stats.busy_seconds += time.perf_counter() - started
+            stats.cpu_seconds += time.thread_time() - started_cpu
+            stats.steps += 1
+
+
+# Task supervisionato corrente (per iteration())
+_current: ContextVar[Optional[TaskStats]] = ContextVar("supervised_task", default=None)
+
+
+class TaskSupervisor:
+    """Proprietario dei loop in background: riavvio, arresto e contabilità"""
+
+    def __init__(self):
+        self.tasks: Dict[str, TaskStats] = {}
+
+    def spawn(self, name: str, factory: Callable[[], Awaitable], restart: bool = True) -> TaskStats:
+        """
+        Avvia un loop supervisionato (ignorato se uno con lo stesso nome è attivo)
+
+        Args:
+            name: Nome del task (chiave in /api/debug/tasks)
+            factory: Funzione che crea la coroutine (richiamata ad ogni riavvio)
+            restart: Riavvia dopo un'eccezione (False = task da eseguire una volta)
+        """
+        current = self.tasks.get(name)
+        if current is not None and current.task is not None and not current.task.done():
+            return current
+
+        stats = TaskStats(name, factory, restart)
+        self.tasks[name] = stats
+        stats.task = asyncio.create_task(_MeteredCoroutine(self._supervise(stats), stats), name=name)
+        return stats
+
+    def is_running(self, name: str) -> bool:
+        stats = self.tasks.get(name)
+        return stats is not None and stats.task is not None and not stats.task.done()
+
+    def iteration(self):
+        """Conta un giro del loop supervisionato che la chiama"""
+        stats = _current.get()
+        if stats is not None:
+            stats.iterations += 1
+
+    async def _supervise(self, stats: TaskStats):
+        _current.set(stats)
+        backoff = BACKOFF_INITIAL
+
+        try:
+            while True:
+                stats.state = "running"
+                stats.backoff = 0.0
+                run_started = time.perf_counter()
+                try:
+                    await stats.factory()
+                except Exception as e:
+                    stats.last_error = f"{type(e).__name__}: {e}"
+                    if not stats.restart:
+                        stats.state = "failed"
+                        print(f"❌ Task {stats.name} terminato: {stats.last_error}")
+                        return
+
+                    if time.perf_counter() - run_started >= BACKOFF_RESET:
+                        backoff = BACKOFF_INITIAL
+                    stats.state = "backoff"
+                    stats.backoff = backoff
+                    stats.restarts += 1
+                    print(f"❌ Task {stats.name} fallito ({stats.last_error}), riavvio tra {backoff:g}s")
+                    await asyncio.sleep(backoff)
+                    backoff = min(backoff * 2, BACKOFF_MAX)
+                else:
+                    stats.state = "finished"
+                    return
+        except asyncio.CancelledError:
+            stats.state = "cancelled"
+            raise
+        finally:
+            stats.ended = time.perf_counter()
+
+    # ==================== ARRESTO ====================
+
+    async def cancel(self, name: str, timeout: float = SHUTDOWN_TIMEOUT):
+        """Cancella un task e ne attende la fine"""
+        stats = self.tasks.get(name)
+        if stats is None or stats.task is None or stats.task.done():
+            return
+        stats.task.cancel()
+        await asyncio.wait([stats.task], timeout=timeout)
+
+    async def shutdown(self, timeout: float = SHUTDOWN_TIMEOUT):
+        """Cancella tutti i task e li attende (al massimo `timeout` secondi)"""
+        running = [stats.task for stats in self.tasks.values() if stats.task is not None and not stats.task.done()]
+        for task in running:
+            task.cancel()
+        if not running:
+            return
+
+        _, pending = await asyncio.wait(running, timeout=timeout)
+        for task in pending:
+            print(f"⚠️  Task {task.get_name()} non terminato entro {timeout:.0f}s")
+        print(f"✓ Task in background arrestati ({len(running) - len(pending)}/{len(running)})")
+
+    # ==================== REPORT ====================
+
+    def stats(self) -> List[Dict]:
+        """Task ordinati per CPU consumata"""
+        tasks = sorted(self.tasks.values(), key=lambda stats: stats.cpu_seconds, reverse=True)
+        return [stats.to_dict() for stats in tasks]
+
+
+task_supervisor = TaskSupervisor()
@@ -0,0 +1,182 @@
+"""
+Storico telemetria in memoria
+Un ring buffer NumPy a dimensione fissa per ogni metrica (24 ore alla
+frequenza di campionamento) e aggregazione vettoriale in bucket
+min/max/media per i grafici dell'infotainment.
+"""
+
+import time
+from typing import Dict, Iterable, Optional, Tuple
+
+import numpy as np
+
+# Ore di storico mantenute in memoria
+HISTORY_HOURS = 24
+
+# Numero massimo di bucket per richiesta
+MAX_BUCKETS = 2000
+
+
+class MetricRingBuffer:
+    """Ring buffer di campioni (timestamp, valore) per una metrica"""
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.times = np.zeros(capacity, dtype=np.float64)
+        self.values = np.zeros(capacity, dtype=np.float32)
+        self.head = 0
+        self.count = 0
+
+    def __len__(self) -> int:
+        return self.count
+
+    def append(self, timestamp: float, value: float):
+        """Aggiunge un campione sovrascrivendo il più vecchio a buffer pieno"""
+        self.times[self.head] = timestamp
+        self.values[self.head] = value
+        self.head = (self.head + 1) % self.capacity
+        if self.count < self.capacity:
+            self.count += 1
+
+    def extend(self, times: np.ndarray, values: np.ndarray):
+        """Aggiunge un blocco di campioni ordinati (ripristino da disco)"""
+        if len(times) > self.capacity:
+            times = times[-self.capacity:]
+            values = values[-self.capacity:]
+
+        for chunk_times, chunk_values in self._split(times, values):
+            n = len(chunk_times)
+            self.times[self.head:self.head + n] = chunk_times
+            self.values[self.head:self.head + n] = chunk_values
+            self.head = (self.head + n) % self.capacity
+            self.count = min(self.capacity, self.count + n)
+
+    def _split(self, times: np.ndarray, values: np.ndarray):
+        room = self.capacity - self.head
+        yield times[:room], values[:room]
+        if len(times) > room:
+            yield times[room:], values[room:]
+
+    def ordered(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Campioni in ordine cronologico (viste, copia solo se il buffer ha fatto il giro)"""
+        if self.count < self.capacity:
+            return self.times[:self.count], self.values[:self.count]
+        return (
+            np.concatenate((self.times[self.head:], self.times[:self.head])),
+            np.concatenate((self.values[self.head:], self.values[:self.head]))
+        )
+
+    def window(self, start: float, end: float) -> Tuple[np.ndarray, np.ndarray]:
+        """Campioni con start <= t < end"""
+        times, values = self.ordered()
+        lo = np.searchsorted(times, start, side="left")
+        hi = np.searchsorted(times, end, side="left")
+        return times[lo:hi], values[lo:hi]
+
+
+class TelemetryHistory:
+    """Insieme dei ring buffer per metrica"""
+
+    def __init__(self):
+        self.buffers: Dict[str, MetricRingBuffer] = {}
+        self.rates: Dict[str, float] = {}
+
+    def register(self, metrics: Iterable[str], rate_hz: float):
+        """
+        Crea i buffer per un gruppo di metriche campionate alla stessa frequenza
+
+        Args:
+            metrics: Nomi delle metriche
+            rate_hz: Frequenza di campionamento
+        """
+        capacity = int(HISTORY_HOURS * 3600 * rate_hz)
+        for metric in metrics:
+            self.buffers[metric] = MetricRingBuffer(capacity)
+            self.rates[metric] = rate_hz
+
+    def record(self, values: Dict[str, float], timestamp: Optional[float] = None):
+        """Registra un campione per ogni metrica nota presente in `values`"""
+        timestamp = time.time() if timestamp is None else timestamp
+        for metric, value in values.items():
+            buffer = self.buffers.get(metric)
+            if buffer is not None:
+                buffer.append(timestamp, value)
+
+    def clear(self):
+        """Svuota i buffer (es. il replay ricomincia da un tempo precedente)"""
+        for buffer in self.buffers.values():
+            buffer.head = 0
+            buffer.count = 0
+
+    def metrics(self) -> Dict[str, Dict[str, float]]:
+        """Metriche disponibili con frequenza e numero di campioni"""
+        return {
+            metric: {"rate_hz": self.rates[metric], "samples": len(buffer)}
+            for metric, buffer in self.buffers.items()
+        }
+
+    def buckets(self, metric: str, window: float, resolution: float, end: Optional[float] = None) -> Dict:
+        """
+        Aggrega una finestra di storico in bucket min/max/media
+
+        Args:
+            metric: Nome metrica
+            window: Ampiezza finestra in secondi (fino a `end`)
+            resolution: Ampiezza di un bucket in secondi
+            end: Fine finestra (default: adesso)
+
+        Returns:
+            dict: Colonne t/min/max/mean/count, solo bucket con campioni
+        """
+        end = time.time() if end is None else end
+        start = end - window
+        times, values = self.buffers[metric].window(start, end)
+        return aggregate_buckets(metric, times, values, start, end, resolution)
+
+    def covers(self, metric: str, start: float) -> bool:
+        """True se il buffer in memoria contiene campioni fin da `start`"""
+        buffer = self.buffers[metric]
+        if not len(buffer):
+            return False
+        oldest = buffer.times[buffer.head if buffer.count == buffer.capacity else 0]
+        return oldest <= start + 1 / self.rates[metric]
+
+
+def aggregate_buckets(metric: str, times: np.ndarray, values: np.ndarray,
+                      start: float, end: float, resolution: float) -> Dict:
+    """
+    Aggrega campioni ordinati nel tempo in bucket min/max/media
+
+    Returns:
+        dict: Colonne t/min/max/mean/count, solo bucket con campioni
+    """
+    result = {
+        "metric": metric,
+        "start": start,
+        "end": end,
+        "resolution": resolution,
+        "t": [],
+        "min": [],
+        "max": [],
+        "mean": [],
+        "count": []
+    }
+    if len(times) == 0:
+        return result
+
+    # I tempi sono ordinati: ogni bucket è un intervallo contiguo
+    index = ((times - start) // resolution).astype(np.int64)
+    starts = np.flatnonzero(np.r_[True, index[1:] != index[:-1]])
+    counts = np.diff(np.r_[starts, len(values)])
+    values64 = values.astype(np.float64)
+
+    result["t"] = (start + index[starts] * resolution).tolist()
+    result["min"] = np.minimum.reduceat(values64, starts).tolist()
+    result["max"] = np.maximum.reduceat(values64, starts).tolist()
+    result["mean"] = (np.add.reduceat(values64, starts) / counts).tolist()
+    result["count"] = counts.tolist()
+    return result
+
+
+# Storico condiviso da simulazione/sensori e servizio batteria
+history = TelemetryHistory()
@@ -0,0 +1,311 @@
+"""
+Log telemetria su disco, append-only a segmenti orari
+Sopravvive al riavvio del Pi: all'avvio lo storico in memoria viene
+ricostruito dalle ultime 24 ore di log.
+
+Formato:
+- un file per ora (UTC): telemetry-YYYYMMDD-HH.seg
+- intestazione di 16 byte (magic + versione), poi record a larghezza fissa
+  di 16 byte: timestamp float64, id metrica uint16, padding, valore float32
+- metrics.json mappa i nomi metrica sugli id (stabili tra i riavvii)
+
+Le scritture sono accumulate in memoria e scaricate a blocchi da un thread
+(scrittura + fsync), quindi né l'usura della SD né la latenza di fsync
+bloccano l'event loop. Le letture mappano in memoria i segmenti (mmap).
+"""
+
+import asyncio
+import json
+import mmap
+import os
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from task_supervisor import task_supervisor
+
+RECORD_DTYPE = np.dtype([
+    ("t", "<f8"),
+    ("metric", "<u2"),
+    ("pad", "<u2"),
+    ("value", "<f4"),
+])
+HEADER = b"CAMPLOG\x00" + (1).to_bytes(2, "little") + b"\x00" * 6
+HEADER_SIZE = RECORD_DTYPE.itemsize
+
+SEGMENT_PREFIX = "telemetry-"
+SEGMENT_SUFFIX = ".seg"
+
+# Configurazione (sovrascrivibile da ambiente)
+LOG_DIR = os.getenv("TELEMETRY_LOG_DIR", str(Path(__file__).parent / "data" / "telemetry"))
+FLUSH_INTERVAL = float(os.getenv("TELEMETRY_FLUSH_INTERVAL", "10"))
+FLUSH_MAX_RECORDS = 4096
+# Record tenuti in memoria se il disco non accetta scritture (oltre: si perdono i più vecchi)
+PENDING_MAX_RECORDS = FLUSH_MAX_RECORDS * 16
+RETENTION_DAYS = float(os.getenv("TELEMETRY_RETENTION_DAYS", "30"))
+RETENTION_MAX_BYTES = int(float(os.getenv("TELEMETRY_RETENTION_MB", "256")) * 1024 * 1024)
+
+
+def segment_name(timestamp: float) -> str:
+    """Nome del segmento orario che contiene il timestamp"""
+    hour = datetime.fromtimestamp(timestamp, tz=timezone.utc)
+    return f"{SEGMENT_PREFIX}{hour:%Y%m%d-%H}{SEGMENT_SUFFIX}"
+
+
+def segment_start(name: str) -> float:
+    """Inizio (epoch) dell'ora coperta da un segmento"""
+    stamp = name[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)]
+    return datetime.strptime(stamp, "%Y%m%d-%H").replace(tzinfo=timezone.utc).timestamp()
+
+
+class TelemetryLog:
+    """Writer a blocchi e reader mmap del log segmentato"""
+
+    def __init__(self, directory: str = LOG_DIR):
+        self.directory = Path(directory)
+        self.metric_ids: Dict[str, int] = {}
+        self.pending: List[Tuple[float, int, int, float]] = []
+        self.catalog_dirty = False
+        self.flush_lock = asyncio.Lock()
+
+        self.records_written = 0
+        self.flushes = 0
+        self.last_flush_seconds = 0.0
+
+    # ==================== SCRITTURA ====================
+
+    def record(self, values: Dict[str, float], timestamp: Optional[float] = None):
+        """
+        Accoda un campione per metrica (nessun I/O sul loop)
+
+        Args:
+            values: {metrica: valore}
+            timestamp: Epoch del campione (default: adesso)
+        """
+        timestamp = time.time() if timestamp is None else timestamp
+        for metric, value in values.items():
+            self.pending.append((timestamp, self._metric_id(metric), 0, value))
+
+        if len(self.pending) >= FLUSH_MAX_RECORDS and task_supervisor.is_running("telemetry_flush"):
+            task_supervisor.spawn("telemetry_flush_now", self.flush, restart=False)
+
+    def _metric_id(self, metric: str) -> int:
+        metric_id = self.metric_ids.get(metric)
+        if metric_id is None:
+            metric_id = max(self.metric_ids.values(), default=0) + 1
+            self.metric_ids[metric] = metric_id
+            self.catalog_dirty = True
+        return metric_id
+
+    async def flush(self):
+        """Scarica i record accodati su disco in un thread"""
+        async with self.flush_lock:
+            if not self.pending and not self.catalog_dirty:
+                return
+
+            batch, self.pending = self.pending, []
+            catalog = dict(self.metric_ids) if self.catalog_dirty else None
+
+            start = time.perf_counter()
+            try:
+                await asyncio.to_thread(self._write_batch, batch, catalog)
+            except BaseException:
+                # Scrittura fallita (o annullata): il blocco torna in testa e il catalogo
+                # resta da salvare, così il prossimo flush riprova senza perdere nulla
+                self.pending = batch + self.pending
+                overflow = len(self.pending) - PENDING_MAX_RECORDS
+                if overflow > 0:
+                    del self.pending[:overflow]
+                    print(f"⚠️  Log telemetria: {overflow} record scartati (disco non scrivibile)")
+                raise
+
+            if catalog is not None and catalog == self.metric_ids:
+                self.catalog_dirty = False
+            self.last_flush_seconds = time.perf_counter() - start
+            self.records_written += len(batch)
+            self.flushes += 1
+
+    def _write_batch(self, batch: List[Tuple[float, int, int, float]], catalog: Optional[Dict[str, int]]):
+        """Scrittura bloccante (eseguita fuori dall'event loop)"""
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+        if catalog is not None:
+            tmp = self.directory / "metrics.json.tmp"
+            tmp.write_text(json.dumps(catalog))
+            os.replace(tmp, self.directory / "metrics.json")
+
+        if not batch:
+            return
+
+        records = np.array(batch, dtype=RECORD_DTYPE)
+        first, last = segment_name(records["t"].min()), segment_name(records["t"].max())
+
+        if first == last:
+            groups = {first: records}
+        else:
+            # Il blocco attraversa il cambio d'ora: divide per segmento
+            groups = {}
+            for name in sorted({segment_name(t) for t in records["t"]}):
+                start = segment_start(name)
+                mask = (records["t"] >= start) & (records["t"] < start + 3600)
+                groups[name] = records[mask]
+
+        rotated = False
+        for name, chunk in groups.items():
+            path = self.directory / name
+            new_segment = not path.exists()
+            with open(path, "ab") as f:
+                if new_segment:
+                    f.write(HEADER)
+                    rotated = True
+                f.write(chunk.tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+
+        if rotated:
+            self._enforce_retention()
+
+    def _enforce_retention(self):
+        """Elimina i segmenti oltre l'età o la dimensione massima (dal più vecchio)"""
+        segments = sorted(self.directory.glob(f"{SEGMENT_PREFIX}*{SEGMENT_SUFFIX}"))
+        cutoff = time.time() - RETENTION_DAYS * 86400
+        sizes = {path: path.stat().st_size for path in segments}
+        total = sum(sizes.values())
+
+        # L'ultimo segmento è quello in scrittura: non viene mai eliminato
+        for path in segments[:-1]:
+            if segment_start(path.name) + 3600 < cutoff or total > RETENTION_MAX_BYTES:
+                total -= sizes[path]
+                path.unlink(missing_ok=True)
+                print(f"🗑️  Segmento telemetria eliminato: {path.name}")
+
+    # ==================== LETTURA ====================
+
+    def _load_catalog(self):
+        catalog_path = self.directory / "metrics.json"
+        if not catalog_path.exists():
+            return
+        stored = json.loads(catalog_path.read_text())
+        for metric, metric_id in stored.items():
+            self.metric_ids.setdefault(metric, metric_id)
+
+    def segments(self, start: float, end: float) -> List[Path]:
+        """Segmenti che coprono [start, end)"""
+        if not self.directory.exists():
+            return []
+        return [
+            path for path in sorted(self.directory.glob(f"{SEGMENT_PREFIX}*{SEGMENT_SUFFIX}"))
+            if segment_start(path.name) < end and segment_start(path.name) + 3600 > start
+        ]
+
+    def read(self, metric: str, start: float, end: float) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Campioni di una metrica nell'intervallo [start, end) (bloccante: usare in un thread)
+
+        Args:
+            metric: Nome metrica
+            start: Epoch inizio
+            end: Epoch fine
+
+        Returns:
+            tuple: (timestamp, valori) ordinati
+        """
+        metric_id = self.metric_ids.get(metric)
+        if metric_id is None:
+            return np.empty(0), np.empty(0, dtype=np.float32)
+
+        times, values = [], []
+        for path in self.segments(start, end):
+            size = path.stat().st_size
+            count = (size - HEADER_SIZE) // RECORD_DTYPE.itemsize
+            if count <= 0:
+                continue
+
+            with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                records = np.frombuffer(mm, dtype=RECORD_DTYPE, count=count, offset=HEADER_SIZE)
+                mask = (records["metric"] == metric_id) & (records["t"] >= start) & (records["t"] < end)
+                # Copia prima di chiudere la mappatura
+                times.append(records["t"][mask].copy())
+                values.append(records["value"][mask].copy())
+                del records
+
+        # Record non ancora scaricati
+        pending = [(t, v) for t, m, _, v in list(self.pending) if m == metric_id and start <= t < end]
+        if pending:
+            times.append(np.array([t for t, _ in pending]))
+            values.append(np.array([v for _, v in pending], dtype=np.float32))
+
+        if not times:
+            return np.empty(0), np.empty(0, dtype=np.float32)
+        return np.concatenate(times), np.concatenate(values)
+
+    def restore(self, history, hours: float) -> int:
+        """
+        Ricarica nello storico in memoria le ultime ore di log (bloccante)
+
+        Args:
+            history: TelemetryHistory da ripopolare
+            hours: Ore da ricaricare
+
+        Returns:
+            int: Campioni ripristinati
+        """
+        end = time.time()
+        start = end - hours * 3600
+        restored = 0
+        for metric, buffer in history.buffers.items():
+            times, values = self.read(metric, start, end)
+            if len(times):
+                buffer.extend(times, values)
+                restored += len(times)
+        return restored
+
+    # ==================== LIFECYCLE ====================
+
+    async def start(self, history=None, hours: float = 24):
+        """
+        Carica il catalogo, ripristina lo storico e avvia il flush periodico
+
+        Args:
+            history: TelemetryHistory da ripopolare (opzionale)
+            hours: Ore di storico da ripristinare
+        """
+        await asyncio.to_thread(self._load_catalog)
+
+        if history is not None:
+            restored = await asyncio.to_thread(self.restore, history, hours)
+            if restored:
+                print(f"✓ Storico telemetria ripristinato ({restored} campioni)")
+
+        task_supervisor.spawn("telemetry_flush", self._flush_loop)
+        print(f"✓ Log telemetria in {self.directory}")
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(FLUSH_INTERVAL)
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"❌ Errore scrittura log telemetria: {e}")
+
+    async def stop(self):
+        """Ferma il flush periodico e scarica gli ultimi record"""
+        await task_supervisor.cancel("telemetry_flush")
+        await task_supervisor.cancel("telemetry_flush_now")
+        await self.flush()
+
+    def stats(self) -> Dict[str, float]:
+        """Contatori di scrittura"""
+        return {
+            "pending": len(self.pending),
+            "records_written": self.records_written,
+            "flushes": self.flushes,
+            "last_flush_seconds": self.last_flush_seconds,
+        }
+
+
+# Log condiviso da simulazione/sensori e servizio batteria
+telemetry_log = TelemetryLog()
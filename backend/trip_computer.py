@@ -0,0 +1,256 @@
+"""
+Computer di bordo: contachilometri parziali incrementali
+Ad ogni tick di telemetria integra velocità e consumo carburante su tutti i
+parziali attivi (O(1) per campione, nessuna rilettura dello storico):
+- A e B: azzerabili dall'utente
+- refuel: azzerato automaticamente a ogni rifornimento
+- startup: dall'avvio del sistema (non persistito)
+
+Il contachilometri totale (total_km) e i parziali A/B/refuel sono salvati
+su disco periodicamente e ricaricati all'avvio.
+"""
+
+import asyncio
+import json
+import os
+import time
+from pathlib import Path
+from typing import Dict, Optional
+
+from task_supervisor import task_supervisor
+from vehicle_state import CamperState, camper
+
+# Configurazione (sovrascrivibile da ambiente)
+TRIP_FILE = os.getenv("TRIP_FILE", str(Path(__file__).parent / "data" / "trips.json"))
+FUEL_TANK_LITERS = float(os.getenv("FUEL_TANK_LITERS", "90"))
+TRIP_SAVE_INTERVAL = 30.0
+
+TRIP_IDS = ("A", "B", "refuel", "startup")
+RESETTABLE_TRIPS = ("A", "B")
+
+# Sotto questa velocità (km/h) il mezzo è considerato fermo
+MOVING_SPEED = 1.0
+
+# Aumento del livello carburante (%) sul minimo registrato interpretato come rifornimento
+REFUEL_THRESHOLD = 2.0
+
+# Tick più distanti di così (es. dopo una pausa del loop) non vengono integrati
+MAX_GAP = 5.0
+
+
+class TripAccumulator:
+    """Aggregati incrementali di un parziale"""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.started_at = time.time()
+        self.distance_km = 0.0
+        self.moving_seconds = 0.0
+        self.driving_seconds = 0.0
+        self.fuel_used_l = 0.0
+        self.max_speed = 0.0
+
+    def add(self, distance_km: float, dt: float, moving: bool, fuel_used_l: float, speed: float):
+        """Aggiunge un intervallo di guida (O(1))"""
+        self.distance_km += distance_km
+        self.driving_seconds += dt
+        if moving:
+            self.moving_seconds += dt
+        self.fuel_used_l += fuel_used_l
+        if speed > self.max_speed:
+            self.max_speed = speed
+
+    def summary(self) -> Dict[str, float]:
+        """Valori pubblicati (arrotondati per non generare versioni inutili)"""
+        average = self.distance_km / (self.moving_seconds / 3600) if self.moving_seconds >= 1 else 0.0
+        consumption = self.fuel_used_l / self.distance_km * 100 if self.distance_km >= 1 else None
+        return {
+            "distance_km": round(self.distance_km, 1),
+            "moving_time": int(self.moving_seconds),
+            "driving_time": int(self.driving_seconds),
+            "average_speed": round(average, 1),
+            "max_speed": round(self.max_speed, 1),
+            "fuel_used_l": round(self.fuel_used_l, 1),
+            "consumption_l_100km": round(consumption, 1) if consumption is not None else None,
+            "started_at": self.started_at,
+        }
+
+    def to_dict(self) -> Dict[str, float]:
+        return {
+            "started_at": self.started_at,
+            "distance_km": self.distance_km,
+            "moving_seconds": self.moving_seconds,
+            "driving_seconds": self.driving_seconds,
+            "fuel_used_l": self.fuel_used_l,
+            "max_speed": self.max_speed,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, float]) -> "TripAccumulator":
+        trip = cls()
+        for key, value in data.items():
+            if hasattr(trip, key):
+                setattr(trip, key, float(value))
+        return trip
+
+
+class TripComputer:
+    """Parziali, contachilometri e pubblicazione su CamperState"""
+
+    def __init__(self, state: CamperState, path: str = TRIP_FILE):
+        self.state = state
+        self.path = Path(path)
+        self.trips: Dict[str, TripAccumulator] = {trip_id: TripAccumulator() for trip_id in TRIP_IDS}
+
+        self.last_time: Optional[float] = None
+        self.last_speed = 0.0
+        # Livello più basso visto dall'ultimo rifornimento: il consumo è solo la discesa
+        # sotto questo minimo, così il rumore del sensore (oscillazioni su e giù) non si somma
+        self.fuel_low: Optional[float] = None
+        self.refueling = False
+        self.odometer = float(state.total_km)
+        self.refuels = 0
+
+        self.persist = False
+        self.dirty = False
+
+    # ==================== INTEGRAZIONE ====================
+
+    def update(self, timestamp: Optional[float] = None):
+        """
+        Integra l'ultimo intervallo di telemetria su tutti i parziali
+
+        Args:
+            timestamp: Epoch del campione (default: adesso)
+        """
+        state = self.state
+        now = time.time() if timestamp is None else timestamp
+        speed = float(state.speed)
+        fuel = float(state.fuel_level)
+
+        fuel_used = 0.0
+        if self.fuel_low is None:
+            self.fuel_low = fuel
+        elif fuel < self.fuel_low:
+            fuel_used = (self.fuel_low - fuel) * FUEL_TANK_LITERS / 100
+            self.fuel_low = fuel
+            self.refueling = False
+        elif fuel - self.fuel_low >= REFUEL_THRESHOLD or (self.refueling and fuel > self.fuel_low):
+            # Rifornimento (anche graduale, un tick alla volta): contato una sola volta,
+            # il minimo segue il livello finché sale
+            if not self.refueling:
+                self.trips["refuel"].reset()
+                self.refuels += 1
+                self.dirty = True
+            self.refueling = True
+            self.fuel_low = fuel
+
+        dt = now - self.last_time if self.last_time is not None else 0.0
+        if 0 < dt <= MAX_GAP and state.engine_running:
+            # Integrazione trapezoidale della velocità (km/h -> km)
+            distance = (self.last_speed + speed) / 2 * dt / 3600
+            moving = speed >= MOVING_SPEED
+            for trip in self.trips.values():
+                trip.add(distance, dt, moving, fuel_used, speed)
+            self.odometer += distance
+            self.dirty = True
+        elif fuel_used:
+            for trip in self.trips.values():
+                trip.fuel_used_l += fuel_used
+            self.dirty = True
+
+        self.last_time = now
+        self.last_speed = speed
+        self.publish()
+
+    def publish(self):
+        """Aggiorna i campi trip di CamperState (le bande morte filtrano il rumore)"""
+        state = self.state
+        state.total_km = self.odometer
+        state.trip_km = round(self.trips["A"].distance_km, 1)
+        state.trips = self.summary()
+
+    def reset(self, trip_id: str):
+        """Azzera un parziale"""
+        self.trips[trip_id].reset()
+        self.dirty = True
+        self.publish()
+
+    def summary(self) -> Dict[str, Dict]:
+        return {trip_id: trip.summary() for trip_id, trip in self.trips.items()}
+
+    # ==================== PERSISTENZA ====================
+
+    def load(self):
+        """Ricarica contachilometri e parziali (bloccante)"""
+        if not self.path.exists():
+            return
+        try:
+            data = json.loads(self.path.read_text())
+        except (OSError, ValueError) as e:
+            print(f"❌ File parziali non leggibile ({e}), riparto da zero")
+            return
+
+        self.odometer = max(self.odometer, float(data.get("total_km", 0)))
+        self.refuels = int(data.get("refuels", 0))
+        for trip_id, trip in data.get("trips", {}).items():
+            if trip_id in self.trips and trip_id != "startup":
+                self.trips[trip_id] = TripAccumulator.from_dict(trip)
+
+    def _write(self, data: Dict):
+        """Scrittura atomica (bloccante, eseguita in un thread)"""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(data))
+        os.replace(tmp, self.path)
+
+    async def save(self):
+        """Salva su disco se ci sono modifiche"""
+        if not self.persist or not self.dirty:
+            return
+        self.dirty = False
+        data = {
+            "total_km": self.odometer,
+            "refuels": self.refuels,
+            "trips": {
+                trip_id: trip.to_dict()
+                for trip_id, trip in self.trips.items()
+                if trip_id != "startup"
+            },
+        }
+        await asyncio.to_thread(self._write, data)
+
+    # ==================== LIFECYCLE ====================
+
+    async def start(self, persist: bool = True):
+        """
+        Carica lo stato salvato e avvia il salvataggio periodico
+
+        Args:
+            persist: False per non toccare il file (es. durante un replay)
+        """
+        self.persist = persist
+        if persist:
+            await asyncio.to_thread(self.load)
+            task_supervisor.spawn("trip_save", self._save_loop)
+        self.publish()
+        print(f"✓ Computer di bordo: {self.odometer:.0f} km totali")
+
+    async def _save_loop(self):
+        while True:
+            await asyncio.sleep(TRIP_SAVE_INTERVAL)
+            try:
+                await self.save()
+            except Exception as e:
+                print(f"❌ Errore salvataggio parziali: {e}")
+
+    async def stop(self):
+        """Ferma il salvataggio periodico e salva l'ultimo stato"""
+        await task_supervisor.cancel("trip_save")
+        await self.save()
+
+
+# Computer di bordo condiviso (alimentato da simulazione, replay o sensori)
+trip_computer = TripComputer(camper)
@@ -0,0 +1,51 @@
+"""
+API Routes per il computer di bordo
+Parziali A/B, dal rifornimento e dall'avvio
+"""
+
+from fastapi import APIRouter, HTTPException
+
+from shared_state import shared_state
+from trip_computer import RESETTABLE_TRIPS, trip_computer
+
+router = APIRouter(prefix="/api/trips", tags=["trips"])
+
+
+@router.get("")
+async def get_trips():
+    """Contachilometri totale e riepilogo di tutti i parziali"""
+    if shared_state.is_follower:
+        return await shared_state.call("trips")
+
+    return {
+        "total_km": round(trip_computer.odometer, 1),
+        "refuels": trip_computer.refuels,
+        "trips": trip_computer.summary()
+    }
+
+
+@router.post("/{trip_id}/reset")
+async def reset_trip(trip_id: str):
+    """
+    Azzera un parziale
+
+    Args:
+        trip_id: "A" o "B" (refuel e startup si azzerano da soli)
+    """
+    if shared_state.is_follower:
+        return await shared_state.call("trip_reset", trip_id=trip_id)
+
+    if trip_id not in trip_computer.trips:
+        raise HTTPException(status_code=404, detail=f"Parziale sconosciuto: {trip_id}")
+
+    if trip_id not in RESETTABLE_TRIPS:
+        raise HTTPException(status_code=400, detail=f"Il parziale {trip_id} non è azzerabile")
+
+    trip_computer.reset(trip_id)
+    await trip_computer.save()
+    return {"success": True, "trip": trip_computer.trips[trip_id].summary()}
+
+
+# Parziali e contachilometri vivono solo nell'owner (SHARED_STATE)
+shared_state.register("trips", get_trips)
+shared_state.register("trip_reset", reset_trip)
@@ -0,0 +1,129 @@
+"""
+Formato binario compatto per i gauge del cruscotto (subprotocol WebSocket)
+
+Il client lo richiede in fase di connessione:
+    new WebSocket("ws://host:8000/ws", ["camper.gauges.v1"])
+Se il server accetta il subprotocol riceve solo frame binari a 30 Hz,
+altrimenti resta sul protocollo JSON (keyframe/delta).
+
+Layout (little-endian, 36 byte):
+
+    offset  tipo    campo
+    0       uint8   schema_version (= 3)
+    1       uint8   flags          bit0 engine_running
+    2       uint8   lights         bit0 headlights, bit1 position, bit2 interior, bit3 awning
+    3       uint8   doors          bit0 driver, bit1 passenger, bit2 sliding, bit3 rear
+    4       uint32  seq            numero di sequenza del frame (wrap a 2^32)
+    8       uint32  timestamp_ms   clock monotono del server in ms (wrap a 2^32)
+    12      float32 speed          km/h
+    16      uint16  rpm
+    18      uint16  fuel_level     centesimi di %
+    20      uint16  water_tank     centesimi di %
+    22      uint16  grey_water     centesimi di %
+    24      uint16  black_water    centesimi di %
+    26      uint16  battery_main   mV
+    28      uint32  total_km       decimi di km (contachilometri)
+    32      uint32  trip_km        decimi di km (parziale A)
+
+Un client che riceve uno schema_version diverso ignora il frame.
+"""
+
+import struct
+import time
+from typing import Any, Dict
+
+from vehicle_state import CamperState
+
+BINARY_SUBPROTOCOL = "camper.gauges.v1"
+SCHEMA_VERSION = 3
+
+GAUGE_FRAME = struct.Struct("<BBBBIIfHHHHHHII")
+
+LIGHT_BITS = ("headlights", "position", "interior", "awning")
+DOOR_BITS = ("driver", "passenger", "sliding", "rear")
+
+FLAG_ENGINE_RUNNING = 0x01
+
+
+def _bitfield(values: Dict[str, bool], order) -> int:
+    bits = 0
+    for index, name in enumerate(order):
+        if values.get(name):
+            bits |= 1 << index
+    return bits
+
+
+def _u16(value: float) -> int:
+    return max(0, min(0xFFFF, int(round(value))))
+
+
+def _u32(value: float) -> int:
+    return max(0, min(0xFFFFFFFF, int(round(value))))
+
+
+def encode_gauge_frame(state: CamperState, seq: int) -> bytes:
+    """
+    Impacchetta lo stato corrente in un frame binario
+
+    Args:
+        state: Stato veicolo
+        seq: Numero di sequenza del frame
+
+    Returns:
+        bytes: Frame di GAUGE_FRAME.size byte
+    """
+    flags = FLAG_ENGINE_RUNNING if state.engine_running else 0
+
+    return GAUGE_FRAME.pack(
+        SCHEMA_VERSION,
+        flags,
+        _bitfield(state.lights, LIGHT_BITS),
+        _bitfield(state.doors, DOOR_BITS),
+        seq & 0xFFFFFFFF,
+        int(time.monotonic() * 1000) & 0xFFFFFFFF,
+        state.speed,
+        _u16(state.rpm),
+        _u16(state.fuel_level * 100),
+        _u16(state.water_tank * 100),
+        _u16(state.grey_water * 100),
+        _u16(state.black_water * 100),
+        _u16(state.battery_main * 1000),
+        _u32(state.total_km * 10),
+        _u32(state.trip_km * 10),
+    )
+
+
+def decode_gauge_frame(data: bytes) -> Dict[str, Any]:
+    """
+    Decodifica un frame binario (debug e benchmark)
+
+    Args:
+        data: Frame ricevuto
+
+    Returns:
+        dict: Campi del frame in unità naturali
+    """
+    (
+        version, flags, lights, doors, seq, timestamp_ms,
+        speed, rpm, fuel, water, grey, black, battery_mv, total_dkm, trip_dkm
+    ) = GAUGE_FRAME.unpack(data)
+
+    if version != SCHEMA_VERSION:
+        raise ValueError(f"Schema frame non supportato: {version}")
+
+    return {
+        "seq": seq,
+        "timestamp_ms": timestamp_ms,
+        "engine_running": bool(flags & FLAG_ENGINE_RUNNING),
+        "lights": {name: bool(lights & (1 << i)) for i, name in enumerate(LIGHT_BITS)},
+        "doors": {name: bool(doors & (1 << i)) for i, name in enumerate(DOOR_BITS)},
+        "speed": speed,
+        "rpm": rpm,
+        "fuel_level": fuel / 100,
+        "water_tank": water / 100,
+        "grey_water": grey / 100,
+        "black_water": black / 100,
+        "battery_main": battery_mv / 1000,
+        "total_km": total_dkm / 10,
+        "trip_km": trip_dkm / 10,
+    }
@@ -0,0 +1,211 @@
+"""
+Stato del veicolo versionato
+Ogni modifica significativa incrementa un contatore di versione globale e
+registra la versione del campo modificato, così da poter calcolare i delta
+da inviare ai client WebSocket.
+"""
+
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+# Campi pubblicati verso i client (ordine = ordine nei keyframe)
+STATE_FIELDS = (
+    "speed",
+    "rpm",
+    "fuel_level",
+    "water_tank",
+    "grey_water",
+    "black_water",
+    "battery_main",
+    "battery_service",
+    "temperature_inside",
+    "temperature_outside",
+    "lights",
+    "doors",
+    "engine_running",
+    "total_km",
+    "trip_km",
+    "trips",
+    "forecast",
+    "alerts",
+)
+
+# Topic a cui i client possono abbonarsi, con i campi che comprendono
+TOPICS = {
+    "drive": ("speed", "rpm", "engine_running", "total_km"),
+    "tanks": ("fuel_level", "water_tank", "grey_water", "black_water"),
+    "power": ("battery_main", "battery_service"),
+    "climate": ("temperature_inside", "temperature_outside"),
+    "lights": ("lights",),
+    "doors": ("doors",),
+    "trip": ("trip_km", "trips"),
+    "forecast": ("forecast",),
+    "alerts": ("alerts",),
+}
+
+# Banda morta per campo: una variazione più piccola non genera una nuova
+# versione (il valore grezzo viene comunque aggiornato). Evita che il rumore
+# dei sensori sui serbatoi faccia ripartire tutti i campi ad ogni tick.
+FIELD_RESOLUTION = {
+    "speed": 0.1,
+    "fuel_level": 0.1,
+    "water_tank": 0.1,
+    "grey_water": 0.1,
+    "black_water": 0.1,
+    "battery_main": 0.01,
+    "battery_service": 0.01,
+    "temperature_inside": 0.1,
+    "temperature_outside": 0.1,
+    "total_km": 0.1,
+}
+
+
+class CamperState:
+    """Stato globale del camper (mock per sviluppo) con versionamento per campo"""
+
+    def __init__(self):
+        object.__setattr__(self, "version", 0)
+        object.__setattr__(self, "updated_at", datetime.now())
+        object.__setattr__(self, "_field_versions", {})
+        object.__setattr__(self, "_published", {})
+
+        self.speed = 0.0
+        self.rpm = 0
+        self.fuel_level = 75.0
+        self.water_tank = 80.0
+        self.grey_water = 20.0
+        self.black_water = 15.0
+        self.battery_main = 12.6
+        self.battery_service = 13.2
+        self.temperature_inside = 22.0
+        self.temperature_outside = 18.0
+        self.lights = {
+            "headlights": False,
+            "position": False,
+            "interior": False,
+            "awning": False
+        }
+        self.doors = {
+            "driver": False,
+            "passenger": False,
+            "sliding": False,
+            "rear": False
+        }
+        self.engine_running = False
+        self.total_km = 45328.0
+        # Parziale A e riepilogo dei parziali (aggiornati dal computer di bordo)
+        self.trip_km = 0.0
+        self.trips = {}
+        # Ore a vuoto/pieno dei serbatoi (aggiornate dal forecaster)
+        self.forecast = {}
+        # Allarmi attivi (pubblicati dal motore di allarmi)
+        self.alerts = {}
+
+    def __setattr__(self, name: str, value: Any):
+        object.__setattr__(self, name, value)
+        if name not in FIELD_RESOLUTION and name not in STATE_FIELDS:
+            return
+
+        published = self._published.get(name, _MISSING)
+        resolution = FIELD_RESOLUTION.get(name)
+        if published is not _MISSING:
+            if resolution is not None:
+                if abs(value - published) < resolution:
+                    return
+            elif value == published:
+                return
+
+        self._published[name] = value
+        self.mark_changed(name)
+
+    # ==================== MUTAZIONI ====================
+
+    def mark_changed(self, field: str):
+        """Registra una modifica del campo (usato anche per i dict modificati in place)"""
+        object.__setattr__(self, "version", self.version + 1)
+        object.__setattr__(self, "updated_at", datetime.now())
+        self._field_versions[field] = self.version
+
+    def set_light(self, light_id: str, state: bool) -> bool:
+        """Imposta una luce, ritorna False se la luce non esiste"""
+        if light_id not in self.lights:
+            return False
+        if self.lights[light_id] != state:
+            self.lights[light_id] = state
+            self.mark_changed("lights")
+        return True
+
+    def set_door(self, door_id: str, is_open: bool) -> bool:
+        """Imposta lo stato di una porta, ritorna False se la porta non esiste"""
+        if door_id not in self.doors:
+            return False
+        if self.doors[door_id] != is_open:
+            self.doors[door_id] = is_open
+            self.mark_changed("doors")
+        return True
+
+    def set_engine(self, running: bool):
+        """Accende/spegne il motore (a motore spento velocità e giri a zero)"""
+        self.engine_running = running
+        if not running:
+            self.speed = 0
+            self.rpm = 0
+
+    # ==================== LETTURA ====================
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Stato completo (keyframe) con timestamp dell'ultima modifica"""
+        data = {field: _copy_value(getattr(self, field)) for field in STATE_FIELDS}
+        data["timestamp"] = self.updated_at.isoformat()
+        return data
+
+    def topic_version(self, topic: str) -> int:
+        """Versione dell'ultima modifica a uno dei campi del topic"""
+        field_versions = self._field_versions
+        return max(field_versions.get(field, 0) for field in TOPICS[topic])
+
+    def topic_snapshot(self, topic: str) -> Dict[str, Any]:
+        """Valori correnti dei campi di un topic"""
+        return {field: _copy_value(getattr(self, field)) for field in TOPICS[topic]}
+
+    def topic_changes_since(self, topic: str, version: Optional[int]) -> Dict[str, Any]:
+        """Campi del topic modificati dopo la versione indicata (None = tutti)"""
+        if version is None:
+            return self.topic_snapshot(topic)
+
+        field_versions = self._field_versions
+        return {
+            field: _copy_value(getattr(self, field))
+            for field in TOPICS[topic]
+            if field_versions.get(field, 0) > version
+        }
+
+    def changes_since(self, version: Optional[int]) -> Dict[str, Any]:
+        """
+        Campi modificati dopo la versione indicata
+
+        Args:
+            version: Ultima versione nota al client (None = tutto)
+
+        Returns:
+            dict: Solo i campi con versione successiva
+        """
+        if version is None:
+            return {field: _copy_value(getattr(self, field)) for field in STATE_FIELDS}
+
+        return {
+            field: _copy_value(getattr(self, field))
+            for field, field_version in self._field_versions.items()
+            if field_version > version
+        }
+
+
+_MISSING = object()
+
+
+def _copy_value(value: Any) -> Any:
+    """Copia i dict annidati (luci/porte) per non esporre lo stato interno"""
+    return dict(value) if isinstance(value, dict) else value
+
+
+camper = CamperState()
@@ -0,0 +1,368 @@
+"""
+Protocollo delta per il WebSocket veicolo (/ws)
+
+Messaggi server -> client:
+- {"type": "keyframe", "version": N, "topics": [...], ...campi dei topic, "timestamp": ...}
+- {"type": "delta", "version": N, "base_version": B, "topics": [...], ...solo i campi cambiati, "timestamp": ...}
+
+"timestamp" è l'istante dell'ultima modifica dello stato: permette ai client
+di misurare la latenza end-to-end dei frame.
+
+Messaggi client -> server:
+- {"type": "subscribe", "topics": {"drive": 20, "tanks": 0.2}}
+      topic e frequenza massima in Hz (anche lista di nomi = frequenza di default)
+- {"type": "ack", "version": N}   conferma esplicita dell'ultima versione applicata
+- {"type": "resync"}              richiede un keyframe completo
+
+Senza subscribe il client riceve tutti i topic a 2 Hz, come in origine.
+Finché il client non invia ack, ogni invio riuscito vale come conferma
+implicita (il WebSocket è ordinato e affidabile). Dal primo ack in poi i
+delta vengono calcolati rispetto all'ultima versione confermata.
+"""
+
+import asyncio
+import json
+import time
+from typing import Any, Dict, Optional, Set, Tuple
+
+from broadcast_hub import HubConnection, encode_json
+from metrics import broadcast_seconds
+from vehicle_state import TOPICS, CamperState
+
+# Intervallo massimo tra due keyframe per lo stesso client (secondi)
+KEYFRAME_INTERVAL = 10.0
+
+# Frequenze dei topic (Hz)
+DEFAULT_RATE = 2.0
+MIN_RATE = 0.01
+MAX_RATE = 30.0
+
+# Finestra di coalescenza dopo una notifica: le modifiche ravvicinate
+# (es. una scena che accende 4 luci) escono in un solo frame
+COALESCE_WINDOW = 0.02
+
+
+class VehicleStreamClient:
+    """Stato del protocollo delta e degli abbonamenti per una connessione /ws"""
+
+    def __init__(self, websocket):
+        self.websocket = websocket
+        self.topics: Dict[str, float] = {topic: 1 / DEFAULT_RATE for topic in TOPICS}
+        self.pending: Set[str] = set()
+        self.sent: Dict[str, int] = {}
+        self.acked: Dict[str, int] = {}
+        self.explicit_ack = False
+        self.keyframe_due = True
+        self.last_keyframe = 0.0
+
+    def handle_message(self, text: str) -> bool:
+        """
+        Gestisce un messaggio ricevuto dal client
+
+        Args:
+            text: Payload testuale ricevuto
+
+        Returns:
+            bool: True se il client va aggiornato subito (keyframe o nuovi abbonamenti)
+        """
+        try:
+            message = json.loads(text)
+        except ValueError:
+            return False
+
+        if not isinstance(message, dict):
+            return False
+
+        msg_type = message.get("type")
+
+        if msg_type == "resync":
+            self.request_keyframe()
+            return True
+
+        if msg_type == "subscribe":
+            topics = _parse_topics(message.get("topics"))
+            if not topics:
+                return False
+            self.topics = topics
+            self.request_keyframe()
+            return True
+
+        if msg_type == "ack":
+            version = message.get("version")
+            if not isinstance(version, int):
+                return False
+            # Non si può confermare una versione mai inviata
+            if not self.sent or version > max(self.sent.values()):
+                self.request_keyframe()
+                return True
+            self.explicit_ack = True
+            for topic, sent_version in self.sent.items():
+                if sent_version <= version:
+                    self.acked[topic] = sent_version
+
+        return False
+
+    def request_keyframe(self):
+        """Forza un keyframe completo al prossimo invio"""
+        self.keyframe_due = True
+        self.sent.clear()
+        self.acked.clear()
+
+    def render(self, state: CamperState, cache: "FrameCache") -> Optional[str]:
+        """
+        Prossimo frame già serializzato per i topic in attesa, segnato come inviato.
+        I client allineati alla stessa versione condividono lo stesso buffer.
+
+        Args:
+            state: Stato veicolo corrente
+            cache: Cache dei frame serializzati
+
+        Returns:
+            str | None: JSON del frame oppure None se non c'è nulla di nuovo
+        """
+        now = time.monotonic()
+
+        if self.keyframe_due or now - self.last_keyframe >= KEYFRAME_INTERVAL:
+            kind = "keyframe"
+            topics = tuple(sorted(self.topics))
+            bases = None
+            self.keyframe_due = False
+            self.last_keyframe = now
+        else:
+            kind = "delta"
+            topics = tuple(
+                topic for topic in sorted(self.pending)
+                if topic in self.topics and state.topic_version(topic) > self.sent.get(topic, -1)
+            )
+            if not topics:
+                self.pending.clear()
+                return None
+            bases = tuple(self._base(topic) for topic in topics)
+
+        self.pending.clear()
+        encoded = cache.get(state, kind, topics, bases)
+
+        for topic in topics:
+            self.sent[topic] = state.version
+            if kind == "keyframe" or not self.explicit_ack:
+                self.acked[topic] = state.version
+
+        return encoded
+
+    def _base(self, topic: str) -> Optional[int]:
+        if self.explicit_ack:
+            return self.acked.get(topic)
+        return self.sent.get(topic)
+
+
+class FrameCache:
+    """Frame serializzati una sola volta per la versione di stato corrente"""
+
+    def __init__(self):
+        self.version: Optional[int] = None
+        self.frames: Dict[Tuple, str] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, state: CamperState, kind: str, topics: Tuple[str, ...], bases: Optional[Tuple]) -> str:
+        """
+        Ritorna il frame serializzato, costruendolo solo al primo uso
+
+        Args:
+            state: Stato veicolo corrente
+            kind: "keyframe" o "delta"
+            topics: Topic inclusi nel frame
+            bases: Versione base di ciascun topic (solo delta)
+        """
+        if state.version != self.version:
+            self.frames.clear()
+            self.version = state.version
+
+        key = (kind, topics, bases)
+        encoded = self.frames.get(key)
+        if encoded is None:
+            self.misses += 1
+            encoded = encode_json(build_frame(state, kind, topics, bases))
+            self.frames[key] = encoded
+        else:
+            self.hits += 1
+        return encoded
+
+
+def build_frame(state: CamperState, kind: str, topics: Tuple[str, ...], bases: Optional[Tuple]) -> Dict[str, Any]:
+    """Costruisce il dict di un keyframe o di un delta"""
+    if kind == "keyframe":
+        frame = {"type": "keyframe", "version": state.version, "topics": list(topics)}
+        for topic in topics:
+            frame.update(state.topic_snapshot(topic))
+        frame["timestamp"] = state.updated_at.isoformat()
+        return frame
+
+    known = [base for base in bases if base is not None]
+    frame = {
+        "type": "delta",
+        "version": state.version,
+        "base_version": min(known) if known else None,
+        "topics": list(topics)
+    }
+    for topic, base in zip(topics, bases):
+        frame.update(state.topic_changes_since(topic, base))
+    frame["timestamp"] = state.updated_at.isoformat()
+    return frame
+
+
+def _parse_topics(raw: Any) -> Dict[str, float]:
+    """Converte la richiesta di subscribe in {topic: intervallo in secondi}"""
+    if isinstance(raw, list):
+        raw = {topic: DEFAULT_RATE for topic in raw if isinstance(topic, str)}
+    if not isinstance(raw, dict):
+        return {}
+
+    topics = {}
+    for topic, rate in raw.items():
+        if topic not in TOPICS:
+            continue
+        if isinstance(rate, bool) or not isinstance(rate, (int, float)) or rate <= 0:
+            rate = DEFAULT_RATE
+        topics[topic] = 1 / max(MIN_RATE, min(MAX_RATE, float(rate)))
+    return topics
+
+
+# ============================================
+# SCHEDULER PER TOPIC
+# ============================================
+
+class TopicGroup:
+    """Client abbonati allo stesso topic con lo stesso intervallo"""
+
+    def __init__(self, topic: str, interval: float):
+        self.topic = topic
+        self.interval = interval
+        self.connections: Set[HubConnection] = set()
+        self.next_due = 0.0
+        self.sampled_version = -1
+
+
+class TopicScheduler:
+    """
+    Campiona lo stato per gruppi (topic, frequenza): ogni gruppo viene letto
+    una sola volta alla sua scadenza, indipendentemente dal numero di client,
+    e i client ricevono solo i topic scaduti ed effettivamente cambiati.
+    """
+
+    def __init__(self, state: CamperState, render, coalesce: float = COALESCE_WINDOW):
+        self.state = state
+        self.render = render
+        self.coalesce = coalesce
+        self.groups: Dict[Tuple[str, float], TopicGroup] = {}
+        self.memberships: Dict[HubConnection, Tuple[Tuple[str, float], ...]] = {}
+        self.wakeup = asyncio.Event()
+        self.samples = 0
+        self.notifications = 0
+        self.flushes = 0
+        self.tick_seconds = broadcast_seconds.labels("veicolo")
+
+    def subscribe(self, connection: HubConnection):
+        """(Ri)calcola i gruppi di una connessione dai suoi abbonamenti"""
+        self.unsubscribe(connection)
+
+        keys = tuple(connection.context.topics.items())
+        for key in keys:
+            group = self.groups.get(key)
+            if group is None:
+                group = self.groups[key] = TopicGroup(*key)
+            group.connections.add(connection)
+        self.memberships[connection] = keys
+        self.notify()
+
+    def unsubscribe(self, connection: HubConnection):
+        """Rimuove la connessione dai suoi gruppi"""
+        for key in self.memberships.pop(connection, ()):
+            group = self.groups.get(key)
+            if group is None:
+                continue
+            group.connections.discard(connection)
+            if not group.connections:
+                del self.groups[key]
+
+    def notify(self, *topics: str):
+        """
+        Sveglia lo scheduler (nuovi abbonamenti o modifiche)
+
+        Args:
+            topics: Topic da inviare subito anche se non ancora scaduti
+                    (comandi dell'utente: il feedback non aspetta la frequenza del client)
+        """
+        self.notifications += 1
+        for group in self.groups.values():
+            if group.topic in topics:
+                group.next_due = 0.0
+        self.wakeup.set()
+
+    def stats(self):
+        """Gruppi attivi e campionamenti eseguiti"""
+        return {
+            "samples": self.samples,
+            "notifications": self.notifications,
+            "flushes": self.flushes,
+            "groups": [
+                {
+                    "topic": group.topic,
+                    "rate_hz": round(1 / group.interval, 3),
+                    "clients": len(group.connections)
+                }
+                for group in self.groups.values()
+            ]
+        }
+
+    def tick(self, now: float) -> Optional[float]:
+        """
+        Campiona i gruppi scaduti e accoda i frame per i client interessati
+
+        Args:
+            now: Istante corrente (clock del loop)
+
+        Returns:
+            float | None: Prossima scadenza, None se non ci sono gruppi
+        """
+        touched = set()
+        next_due = None
+
+        for group in self.groups.values():
+            if now >= group.next_due:
+                self.samples += 1
+                group.next_due = now + group.interval
+                version = self.state.topic_version(group.topic)
+                if version != group.sampled_version:
+                    group.sampled_version = version
+                    for connection in group.connections:
+                        connection.context.pending.add(group.topic)
+                        touched.add(connection)
+
+            if next_due is None or group.next_due < next_due:
+                next_due = group.next_due
+
+        for connection in touched:
+            connection.send(self.render, key="state")
+
+        return next_due
+
+    async def run(self):
+        """Loop dello scheduler (task in background)"""
+        loop = asyncio.get_running_loop()
+
+        while True:
+            self.wakeup.clear()
+            with self.tick_seconds.time():
+                next_due = self.tick(loop.time())
+            timeout = None if next_due is None else max(0.0, next_due - loop.time())
+
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                continue
+
+            # Notificato: raccoglie il resto della raffica prima di campionare
+            self.flushes += 1
+            if self.coalesce:
+                await asyncio.sleep(self.coalesce)
@@ -3,6 +3,7 @@ import { AlertTriangle, Fuel, Droplet, Battery, ThermometerSun, Car } from 'luci
 import Tachometer from './components/Tachometer/Tachometer';
 import Speedometer from './components/Speedometer/Speedometer';
 import { useMockAnimation } from './hooks/useMockAnimation';
+import { GAUGE_SUBPROTOCOL, decodeGaugeFrame } from './services/GaugeProtocol';
 
 /**
  * Configurazione modalità
@@ -41,26 +42,35 @@ const ClusterDashboard = () => {
       return;
     }
 
-    // Altrimenti usa WebSocket
-    const websocket = new WebSocket('ws://localhost:8000/ws');
+    // Altrimenti usa WebSocket (frame binari a 30 Hz, JSON se il server non li supporta)
+    const websocket = new WebSocket('ws://localhost:8000/ws', [GAUGE_SUBPROTOCOL]);
+    websocket.binaryType = 'arraybuffer';
     
     websocket.onopen = () => {
       console.log('[WebSocket] Connesso');
     };
     
     websocket.onmessage = (event) => {
-      const newData = JSON.parse(event.data);
-      setData(prev => ({
-        ...prev,
-        speed: newData.speed || 0,
-        rpm: newData.rpm || 0,
-        fuel_level: newData.fuel_level || 75,
-        battery_main: newData.battery_main || 12.6,
-        engine_running: newData.engine_running || false,
-        total_km: newData.total_km || 45328,
-        engine_temp: 90 + (newData.speed || 0) * 0.1,
-        warnings: newData.warnings || prev.warnings
-      }));
+      // Frame binario dei gauge, oppure keyframe/delta JSON
+      const newData = event.data instanceof ArrayBuffer
+        ? decodeGaugeFrame(event.data)
+        : JSON.parse(event.data);
+      if (!newData) return;
+      setData(prev => {
+        const speed = newData.speed ?? prev.speed;
+        return {
+          ...prev,
+          speed,
+          rpm: newData.rpm ?? prev.rpm,
+          fuel_level: newData.fuel_level ?? prev.fuel_level,
+          battery_main: newData.battery_main ?? prev.battery_main,
+          engine_running: newData.engine_running ?? prev.engine_running,
+          total_km: newData.total_km ?? prev.total_km,
+          trip_km: newData.trip_km ?? prev.trip_km,
+          engine_temp: 90 + speed * 0.1,
+          warnings: newData.warnings || prev.warnings
+        };
+      });
     };
     
     websocket.onerror = (error) => {
@@ -0,0 +1,56 @@
+/*
+ * Camper Infotainment System
+ * Copyright (C) 2025
+ *
+ * This program is free software: you can redistribute it and/or modify
+ * it under the terms of the GNU General Public License version 3.
+ *
+ * This program is distributed in the hope that it will be useful,
+ * but WITHOUT ANY WARRANTY; without even the implied warranty of
+ * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+ * GNU General Public License for more details.
+ */
+
+/**
+ * Decoder del subprotocol binario dei gauge (backend/vehicle_binary.py)
+ * Frame little-endian da 36 byte inviati a 30 Hz sul WebSocket /ws
+ */
+
+export const GAUGE_SUBPROTOCOL = 'camper.gauges.v1';
+const SCHEMA_VERSION = 3;
+const FRAME_SIZE = 36;
+
+const LIGHT_BITS = ['headlights', 'position', 'interior', 'awning'];
+const DOOR_BITS = ['driver', 'passenger', 'sliding', 'rear'];
+
+const decodeBits = (bits, names) =>
+  names.reduce((acc, name, i) => ({ ...acc, [name]: Boolean(bits & (1 << i)) }), {});
+
+/**
+ * Decodifica un frame binario
+ * @param {ArrayBuffer} buffer - Payload ricevuto (binaryType = 'arraybuffer')
+ * @returns {object|null} Dati veicolo, null se lo schema non è supportato
+ */
+export const decodeGaugeFrame = (buffer) => {
+  if (buffer.byteLength < FRAME_SIZE) return null;
+
+  const view = new DataView(buffer);
+  if (view.getUint8(0) !== SCHEMA_VERSION) return null;
+
+  return {
+    engine_running: Boolean(view.getUint8(1) & 0x01),
+    lights: decodeBits(view.getUint8(2), LIGHT_BITS),
+    doors: decodeBits(view.getUint8(3), DOOR_BITS),
+    seq: view.getUint32(4, true),
+    timestamp_ms: view.getUint32(8, true),
+    speed: view.getFloat32(12, true),
+    rpm: view.getUint16(16, true),
+    fuel_level: view.getUint16(18, true) / 100,
+    water_tank: view.getUint16(20, true) / 100,
+    grey_water: view.getUint16(22, true) / 100,
+    black_water: view.getUint16(24, true) / 100,
+    battery_main: view.getUint16(26, true) / 1000,
+    total_km: view.getUint32(28, true) / 10,
+    trip_km: view.getUint32(32, true) / 10
+  };
+};